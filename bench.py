@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+
+import gc
+import sys
+import json
+import time
+import bisect
+import datetime
+import platform
+import argparse
+from urllib.parse import quote_plus
+from xml.sax.saxutils import escape
+import subprocess
+import tracemalloc
+
+from s3misc.units import foursigfloat, bucket_units
+from s3misc.PageRenderer import PageRenderer
+from s3misc.OutputSinks import TextSink
+from s3misc.DirectoryStack import DirectoryStack
+from s3misc.BucketPrinter import BucketPrinter
+from s3misc.Snapshot import PrefixEnd
+from s3misc.RequestScheduler import ScheduledClient
+from s3misc.ListParser import ParseListing, ParseCache
+
+# Key layouts KeySet can generate.
+shapes = ['flat', 'deep', 'wide', 'dated']
+
+# What can be measured, each on its own. See the Bench* functions.
+stages = ['list', 'ListParser', 'ParseBucket', 'KeyMatch', 'DirectoryStack', 'PrintItems',
+          'WrapUpDirectory', 'PageRenderer', 'RenderPerObject']
+
+# A wildcard match per shape for KeyMatch, matching some keys but not most.
+shape_matches = {
+    'flat': 'flat/*7.dat',
+    'deep': 'deep/**/d3/f0?',
+    'wide': 'wide/*/part-[37]',
+    'dated': 'dated/year=*/month=0[1-6]/**/part-*5.parquet'
+}
+
+# Format version of saved results.
+results_version = 1
+
+epoch = datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+
+class KeySet:
+    """ A sorted, synthetic bucket of `count` keys, none of them stored.
+
+        Key i is computed from i, and keys are in lexical order by i, so KeySet is a
+        sorted sequence: bisect finds a prefix or a StartAfter key in O(log n), and
+        tens of millions of keys cost no memory.
+
+        flat:  flat/000000000.dat                        one directory
+        deep:  deep/t00000/d0/d3/d1/d2/d0/d1/f07         6 levels of 4, 16 per leaf
+        wide:  wide/00000000/part-7                      10 per directory
+        dated: dated/year=2015/month=01/day=01/hour=00/part-00042.parquet  100 per hour
+    """
+
+    def __init__(self, shape: str, count: int):
+        if (shape not in shapes):
+            raise ValueError("Unknown key shape: {}".format(shape))
+        self.shape = shape
+        self._count = count
+        self._key = getattr(self, 'Key' + shape.capitalize())
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, idx: int) -> str:
+        if (idx < 0 or idx >= self._count):
+            raise IndexError(idx)
+        return self._key(idx)
+
+    def __iter__(self):
+        return map(self._key, range(self._count))
+
+    def KeyFlat(self, idx: int) -> str:
+        return 'flat/{:09d}.dat'.format(idx)
+
+    def KeyDeep(self, idx: int) -> str:
+        leaf = idx >> 4
+        digits = []
+        for level in range(6):
+            digits.append('d' + str(leaf & 3))
+            leaf = leaf >> 2
+        digits.reverse()
+        return 'deep/t{:05d}/{}/f{:02d}'.format(leaf, '/'.join(digits), idx & 15)
+
+    def KeyWide(self, idx: int) -> str:
+        return 'wide/{:08d}/part-{}'.format(idx // 10, idx % 10)
+
+    def KeyDated(self, idx: int) -> str:
+        when = epoch + datetime.timedelta(hours=idx // 100)
+        return when.strftime('dated/year=%Y/month=%m/day=%d/hour=%H/') + \
+               'part-{:05d}.parquet'.format(idx % 100)
+
+    def Size(self, idx: int) -> int:
+        """ Spread over many orders of magnitude, and often repeated. """
+        mixed = (idx * 2654435761) & 0xffffffff
+        return mixed >> (mixed & 31)
+
+    def ModifiedTime(self, idx: int) -> int:
+        """ Seconds since the epoch. Objects are uploaded in bursts that share a second. """
+        if (self.shape == 'dated'):
+            return int(epoch.timestamp()) + (idx // 100) * 3600 + (idx % 100)
+        return int(epoch.timestamp()) + (idx // 50) * 7
+
+    def Item(self, idx: int) -> dict:
+        """ Object idx, as list_objects_v2 would describe it. """
+        return {
+                'Key': self._key(idx),
+                'Size': self.Size(idx),
+                'LastModified': datetime.datetime.fromtimestamp(self.ModifiedTime(idx),
+                                                                datetime.timezone.utc),
+                'StorageClass': 'STANDARD',
+                'ETag': '"{:032x}"'.format(idx)
+            }
+
+
+class FakeS3Client:
+    """ Enough of an S3 client to list a KeySet: list_objects_v2 with Prefix, Delimiter,
+        StartAfter, ContinuationToken and MaxKeys, and its paginator. Each request sleeps
+        for `latency` seconds, like a round trip would.
+    """
+
+    def __init__(self, keys: KeySet, latency: float = 0.0):
+        self._keys = keys
+        self._latency = latency
+        self.requests = 0
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = '', Delimiter: str = None,
+                        MaxKeys: int = 1000, StartAfter: str = None,
+                        ContinuationToken: str = None, **params) -> dict:
+        self.requests = self.requests + 1
+        if (self._latency > 0):
+            time.sleep(self._latency)
+
+        keys = self._keys
+        idx = bisect.bisect_left(keys, Prefix)
+        if (StartAfter is not None):
+            idx = max(idx, bisect.bisect_right(keys, StartAfter))
+        if (ContinuationToken is not None):
+            idx = max(idx, int(ContinuationToken))
+        end = PrefixEnd(Prefix)
+        end = len(keys) if (end is None) else bisect.bisect_left(keys, end)
+
+        contents = []
+        commonprefixes = []
+        while (idx < end and len(contents) + len(commonprefixes) < MaxKeys):
+            if (Delimiter):
+                key = keys[idx]
+                found = key.find(Delimiter, len(Prefix))
+                if (found >= 0):
+                    # Everything under this prefix is one entry.
+                    commonprefix = key[0:found + len(Delimiter)]
+                    commonprefixes.append({'Prefix': commonprefix})
+                    idx = bisect.bisect_left(keys, PrefixEnd(commonprefix), idx)
+                    continue
+            contents.append(keys.Item(idx))
+            idx = idx + 1
+
+        response = {
+                'IsTruncated': idx < end,
+                'KeyCount': len(contents) + len(commonprefixes),
+                'MaxKeys': MaxKeys,
+                'Prefix': Prefix
+            }
+        if (len(contents) > 0):
+            response['Contents'] = contents
+        if (len(commonprefixes) > 0):
+            response['CommonPrefixes'] = commonprefixes
+        if (idx < end):
+            response['NextContinuationToken'] = str(idx)
+        return response
+
+    def ListXML(self, **params) -> bytes:
+        """ The list_objects_v2 response for params as S3 sends it: XML, with keys
+            URL-encoded if EncodingType is 'url'.
+        """
+        response = self.list_objects_v2(**params)
+        encode = quote_plus if (params.get('EncodingType') == 'url') else escape
+
+        xml = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">']
+        xml.append('<Name>{}</Name><Prefix>{}</Prefix><KeyCount>{}</KeyCount>'
+                   '<MaxKeys>{}</MaxKeys><IsTruncated>{}</IsTruncated>'.format(
+                        escape(params['Bucket']), encode(params.get('Prefix', '')),
+                        response['KeyCount'], response['MaxKeys'],
+                        'true' if (response['IsTruncated']) else 'false'))
+        if ('NextContinuationToken' in response):
+            xml.append('<NextContinuationToken>{}</NextContinuationToken>'.format(
+                            response['NextContinuationToken']))
+        for item in response.get('Contents', ()):
+            xml.append('<Contents><Key>{}</Key><LastModified>{}</LastModified>'
+                       '<ETag>{}</ETag><Size>{}</Size><StorageClass>{}</StorageClass></Contents>'.format(
+                            encode(item['Key']),
+                            item['LastModified'].strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                            escape(item['ETag'], {'"': '&quot;'}), item['Size'],
+                            item['StorageClass']))
+        for commonprefix in response.get('CommonPrefixes', ()):
+            xml.append('<CommonPrefixes><Prefix>{}</Prefix></CommonPrefixes>'.format(
+                            encode(commonprefix['Prefix'])))
+        xml.append('</ListBucketResult>')
+        return ''.join(xml).encode('utf-8')
+
+    def get_paginator(self, operation: str):
+        if (operation != 'list_objects_v2'):
+            raise ValueError("FakeS3Client can't paginate {}".format(operation))
+        return FakePaginator(self)
+
+
+class FakePaginator:
+    def __init__(self, client: FakeS3Client):
+        self._client = client
+
+    def paginate(self, **params):
+        params = dict(params)
+        while (True):
+            response = self._client.list_objects_v2(**params)
+            yield response
+            if (not response['IsTruncated']):
+                return
+            params['ContinuationToken'] = response['NextContinuationToken']
+
+
+class FakeClientPool:
+    """ One FakeS3Client for every bucket, for BucketPrinter.SetClientPool. """
+
+    def __init__(self, client: FakeS3Client):
+        self._client = client
+        self._scheduler = None
+
+    def Client(self, bucket: str):
+        if (self._scheduler is not None):
+            return ScheduledClient(self._client, self._scheduler)
+        return self._client
+
+    def SetMaxConnections(self, connections: int):
+        pass
+
+    def SetScheduler(self, scheduler):
+        self._scheduler = scheduler
+
+    def SetRawList(self, rawlist: bool):
+        # Fake pages are dicts already; see Bench.BenchListParser for parsing.
+        pass
+
+    def SetStats(self, stats):
+        pass
+
+    def Reset(self):
+        pass
+
+
+class NullStream:
+    """ A binary stream that throws everything away. """
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def RenderPerObject(objects: list, blocksize: int) -> str:
+    """ Reference: how object lines were formatted before PageRenderer, one at a time. """
+    lines = []
+    for (item, keyname) in objects:
+        if (len(keyname) == 0):
+            keyname = "<directory object>"
+        lastmod = item['LastModified'].strftime('%Y-%m-%d %H:%M:%S')
+        if (blocksize == -1):
+            itemsize = foursigfloat(item['Size'], bucket_units)
+        else:
+            itemsize = '{:0.0f} blocks'.format(item['Size'] / blocksize)
+        lines.append("{} {}: {}\n".format(itemsize, lastmod, keyname))
+    return ''.join(lines)
+
+
+class Bench:
+    """ The stages, for one KeySet. Each Bench* method runs a stage once over every key
+        (or every directory) and returns how many it handled.
+    """
+
+    def __init__(self, keys: KeySet, latency: float, prefetch: int):
+        self._keys = keys
+        self._latency = latency
+        self._prefetch = prefetch
+
+    def Printer(self, dirtotals: bool = False) -> BucketPrinter:
+        bucketprinter = BucketPrinter(None)
+        bucketprinter.SetClientPool(FakeClientPool(FakeS3Client(self._keys, self._latency)))
+        if (self._prefetch > 0):
+            bucketprinter.SetPrefetch(self._prefetch)
+        bucketprinter.SetDirectoryTotals(dirtotals)
+        sink = TextSink(NullStream())
+        bucketprinter.SetSink(sink)
+        sink.Begin('bench', '/', None, -1, dirtotals)
+        bucketprinter.SetListing('bench', '/', None)
+        return bucketprinter
+
+    def Items(self):
+        """ Every object, through the fake paginator: the cost of the listing itself. """
+        paginator = FakeS3Client(self._keys, self._latency).get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket='bench', MaxKeys=1000):
+            yield from page.get('Contents', ())
+
+    def BenchList(self) -> int:
+        count = 0
+        for item in self.Items():
+            count = count + 1
+        return count
+
+    def BenchListParser(self) -> int:
+        """ ParseListing over S3's XML for the first pages, again and again until it has
+            seen as many keys as the bucket has. (All of the XML would take too much
+            memory, and rendering it as we go would be most of the time.)
+        """
+        if (not hasattr(self, '_xmlpages')):
+            client = FakeS3Client(self._keys)
+            params = {'Bucket': 'bench', 'MaxKeys': 1000, 'EncodingType': 'url'}
+            self._xmlpages = []
+            while (len(self._xmlpages) < 10):
+                expected = client.list_objects_v2(**params)
+                body = client.ListXML(**params)
+                page = ParseListing([body], ParseCache())
+                if (page.get('Contents', []) != expected.get('Contents', [])
+                        or page['IsTruncated'] != expected['IsTruncated']
+                        or page.get('NextContinuationToken') != expected.get('NextContinuationToken')):
+                    raise AssertionError("ParseListing differs from the listing it parsed")
+                self._xmlpages.append((body, len(expected.get('Contents', ()))))
+                if (not expected['IsTruncated']):
+                    break
+                params['ContinuationToken'] = expected['NextContinuationToken']
+
+        cache = ParseCache()
+        count = 0
+        while (count < len(self._keys)):
+            for (body, keys) in self._xmlpages:
+                # A socket hands the body over in pieces.
+                ParseListing([body[idx:idx + 65536] for idx in range(0, len(body), 65536)],
+                             cache)
+                count = count + keys
+                if (count >= len(self._keys)):
+                    break
+            if (count == 0):
+                break
+        return count
+
+    def BenchParseBucket(self) -> int:
+        count = 0
+        for item in self.Printer().ParseBucket('bench'):
+            count = count + 1
+        return count
+
+    def BenchKeyMatch(self) -> int:
+        bucketprinter = self.Printer()
+        bucketprinter.BucketMatch(shape_matches[self._keys.shape])
+        keymatch = bucketprinter.KeyMatch
+        count = 0
+        for key in self._keys:
+            keymatch(key)
+            count = count + 1
+        return count
+
+    def BenchDirectoryStack(self) -> int:
+        """ PrintItems' accounting, without anything else. """
+        dirstack = DirectoryStack('/', lambda stats: None)
+        prevdir = None
+        stats = dirstack.Top()
+        count = 0
+        for key in self._keys:
+            nextdir = key[0:key.rfind('/') + 1]
+            if (nextdir != prevdir):
+                stats = dirstack.Enter(nextdir)
+                prevdir = nextdir
+            stats.objects = stats.objects + 1
+            count = count + 1
+        dirstack.Finish()
+        return count
+
+    def BenchPrintItems(self) -> int:
+        bucketprinter = self.Printer()
+        bucketprinter.PrintItems(self.Items())
+        return len(self._keys)
+
+    def Directories(self) -> list:
+        """ Every directory's finished DirStats, to hand to WrapUpDirectory. """
+        finished = []
+        dirstack = DirectoryStack('/', finished.append)
+        prevdir = None
+        stats = dirstack.Top()
+        for idx in range(len(self._keys)):
+            key = self._keys[idx]
+            nextdir = key[0:key.rfind('/') + 1]
+            if (nextdir != prevdir):
+                stats = dirstack.Enter(nextdir)
+                prevdir = nextdir
+            stats.objects = stats.objects + 1
+            stats.size = stats.size + self._keys.Size(idx)
+            stats.latest = self._keys.ModifiedTime(idx)
+        dirstack.Finish()
+        for stats in finished:
+            stats.latest = datetime.datetime.fromtimestamp(stats.latest, datetime.timezone.utc)
+        return finished
+
+    def BenchWrapUpDirectory(self, wrapup, directories: list) -> int:
+        for stats in directories:
+            wrapup(stats)
+        return len(directories)
+
+    def ObjectPages(self):
+        """ Every object, as (item, keyname) pages of 1000 for a TextSink to render. """
+        page = []
+        for item in self.Items():
+            page.append((item, item['Key'][item['Key'].rfind('/') + 1:]))
+            if (len(page) == 1000):
+                yield page
+                page = []
+        if (len(page) > 0):
+            yield page
+
+    def BenchPageRenderer(self) -> int:
+        renderer = PageRenderer(-1)
+        checked = False
+        count = 0
+        for page in self.ObjectPages():
+            rendered = renderer.Render(page)
+            if (not checked):
+                if (rendered != RenderPerObject(page, -1)):
+                    raise AssertionError("PageRenderer output differs from per-object formatting")
+                checked = True
+            count = count + len(page)
+        return count
+
+    def BenchRenderPerObject(self) -> int:
+        """ The same lines as BenchPageRenderer, formatted one object at a time, to
+            compare with.
+        """
+        count = 0
+        for page in self.ObjectPages():
+            RenderPerObject(page, -1)
+            count = count + len(page)
+        return count
+
+
+def Measure(run, memory: bool) -> dict:
+    """ Time one run; then, if asked, run again under tracemalloc for its peak memory.
+        (Tracing slows everything down, so the timed run isn't traced.)
+    """
+    gc.collect()
+    began = time.perf_counter()
+    units = run()
+    seconds = time.perf_counter() - began
+
+    peak = None
+    if (memory):
+        gc.collect()
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {'units': units, 'seconds': seconds, 'rate': units / seconds if (seconds > 0) else None,
+            'peak_bytes': peak}
+
+def RunBenchmarks(keys: int, shapelist: list, stagelist: list, latency: float,
+                  prefetch: int, memory: bool, report = None) -> list:
+    """ Results for every shape and stage asked for, as dicts. report(result) is called
+        with each as it is done.
+    """
+    results = []
+    for shape in shapelist:
+        bench = Bench(KeySet(shape, keys), latency, prefetch)
+        for stage in stagelist:
+            if (stage == 'WrapUpDirectory'):
+                # Set up outside the measurement: directories are few, next to keys.
+                directories = bench.Directories()
+                wrapup = bench.Printer(True).WrapUpDirectory
+                run = lambda: bench.BenchWrapUpDirectory(wrapup, directories)
+                unit = 'dirs'
+            else:
+                run = getattr(bench, 'Bench' + stage[0].upper() + stage[1:])
+                unit = 'keys'
+
+            result = {'stage': stage, 'shape': shape, 'keys': keys, 'unit': unit}
+            result.update(Measure(run, memory))
+            results.append(result)
+            if (report is not None):
+                report(result)
+    return results
+
+def ReportResult(result: dict, baseline: dict = None):
+    line = "{:16} {:6} {:>12,.0f} {}/sec".format(result['stage'], result['shape'],
+                                                 result['rate'] or 0, result['unit'])
+    if (result['peak_bytes'] is not None):
+        line = line + "  peak {:>9}".format(foursigfloat(result['peak_bytes'], bucket_units))
+    if (baseline is not None):
+        old = baseline.get((result['stage'], result['shape']))
+        if (old is not None and old['rate']):
+            line = line + "  {:+.1%} vs baseline".format(result['rate'] / old['rate'] - 1)
+    print(line, flush=True)
+
+def GitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def LoadBaseline(path: str) -> dict:
+    """ Saved results, by (stage, shape). """
+    with open(path, 'r') as resultfile:
+        saved = json.load(resultfile)
+    if (saved.get('version') != results_version):
+        raise ValueError("{} holds results in an unknown format".format(path))
+    return {(result['stage'], result['shape']): result for result in saved['results']}
+
+def Regressions(results: list, baseline: dict, threshold: float) -> list:
+    """ Results more than threshold (a fraction) slower than the same stage and shape in
+        baseline.
+    """
+    slower = []
+    for result in results:
+        old = baseline.get((result['stage'], result['shape']))
+        if (old is None or not old['rate'] or not result['rate']):
+            continue
+        if (result['rate'] < old['rate'] * (1 - threshold)):
+            slower.append(result)
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark bucket listing hot paths, offline.")
+    parser.add_argument('--keys', type=int, default=1000000,
+                help='Synthetic objects per benchmark (default: 1000000)')
+    parser.add_argument('--shape', action='append', choices=shapes,
+                help='Key layout to benchmark; may be repeated (default: all)')
+    parser.add_argument('--stage', action='append', choices=stages,
+                help='Stage to benchmark; may be repeated (default: all)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                help='Milliseconds the fake S3 takes per request (default: 0)')
+    parser.add_argument('--prefetch', type=int, default=0,
+                help='Pages for ParseBucket and PrintItems to fetch ahead (default: 0)')
+    parser.add_argument('--no-memory', action='store_true',
+                help="Don't measure peak memory (saves a second, traced, run of each stage)")
+    parser.add_argument('--save', type=str, metavar='FILE',
+                help='Save the results to FILE, as JSON')
+    parser.add_argument('--compare', type=str, metavar='FILE',
+                help='Compare with results saved earlier; exit with 1 on a regression')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                help='Percent slower than --compare results that counts as a regression (default: 10)')
+    args = parser.parse_args()
+
+    baseline = LoadBaseline(args.compare) if (args.compare) else None
+    results = RunBenchmarks(args.keys, args.shape or shapes, args.stage or stages,
+                            args.latency / 1000, args.prefetch, not args.no_memory,
+                            lambda result: ReportResult(result, baseline))
+
+    if (args.save):
+        with open(args.save, 'w') as resultfile:
+            json.dump({
+                    'version': results_version,
+                    'commit': GitCommit(),
+                    'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'latency_ms': args.latency,
+                    'prefetch': args.prefetch,
+                    'results': results
+                }, resultfile, indent=1)
+            resultfile.write("\n")
+
+    if (baseline is not None):
+        slower = Regressions(results, baseline, args.threshold / 100)
+        for result in slower:
+            print("Regression: {} on {} keys".format(result['stage'], result['shape']),
+                  file=sys.stderr)
+        if (len(slower) > 0):
+            sys.exit(1)
+
+if (__name__ == '__main__'):
+    main()
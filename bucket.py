@@ -3,11 +3,41 @@
 import sys
 import os
 import argparse
+import re
 #from typing import NamedTuple
 from s3misc.auth import AuthInfo
 import s3misc.BucketPrinter
+from s3misc.OutputSinks import MakeSink, sink_formats
+from s3misc.MultiBucket import MultiBucketPrinter
+from s3misc.RunStats import RunStats, WriteProfile
+from s3misc.ListingDiff import ListingDiff, diff_fields
+from s3misc.RequestScheduler import RequestScheduler
+from s3misc.ObjectFilter import ObjectFilter
 
-from s3misc.argparse_types import ArgParseChar
+from s3misc.argparse_types import ArgParseChar, ArgParseSize, ArgParseAge
+
+def Diff(bucketprinter, targets: list, args, fields: list, stream):
+    """ --diff: compare the first target (old) with the second (new). """
+    oldprinter = bucketprinter.Clone()
+    newprinter = bucketprinter.Clone()
+    diffsnapshot = None
+    if (args.diff_snapshot):
+        from s3misc.Snapshot import Snapshot
+        diffsnapshot = Snapshot(args.diff_snapshot)
+        oldprinter.SetSource(diffsnapshot)
+        oldprinter.SetSaveSnapshot(None)
+    # Everything under the prefixes, whatever --depth says.
+    oldprinter.SetDepth(-1)
+    newprinter.SetDepth(-1)
+
+    sink = MakeSink(args.format, stream)
+    diff = ListingDiff(oldprinter, newprinter, sink, fields)
+    ((oldbucket, delim, oldmatch, params), (newbucket, delim, newmatch, params)) = targets
+    diff.Run((oldbucket, delim, oldmatch), (newbucket, delim, newmatch),
+             args.directory_totals, args.block_size)
+    sink.Close()
+    if (diffsnapshot is not None):
+        diffsnapshot.Close()
 
 def main():
     parser = argparse.ArgumentParser("List aws buckets.")
@@ -20,10 +50,144 @@ def main():
                 help='AWS access key. If not provided, will be taken from ~/.aws/credentials. If provided, you will be prompted for the secret access key.')
     parser.add_argument('--directory-totals', default=False, action="store_true",
                 help='Provide totals at the end of directories, in addition to at the end of bucket listing.')
+    parser.add_argument('--no-recursive', default=False, action="store_true",
+                help='List only the top level under the prefix; show subdirectories as entries (same as --depth 1).')
+    parser.add_argument('--depth', type=int, default=-1,
+                help='List only this many levels under the prefix; show deeper subdirectories as entries.')
+    parser.add_argument('--summarize', default=False, action="store_true",
+                help='Print only the bucket totals, not each object (like du -s).')
+    parser.add_argument('--max-print-depth', type=int, default=-1,
+                help='Print only totals, for directories at most this deep (the bucket is 0).')
+    snapshotgroup = parser.add_mutually_exclusive_group()
+    snapshotgroup.add_argument('--save-snapshot', type=str, metavar='FILE',
+                help='Save the objects listed to a local snapshot file, for --from-snapshot.')
+    snapshotgroup.add_argument('--from-snapshot', type=str, metavar='FILE',
+                help='List from a snapshot saved with --save-snapshot instead of from S3.')
+    snapshotgroup.add_argument('--inventory', type=str, metavar='MANIFEST',
+                help='List from a local copy of an S3 Inventory report (its manifest.json) instead of from S3.')
+    parser.add_argument('--histograms', action='store_true',
+                help='With the totals, count objects and bytes by size (powers of two) and by age.')
+    parser.add_argument('--top-objects', type=int, default=0, metavar='N',
+                help='Print only the N largest objects (after the totals), not every object.')
+    parser.add_argument('--top-dirs', type=int, default=0, metavar='N',
+                help='Print only the N directories with the most bytes in them, not every object.')
+    parser.add_argument('--diff', action='store_true',
+                help='Compare two targets, OLD then NEW (bucket or bucket:prefix): print added, removed and changed objects, and net changes.')
+    parser.add_argument('--diff-snapshot', type=str, metavar='FILE',
+                help='With --diff, list OLD from this snapshot instead of from S3.')
+    parser.add_argument('--diff-fields', type=str, default=','.join(diff_fields),
+                help='With --diff, what counts as a change, of ' + ','.join(diff_fields) + ' (default: all)')
+    parser.add_argument('--checkpoint', type=str, metavar='FILE',
+                help='Save where the listing is to FILE every so often, so that --resume can carry on from there if it stops.')
+    parser.add_argument('--checkpoint-interval', type=float, default=60.0, metavar='SECONDS',
+                help='Seconds between checkpoints (default: 60)')
+    parser.add_argument('--resume', action='store_true',
+                help='Carry on from the --checkpoint FILE of a listing that stopped, if there is one. Carries on --output from where it was then.')
+    parser.add_argument('--serve', type=str, metavar='ADDRESS',
+                help='Keep the usage of a single target in memory and answer queries about it over HTTP on ADDRESS: '
+                     '[HOST]:PORT, or the path of a Unix socket. --max-print-depth limits how deep it goes.')
+    parser.add_argument('--refresh', type=float, default=10.0, metavar='SECONDS',
+                help='With --serve, seconds between listing again the directories where objects changed (default: 10)')
+    parser.add_argument('--refresh-all', type=float, default=0.0, metavar='SECONDS',
+                help='With --serve, list everything again every so often, a directory at a time (default: never)')
+    parser.add_argument('--events', type=str, metavar='FILE',
+                help='With --serve, follow FILE (or a named pipe) for object changes: a key, or an S3 event notification, a line each.')
+    parser.add_argument('--shards', type=int, default=0, metavar='N',
+                help='List a single target as key ranges in N processes, and print its totals (no objects) merged from them.')
+    parser.add_argument('--start-after', type=str, metavar='KEY',
+                help='List only the keys after KEY.')
+    parser.add_argument('--end-at', type=str, metavar='KEY',
+                help='List only the keys up to and including KEY.')
+    parser.add_argument('--partial', type=str, metavar='FILE',
+                help="Don't print the listing: save its totals to FILE, for --merge with the other key ranges'.")
+    parser.add_argument('--plan-shards', type=int, default=0, metavar='N',
+                help='Print the --start-after and --end-at options for N key ranges that cover a single target.')
+    parser.add_argument('--merge', action='store_true',
+                help='The arguments are --partial FILEs covering a listing: print its totals (no objects).')
+    parser.add_argument('--estimate', type=int, nargs='?', const=1000, default=0, metavar='REQUESTS',
+                help='Estimate objects and bytes per top-level directory, with 95%% intervals, from at most REQUESTS '
+                     'list requests (default: 1000) instead of listing everything')
+    parser.add_argument('--min-size', type=ArgParseSize, metavar='SIZE',
+                help='Only objects of at least SIZE bytes (or 10K, 5M, 1.5G, ...). Totals count only the objects listed.')
+    parser.add_argument('--max-size', type=ArgParseSize, metavar='SIZE',
+                help='Only objects of at most SIZE bytes (or 10K, 5M, 1.5G, ...).')
+    parser.add_argument('--older-than', type=ArgParseAge, metavar='AGE',
+                help='Only objects last modified more than AGE ago (30d, 12h, 90m, 2w) or before a date (2024-01-31).')
+    parser.add_argument('--newer-than', type=ArgParseAge, metavar='AGE',
+                help='Only objects last modified less than AGE ago (30d, 12h, 90m, 2w) or after a date (2024-01-31).')
+    parser.add_argument('--storage-class', type=str, metavar='CLASS[,CLASS...]',
+                help='Only objects of these storage classes (STANDARD, STANDARD_IA, GLACIER, ...).')
+    parser.add_argument('--regex', type=str,
+                help='Only objects whose key contains a match of this regular expression.')
+    parser.add_argument('--parallel', type=int, default=1,
+                help='List each bucket with this many concurrent requests over key ranges (default: 1)')
+    parser.add_argument('--prefetch', type=int, default=2,
+                help='Pages to fetch ahead while printing; 0 to disable (default: 2)')
+    parser.add_argument('--request-rate', type=float, default=1000.0, metavar='N',
+                help='Most list requests per second, across all listings. Less while S3 is throttling; '
+                     '0 for no pacing, leaving retries to botocore (default: 1000)')
+    parser.add_argument('--retries', type=int, default=10,
+                help='Times to retry a throttled or failed list request (default: 10)')
+    parser.add_argument('--raw-list', action='store_true',
+                help="Read S3's list responses directly, keeping only what listings use, instead of through botocore (less CPU per key)")
+    parser.add_argument('--jobs', type=int, default=1,
+                help='List this many of the given buckets at once; output stays in argument order (default: 1)')
+    parser.add_argument('--format', choices=sink_formats, default='text',
+                help='Output format (default: text)')
+    parser.add_argument('--output', type=str,
+                help='Write the listing to this file instead of stdout.')
+    parser.add_argument('--stats', nargs='?', const='text', choices=['text', 'json'],
+                help='When done, print pages, keys, requests, time per stage and memory on stderr (as text, or as json)')
+    parser.add_argument('--profile', type=str, metavar='FILE',
+                help='Profile the listing with cProfile and write a report to FILE (raw stats if it ends in .prof). '
+                     'Only the main thread is profiled: use --jobs 1 --prefetch 0 to see everything.')
     parser.add_argument('bucket', type=str, nargs='*',
                 help='Bucket(s) to list')
 
     args = parser.parse_args()
+    if (args.diff and len(args.bucket) != 2):
+        parser.error("--diff compares exactly two targets, OLD and NEW")
+    if (args.diff_snapshot and not args.diff):
+        parser.error("--diff-snapshot only goes with --diff")
+    if (args.resume and not args.checkpoint):
+        parser.error("--resume needs the --checkpoint FILE to resume from")
+    if (args.checkpoint and (len(args.bucket) != 1 or args.diff or args.save_snapshot)):
+        parser.error("--checkpoint is for listing a single target, without --diff or --save-snapshot")
+    if (args.serve and (len(args.bucket) != 1 or args.diff or args.checkpoint or args.save_snapshot or
+                        args.from_snapshot or args.inventory or args.histograms or args.depth > 0 or
+                        args.no_recursive)):
+        parser.error("--serve is for a single target listed from S3, without --diff, --checkpoint, "
+                     "snapshots, --inventory, --histograms or --depth")
+    sharded = (args.shards > 0 or args.partial or args.plan_shards > 0 or args.merge)
+    if (sharded and (args.diff or args.checkpoint or args.save_snapshot or args.serve or args.histograms or args.stats)):
+        parser.error("--shards, --partial, --plan-shards and --merge don't go with --diff, --checkpoint, "
+                     "--save-snapshot, --serve, --histograms or --stats")
+    if (args.merge and (args.shards or args.partial or args.plan_shards)):
+        parser.error("--merge doesn't list anything: not with --shards, --partial or --plan-shards")
+    if (sharded and not args.merge and len(args.bucket) != 1):
+        parser.error("--shards, --partial and --plan-shards are for a single target")
+    if ((args.start_after is not None or args.end_at is not None) and (args.shards or args.plan_shards or args.merge)):
+        parser.error("--start-after and --end-at don't go with --shards, --plan-shards or --merge")
+    if (args.shards < 0 or args.plan_shards < 0):
+        parser.error("--shards and --plan-shards need a positive count")
+    if (args.estimate < 0):
+        parser.error("--estimate needs a positive request budget")
+    if (args.estimate and (args.diff or args.checkpoint or args.serve or sharded or args.save_snapshot or
+                           args.from_snapshot or args.inventory or args.start_after is not None or
+                           args.end_at is not None)):
+        parser.error("--estimate is of listings from S3: not with --diff, --checkpoint, --serve, snapshots, "
+                     "--inventory, sharding or key ranges")
+    filtered = (args.min_size is not None or args.max_size is not None or args.older_than is not None or
+                args.newer_than is not None or args.storage_class is not None or args.regex is not None)
+    if (filtered and (args.estimate or args.merge)):
+        parser.error("--min-size, --max-size, --older-than, --newer-than, --storage-class and --regex "
+                     "are for listings: not with --estimate or --merge")
+    if ((args.events or args.refresh_all > 0) and not args.serve):
+        parser.error("--events and --refresh-all only go with --serve")
+    difffields = args.diff_fields.split(',')
+    for field in difffields:
+        if (field not in diff_fields):
+            parser.error("Unknown --diff-fields field: {}".format(field))
 
     auth = None
     if (args.access_key_id):
@@ -36,8 +200,119 @@ def main():
         bucketprinter.SetBlockSize(args.block_size)
     if (args.directory_totals):
         bucketprinter.SetDirectoryTotals(True)
+    if (args.depth > 0):
+        bucketprinter.SetDepth(args.depth)
+    if (args.summarize):
+        bucketprinter.SetPrintDepth(0)
+    elif (args.max_print_depth >= 0):
+        bucketprinter.SetPrintDepth(args.max_print_depth)
+    if (args.histograms):
+        bucketprinter.SetHistograms(True)
+    if (args.top_objects > 0 or args.top_dirs > 0):
+        bucketprinter.SetTop(args.top_objects, args.top_dirs)
+    if (args.estimate > 0):
+        bucketprinter.SetEstimate(args.estimate)
+    if (filtered):
+        storageclasses = args.storage_class.split(',') if (args.storage_class is not None) else None
+        try:
+            bucketprinter.SetFilter(ObjectFilter(args.min_size, args.max_size, args.older_than,
+                                                 args.newer_than, storageclasses, args.regex))
+        except (ValueError, re.error) as error:
+            parser.error(str(error))
+    if (args.parallel > 1):
+        bucketprinter.SetParallel(args.parallel)
+    if (args.prefetch > 0):
+        bucketprinter.SetPrefetch(args.prefetch)
+    if (args.request_rate > 0):
+        # Each process paces its own requests: share the rate out.
+        bucketprinter.SetScheduler(RequestScheduler(args.request_rate / max(1, args.shards), args.retries))
+    if (args.raw_list):
+        bucketprinter.SetRawList(True)
+    if (args.jobs * args.parallel > 10):
+        bucketprinter.SetMaxConnections(args.jobs * args.parallel)
+
+    # Imported only when used: most runs need neither, and startup time adds up.
+    snapshot = None
+    if (args.save_snapshot):
+        from s3misc.Snapshot import Snapshot
+        snapshot = Snapshot(args.save_snapshot)
+        bucketprinter.SetSaveSnapshot(snapshot)
+    elif (args.from_snapshot):
+        from s3misc.Snapshot import Snapshot
+        snapshot = Snapshot(args.from_snapshot)
+        bucketprinter.SetSource(snapshot)
+    elif (args.inventory):
+        from s3misc.Inventory import InventoryReader
+        bucketprinter.SetSource(InventoryReader(args.inventory))
+
+    # The checkpoint being resumed from, if there is one.
+    resumed = None
+    if (args.checkpoint):
+        from s3misc.Checkpoint import Checkpoint
+        checkpoint = Checkpoint(args.checkpoint, args.checkpoint_interval, args.resume)
+        bucketprinter.SetCheckpoint(checkpoint)
+        resumed = checkpoint.Load()
+
+    if (args.serve):
+        from s3misc.UsageServer import Serve
+        (bucket, sep, prefix) = args.bucket[0].partition(':')
+        Serve(bucketprinter, bucket, prefix, args.delim, args.serve, args.refresh,
+              args.refresh_all, args.events, args.max_print_depth)
+        return
+
+    if (args.start_after is not None or args.end_at is not None):
+        bucketprinter.SetKeyRange(args.start_after, args.end_at)
+
+    if (args.merge):
+        from s3misc.Partial import Partial
+        partials = [Partial.Load(path) for path in args.bucket]
+    elif (args.plan_shards > 0):
+        import shlex
+        (bucket, sep, match) = args.bucket[0].partition(':')
+        for (lowkey, highkey) in bucketprinter.KeyRanges(bucket, match, args.delim, args.plan_shards):
+            options = []
+            if (lowkey is not None):
+                options.append('--start-after ' + shlex.quote(lowkey))
+            if (highkey is not None):
+                options.append('--end-at ' + shlex.quote(highkey))
+            print(' '.join(options))
+        return
+    elif (args.partial):
+        (bucket, sep, match) = args.bucket[0].partition(':')
+        partial = bucketprinter.ListPartial(bucket, match, args.delim, not args.no_recursive,
+                                            (args.start_after, args.end_at), args.top_objects)
+        partial.Save(args.partial)
+        return
+    elif (args.shards > 0):
+        from s3misc.Partial import ListPartials
+        (bucket, sep, match) = args.bucket[0].partition(':')
+        # More ranges than processes, so one big range doesn't hold up the rest.
+        keyranges = bucketprinter.KeyRanges(bucket, match, args.delim, args.shards * 4)
+        partials = ListPartials(bucketprinter, bucket, args.delim, match, not args.no_recursive,
+                                keyranges, args.shards, args.top_objects)
+
+    # Resumed output carries on from the checkpoint: it already has the header.
+    header = (resumed is None or resumed.get('output') == 0)
+    if (args.output and resumed is not None):
+        # Cut off what was written after the checkpoint; the listing writes it again.
+        outstream = open(args.output, 'ab')
+        if (resumed.get('output') is not None):
+            outstream.truncate(resumed['output'])
+            outstream.seek(resumed['output'])
+    elif (args.output):
+        outstream = open(args.output, 'wb')
+    else:
+        outstream = sys.stdout.buffer
+
+    stats = None
+    liststream = outstream
+    if (args.stats):
+        stats = RunStats()
+        bucketprinter.SetStats(stats)
+        liststream = stats.TimeStream(outstream)
 
     bucketprinter.Test()
+    targets = []
     for bucket in args.bucket:
 
         bucketinfo = bucket.split(':', 1)
@@ -46,9 +321,37 @@ def main():
 
         params = dict()
         delim = args.delim
+        if (args.no_recursive):
+            params['recursive'] = False
+
+        targets.append((bucketinfo[0], delim, bucketinfo[1], params))
+
+    if (args.merge or args.shards > 0):
+        multiprinter = MultiBucketPrinter(bucketprinter, 1,
+                                          lambda stream, header: MakeSink(args.format, stream, header))
+        run = lambda: multiprinter.PrintPartials(partials, liststream)
+    elif (args.diff):
+        run = lambda: Diff(bucketprinter, targets, args, difffields, liststream)
+    else:
+        multiprinter = MultiBucketPrinter(bucketprinter, args.jobs,
+                                          lambda stream, header: MakeSink(args.format, stream, header))
+        run = lambda: multiprinter.PrintTargets(targets, liststream, header)
+
+    if (args.profile):
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.runcall(run)
+        WriteProfile(profiler, args.profile)
+    else:
+        run()
+
+    if (stats is not None):
+        stats.Report(args.stats, sys.stderr)
 
-        print("Printing bucket: " + bucketinfo[0])
-        bucketprinter.PrintBucket(bucketinfo[0], delim, bucketinfo[1], **params)
+    if (snapshot is not None):
+        snapshot.Close()
+    if (args.output):
+        outstream.close()
 
 if (__name__ == '__main__'):
     main()
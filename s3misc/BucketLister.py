@@ -0,0 +1,708 @@
+
+import sys
+import copy
+import time
+from typing import TYPE_CHECKING
+
+from s3misc.auth import AuthInfo
+from s3misc.ClientPool import ClientPool
+from s3misc.PagePrefetcher import PagePrefetcher
+from s3misc.Checkpoint import Checkpoint, ResumePages, EndPages
+from s3misc.GlobMatcher import GlobPattern, GlobLister, LiteralPrefix
+from s3misc.DelimitedLister import DelimitedLister, CollapsePages
+from s3misc.DirectoryStack import DirStats, DirectoryStack
+from s3misc.UsageTree import UsageNode, UsageTreeBuilder
+from s3misc.RunStats import RunStats
+from s3misc.ObjectFilter import ObjectFilter
+from s3misc.TopN import TopN
+
+if (TYPE_CHECKING):
+    # Only for annotations: each of these is imported where it's used, so a listing
+    # that doesn't need them doesn't load them (sqlite3, multiprocessing, threads).
+    from s3misc.Snapshot import Snapshot
+    from s3misc.Partial import Partial
+
+class BucketLister:
+    """ Lists buckets and adds up what's in them, without printing anything.
+
+        Objects() yields the objects of a listing, and Usage() returns its totals as a
+        tree of UsageNodes, one per directory. A lister keeps its S3 clients (see
+        ClientPool) from one listing to the next, so a program can make one and ask it
+        for listings again and again. One listing at a time: Clone() it for another
+        thread.
+
+        BucketPrinter is the lister that prints what it lists.
+    """
+
+    # Authentication for the bucket. Should come from ~/.aws/credentials, or from
+    # command line.
+    _auth = None
+
+    # S3 clients, one per region, made when first needed. Set up by InitClient.
+    _clients = None
+
+    # The actual wildcard matching data. The whole path-to-file given by the user.
+    _match = None
+
+    # Match info - a caching mechanism.
+    # Call PrintBucket, calls GetMatchPrefix, which sets _matchinfo. Used by KeyMatch.
+    _matchinfo = None
+
+    # Only for listing directories
+    _recursive = True
+
+    # Levels below the prefix to list; deeper subdirectories are shown as entries, not
+    # descended into. -1 lists everything (1 if not _recursive).
+    _depth = -1
+
+    # Path delimiter, if any
+    _delim = None
+
+    # Where objects come from instead of S3, if anywhere: anything with a
+    # ListPages(bucket, prefix), such as a Snapshot or an InventoryReader.
+    _source = None
+
+    # Local listing snapshot to save what was listed into (see Snapshot).
+    _savesnapshot = None
+
+    # Number of concurrent paginators. 1 lists with a single paginator.
+    _parallel = 1
+
+    # Pages fetched ahead of the printer on a background thread. 0 to fetch inline.
+    _prefetch = 0
+
+    # Counters and timers for --stats, if wanted.
+    _stats = None
+
+    # What paces and retries list requests (a RequestScheduler), if anything does.
+    _scheduler = None
+
+    # Size and age histograms for each directory and the bucket?
+    _histograms = False
+
+    # Where to save checkpoints of listings, to resume them from (see Checkpoint).
+    _checkpoint = None
+
+    # The checkpoint this listing is resuming from, if it is.
+    _resume = None
+
+    # Only the keys in (lowkey, highkey] of the listing, if set; None for an open end.
+    _keyrange = None
+
+    # Only the objects passing this ObjectFilter (size, age, class, regex), if set.
+    _filter = None
+
+    # This listing's accounting, and the time ages are counted from: what a checkpoint
+    # saves. Set up by StartAccounting.
+    _dirstack = None
+    _now = None
+
+    # The time ages are counted from, if it was given for the listing (the same for
+    # every range of a sharded one); otherwise the listing's start.
+    _agesfrom = None
+
+    def __init__(self, authinfo: AuthInfo):
+        """ Authinfo may be none. If it is, we'll try parsing it from ~/.aws/credentials. """
+        if (authinfo is not None):
+            self._auth = authinfo
+
+        self.InitClient()
+
+    def InitClient(self):
+        # Cheap: no boto3 until a listing needs S3.
+        self._clients = ClientPool(self._auth)
+
+    def SetClientPool(self, clients):
+        """ Where S3 clients come from: a ClientPool, or anything else with
+            Client(bucket), SetMaxConnections(connections), SetScheduler(scheduler),
+            SetRawList(rawlist), SetStats(stats) and Reset().
+        """
+        self._clients = clients
+
+    def Client(self, bucket: str):
+        """ The S3 client for bucket (for its region). """
+        return self._clients.Client(bucket)
+
+    def AfterFork(self):
+        """ In a forked process: make S3 clients of its own, rather than share the
+            connections of the parent's.
+        """
+        self._clients.Reset()
+
+    def SetAuthInfo(self, authinfo: AuthInfo):
+        # Allows you to change auth info later.
+        self._auth = authinfo
+        self.InitClient()
+
+    def Clone(self) -> 'BucketLister':
+        """ Another lister with the same settings and the same S3 clients, for listing
+            on another thread.
+        """
+        return copy.copy(self)
+
+    def Objects(self, bucket: str, match: str = None, delim: str = '/'):
+        """ The objects of a listing of bucket, in key order, as list_objects_v2 describes
+            them (dicts with at least Key, Size and LastModified). match as for
+            ParseBucket.
+        """
+        self.SetListing(bucket, delim, match)
+        self._resume = None
+        for item in self.ParseBucket(bucket):
+            if ('CommonPrefix' not in item):
+                yield item
+
+    def Usage(self, bucket: str, match: str = None, delim: str = '/', maxdepth: int = -1) -> UsageNode:
+        """ Totals of a listing of bucket: a tree of UsageNodes, the root being the
+            bucket (everything listed). maxdepth: keep nodes only for directories at most
+            this deep (the bucket is 0), -1 for all of them; deeper ones are still counted.
+        """
+        self.SetListing(bucket, delim, match)
+        self._resume = None
+        if (self._checkpoint is not None):
+            self._resume = self.LoadCheckpoint()
+
+        builder = UsageTreeBuilder(delim, maxdepth)
+        self.Account(self.ParseBucket(bucket), builder.Finished)
+
+        if (self._checkpoint is not None):
+            self._checkpoint.Remove()
+            self._resume = None
+        return builder.root
+
+    def ListPartial(self, bucket: str, match: str = None, delim: str = '/', recursive: bool = True,
+                keyrange: tuple = (None, None), topobjects: int = 0, now: float = None) -> 'Partial':
+        """ The totals of the keys in keyrange, (lowkey, highkey], of a listing of bucket,
+            to merge with the other ranges' (see Partial). topobjects: rank this many of
+            the largest objects as well. now: the time ages are counted from, so that
+            every range has the same; None for now.
+        """
+        from s3misc.Partial import Partial
+
+        self.SetListing(bucket, delim, match, recursive)
+        self._resume = None
+        objectranks = TopN(topobjects) if (topobjects > 0) else None
+        self.SetKeyRange(keyrange[0], keyrange[1])
+        self._agesfrom = now
+        try:
+            fragments = self.Fragments(self.ParseBucket(bucket), objectranks)
+        finally:
+            self.SetKeyRange(None, None)
+            self._agesfrom = None
+        # Ranges listed with other filters aren't of the same listing.
+        filtersettings = self._filter.Settings() if (self._filter is not None) else None
+        return Partial((bucket, delim, match, self._recursive, self._depth, filtersettings),
+                       tuple(keyrange), fragments, objectranks, topobjects)
+
+    def KeyRanges(self, bucket: str, match: str, delim: str, count: int) -> list:
+        """ About count key ranges, (lowkey, highkey), that together cover a listing, for
+            ListPartial, with about as many keys in each (see ParallelLister); just one if
+            the listing fits in a page. Listing from a source, they split at first
+            characters.
+        """
+        from s3misc.ParallelLister import ParallelLister, split_chars
+
+        if (count < 1):
+            raise ValueError("Given range count ({}) for KeyRanges is invalid.".format(count))
+        self._delim = delim
+        prefix = self.BucketMatch(match) or ''
+        if (count == 1):
+            boundaries = []
+        elif (self._source is not None):
+            # Evenly spaced among the first characters: there's nothing better to go on.
+            boundaries = [prefix + split_chars[idx * len(split_chars) // count] for idx in range(1, count)]
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            lister = ParallelLister(self.Client(bucket), count, delim)
+            with ThreadPoolExecutor(max_workers=min(count, 16)) as pool:
+                boundaries = lister.DiscoverBoundaries(
+                        pool, {'Bucket': bucket, 'MaxKeys': 1000, 'Prefix': prefix}, count)[0]
+
+        ranges = []
+        lowkey = None
+        for highkey in boundaries:
+            if (lowkey is None or highkey > lowkey):
+                ranges.append((lowkey, highkey))
+                lowkey = highkey
+        ranges.append((lowkey, None))
+        return ranges
+
+    def StartAccounting(self, finished) -> DirectoryStack:
+        """ The DirectoryStack for a listing's totals, calling finished(stats) for each
+            directory as it is done; carrying on from the checkpoint being resumed, if
+            there is one. Sets the time ages are counted from.
+        """
+        dirstack = DirectoryStack(self._delim, finished, self._histograms)
+
+        # Carrying on from a checkpoint: with its totals so far.
+        if (self._resume is not None):
+            dirstack.Restore(self._resume['dirstack'])
+        self._dirstack = dirstack
+        self._now = self.AgesFrom()
+        return dirstack
+
+    def AgesFrom(self) -> float:
+        """ The time the listing's ages are counted from: the resumed checkpoint's idea
+            of now, the one given for the listing, or the start of the listing.
+        """
+        if (self._resume is not None):
+            return self._resume['now']
+        if (self._agesfrom is not None):
+            return self._agesfrom
+        return time.time()
+
+    def Account(self, items, finished) -> DirStats:
+        """ Add items (from ParseBucket) up into directory totals, calling finished(stats)
+            for each directory as it is done. Returns the totals for the whole listing.
+        """
+        dirstack = self.StartAccounting(finished)
+        delim = self._delim
+        histograms = self._histograms
+        now = self._now
+
+        prevdir = None
+        stats = dirstack.Top()
+        for item in items:
+            key = item['Key']
+            if ('CommonPrefix' in item):
+                # A subdirectory that wasn't listed: nothing to count, but its parent
+                # directory is there.
+                nextdir = key[0:key.rfind(delim, 0, len(key) - len(delim)) + 1]
+                if (nextdir != prevdir):
+                    stats = dirstack.Enter(nextdir)
+                    prevdir = nextdir
+                continue
+
+            nextdir = key[0:key.rfind(delim) + 1]
+            if (nextdir != prevdir):
+                stats = dirstack.Enter(nextdir)
+                prevdir = nextdir
+
+            stats.objects = stats.objects + 1
+            stats.size = stats.size + item['Size']
+            lastmod = item['LastModified']
+            if (stats.latest is None or lastmod > stats.latest):
+                stats.latest = lastmod
+            if (histograms):
+                stats.histogram.Add(item['Size'], (now - lastmod.timestamp()) / 86400)
+
+        return dirstack.Finish()
+
+    def Fragments(self, items, objectranks = None) -> list:
+        """ Items (from ParseBucket) added up a directory at a time, for Account to
+            finish later (see AccountFragments): [path, objects, size, latest] for each
+            stretch of the listing in one directory, in listing order. A directory comes
+            up again after each of its subdirectories, and a CommonPrefix item's
+            directory has a fragment with nothing in it, just as Account enters it.
+            objectranks: a TopN to rank the objects in as well.
+        """
+        delim = self._delim
+        fragments = []
+        prevdir = None
+        fragment = None
+        for item in items:
+            key = item['Key']
+            subdir = ('CommonPrefix' in item)
+            if (subdir):
+                nextdir = key[0:key.rfind(delim, 0, len(key) - len(delim)) + 1]
+            else:
+                nextdir = key[0:key.rfind(delim) + 1]
+            if (nextdir != prevdir):
+                fragment = [nextdir, 0, 0, None]
+                fragments.append(fragment)
+                prevdir = nextdir
+            if (subdir):
+                continue
+
+            fragment[1] = fragment[1] + 1
+            fragment[2] = fragment[2] + item['Size']
+            lastmod = item['LastModified']
+            if (fragment[3] is None or lastmod > fragment[3]):
+                fragment[3] = lastmod
+            if (objectranks is not None):
+                objectranks.Add(item['Size'], item)
+        return fragments
+
+    def AccountFragments(self, fragments, finished) -> DirStats:
+        """ What Account would have made of the items fragments came from: fragments of
+            consecutive key ranges, one after another, add up to the whole listing's
+            totals, exactly.
+        """
+        dirstack = self.StartAccounting(finished)
+        stats = dirstack.Top()
+        prevdir = None
+        for (path, objects, size, latest) in fragments:
+            if (path != prevdir):
+                stats = dirstack.Enter(path)
+                prevdir = path
+            stats.objects = stats.objects + objects
+            stats.size = stats.size + size
+            if (latest is not None and (stats.latest is None or latest > stats.latest)):
+                stats.latest = latest
+        return dirstack.Finish()
+
+    def SetListing(self, bucket: str, delim: str, match: str, recursive = True):
+        """ What the next listing is of. Objects, Usage and PrintBucket do this;
+            ParseBucket and PrintItems on their own need it done first.
+        """
+        self._delim = delim
+        self._match = match
+        self._bucket = bucket
+
+        # reset this every listing
+        if (recursive):
+            self._recursive = True
+        else:
+            self._recursive = False
+
+    def ParseBucket(self, bucket: str):
+        """ Get and process a list of objects from a bucket.
+
+        `match` may be None. If specified, any portion before the first wildcard is the prefix,
+        and wildcards will not match delimiters. A ** segment matches any number of
+        directories. Only directories that wildcards can match are listed.
+
+        e.g.:
+            match: my/files/myf*
+            matches:
+            - my/files/myfiles
+            - my/files/myfamily
+            no match:
+            - my/files/myfamily/tree
+            - my/files/myfunny/stuff
+
+            match: logs/2020-*/**/*.gz
+            matches:
+            - logs/2020-10/a.gz
+            - logs/2020-10/host1/a.gz
+            no match:
+            - logs/2021-01/a.gz
+            - logs/2020-10/a.gz.txt
+        """
+
+        params = {
+                'Bucket': bucket,
+                'MaxKeys': 1000 # server-side limit: 1000
+        }
+
+
+        # Prefix is the non-wild patch of the matching clause
+        prefix = self.BucketMatch(self._match)
+        if (prefix is not None):
+            params['Prefix'] = prefix
+
+        # Wildcards already say how deep to go. Otherwise, maybe only a few levels.
+        wild = (self._matchinfo is not None and self._matchinfo[2] is not None)
+        depth = self._depth
+        if (not self._recursive and depth < 0):
+            depth = 1
+        if (wild):
+            depth = -1
+
+        # Snapshots should hold the whole prefix, so when saving one, list everything
+        # and leave out what isn't wanted afterwards.
+        serverside = (self._source is None and self._savesnapshot is None)
+
+        # For hints, we're going to use pagination.
+        # Resuming, or a key range: S3 can start after the last key that was done (or
+        # the start of the range). Sources can't, and listings by delimiter can repeat
+        # the subdirectory it was in; ResumePages leaves those out.
+        resume = self._resume
+        startafter = None
+        if (resume is not None):
+            startafter = resume['lastkey']
+        keyrange = self._keyrange
+        if (keyrange is not None and keyrange[0] is not None and
+                (startafter is None or keyrange[0] > startafter)):
+            startafter = keyrange[0]
+        if (startafter is not None and startafter > params.get('Prefix', '')):
+            params['StartAfter'] = startafter
+
+        if (self._source is not None):
+            paginator = self._source.ListPages(bucket, params.get('Prefix', ''))
+        elif (wild and serverside):
+            # Only list the subtrees the wildcards can match.
+            paginator = GlobLister(self.Client(bucket), self._matchinfo[2])
+            paginator = paginator.ListPages(params)
+        elif (depth > 0 and serverside):
+            # Let S3 summarize the levels we don't descend into.
+            paginator = DelimitedLister(self.Client(bucket), self._delim, depth)
+            paginator = paginator.ListPages(params)
+        elif (self._parallel > 1):
+            from s3misc.ParallelLister import ParallelLister
+
+            paginator = ParallelLister(self.Client(bucket), self._parallel, self._delim)
+            paginator = paginator.ListPages(params)
+        else:
+            paginator = self.Client(bucket).get_paginator('list_objects_v2')
+            if (resume is not None and resume['token'] is not None):
+                # Just what S3 would have been asked next.
+                paginator = paginator.paginate(ContinuationToken=resume['token'], **params)
+            else:
+                paginator = paginator.paginate(**params)
+
+        if (self._prefetch > 0):
+            paginator = PagePrefetcher(paginator, self._prefetch)
+
+        stats = self._stats
+        if (stats is not None):
+            paginator = stats.TimePages(paginator)
+
+        # Saved here, on our own thread: that's the thread the snapshot belongs to.
+        if (self._savesnapshot is not None):
+            paginator = self._savesnapshot.SavePages(bucket, params.get('Prefix', ''), paginator)
+
+        if (startafter is not None):
+            paginator = ResumePages(paginator, startafter)
+        if (keyrange is not None and keyrange[1] is not None):
+            paginator = EndPages(paginator, keyrange[1])
+        if (self._checkpoint is not None):
+            paginator = self._checkpoint.TrackPages(paginator, self.CheckpointState)
+
+        # Filtered here, before anything is counted or printed.
+        keep = None
+        if (self._filter is not None):
+            keep = self._filter.Predicate(self.AgesFrom())
+
+        if (depth > 0):
+            if (not serverside):
+                paginator = CollapsePages(paginator, params.get('Prefix', ''), self._delim, depth)
+
+            # Every entry is within `depth` levels of the prefix: nothing to match.
+            for page in paginator:
+                contents = page.get('Contents', ())
+                if (keep is not None):
+                    # Subdirectory entries aren't objects: the filter is for what's in them.
+                    began = time.perf_counter()
+                    contents = [item for item in contents if ('CommonPrefix' in item or keep(item))]
+                    if (stats is not None):
+                        stats.Matched(len(contents), time.perf_counter() - began)
+                elif (stats is not None):
+                    stats.Matched(len(contents), 0.0)
+                yield from contents
+            return
+
+        if (keep is not None):
+            if (self._matchinfo is not None):
+                # The key's match and the filter, as one test.
+                keymatch = self.KeyMatch
+                filtered = keep
+                keep = lambda item: (keymatch(item['Key']) and filtered(item))
+            for page in paginator:
+                began = time.perf_counter()
+                matched = [item for item in page.get('Contents', ()) if (keep(item))]
+                if (stats is not None):
+                    stats.Matched(len(matched), time.perf_counter() - began)
+                yield from matched
+            return
+
+        for page in paginator:
+            if (stats is not None):
+                # Matched a page at a time, so matching can be timed on its own.
+                began = time.perf_counter()
+                matched = [item for item in page.get('Contents', ()) if (self.KeyMatch(item['Key']))]
+                stats.Matched(len(matched), time.perf_counter() - began)
+                yield from matched
+                continue
+
+            for item in page.get('Contents', ()):
+                if (not self.KeyMatch(item['Key'])):
+                    # Don't return non-matching objects
+                    continue
+
+                yield item
+
+    def BucketMatch(self, match):
+        """ 
+            Configure the bucket matching parameter.
+            Will return the prefix portion of the match (the part before any wildcards),
+            and store various match info for the KeyMatch method.
+        """
+
+        if (match is None):
+            self._matchinfo = None
+            return None
+
+        # Some processing required. Cache it.
+        matchprefix = LiteralPrefix(match)
+        matchwild = match[len(matchprefix):]
+        matchglob = None
+        if (len(matchwild) > 0):
+            # Compiled once here, used for every key.
+            matchglob = GlobPattern(match, self._delim)
+
+        # No wild characters, then the whole thing will be a prefix.
+        self._matchinfo = [ len(matchprefix), matchwild, matchglob ]
+
+        return matchprefix
+
+    def KeyMatch(self, key:str):
+        """ Given a key, does it match the given match?
+
+            e.g.:
+            /buc/ket/stuff, /buc/ket/stuff* -> matches
+            /buc/ket/stuff/1, /buc/ket/stuff* -> does not match
+            /buc/ket/stuffy, /buc/ket/stuff* -> matches
+            /buc/ket/stuft, /buc/ket/stuf? -> matches
+            /buc/ket/stuff/, /buc/ket/stuff -> matches (if recursive)
+            /buc/ket/stuff/subfile, /buc/ket/stuff -> matches (if recursive)
+            /buc/ket/stuff/subfile, /buc/ket/stuff/ -> matches (if recursive)
+            /buc/ket/2020/stuff.gz, /buc/*/20*/*.gz -> matches
+            /buc/ket/2020/10/stuff.gz, /buc/ket/**/*.gz -> matches
+        """
+
+        # If not using a match condition, then everything matches.
+        if (self._matchinfo is None):
+            return True
+
+        # matchinfo[prefix-length, wild-part, compiled GlobPattern]
+        matchinfo = self._matchinfo
+
+        # Does the prefix match? Yes, of course it does, by definition...
+        matchmaybe = key[matchinfo[0]:]
+
+        if (len(matchinfo[1]) == 0):
+            # No wilds, this is a prefix match.
+            # Is it a directory?
+            if (key[matchinfo[0] - 1] == self._delim):
+                # Delimiter included in prefix
+                return (self._recursive or (matchmaybe.find(self._delim) < 0))
+
+            if (len(matchmaybe) > 0 and matchmaybe[0] == self._delim):
+                # Given on the command line was a directory without the delimiter;
+                matchmaybe = matchmaybe[1:]
+
+            if (len(matchmaybe) == 0 or self._recursive or matchmaybe.find(self._delim) < 0):
+                # We're a directory, we're recursing, or we don't have another delimiter
+                return True
+
+            # Else, there's no wild portion, matchmaybe doesn't start with a delimiter,
+            # (or we aren't recursing and there's another one).
+            # Then either we have a delimiter where we shouldn't or we have text instead of a
+            # delimiter. Stop.
+            return False
+
+        # Else, we have a wild match portion. Wildcards don't match through delimiters,
+        # except for whole ** segments; see GlobPattern.
+        return matchinfo[2].Match(key)
+
+    def ListingSettings(self) -> tuple:
+        """ Everything that decides what a listing's totals are, so a checkpoint is only
+            resumed by the same listing.
+        """
+        return (self._bucket, self._delim, self._match, self._recursive, self._depth,
+                self._histograms, self._keyrange,
+                self._filter.Settings() if (self._filter is not None) else None)
+
+    def CheckpointState(self, lastkey: str, token: str) -> dict:
+        """ What a Checkpoint saves, once everything up to lastkey is accounted for. """
+        return {
+                'listing': self.ListingSettings(),
+                'lastkey': lastkey,
+                'token': token,
+                'now': self._now,
+                'dirstack': self._dirstack.Stack()
+            }
+
+    def LoadCheckpoint(self):
+        """ The state to resume this listing from, if there's a checkpoint of it. """
+        state = self._checkpoint.Load()
+        if (state is None):
+            return None
+        if (tuple(state['listing']) != self.ListingSettings()):
+            raise ValueError("Checkpoint is of another listing ({}:{}) or other settings".format(
+                    state['listing'][0], state['listing'][2]))
+
+        print("Resuming {} after {}".format(self._bucket, state['lastkey']), file=sys.stderr)
+        return state
+
+    def SetDepth(self, depth: int):
+        """ List only this many levels below the prefix, showing the subdirectories at the
+            last level as entries. -1 to list everything.
+        """
+        if (depth < 1 and depth != -1):
+            raise ValueError("Given depth ({}) for SetDepth is invalid.".format(depth))
+        self._depth = depth
+
+    def SetSource(self, source):
+        """ List objects from source (a Snapshot, an InventoryReader, or anything else with
+            ListPages(bucket, prefix)) instead of from S3. None to go back to S3.
+        """
+        self._source = source
+
+    def SetSaveSnapshot(self, snapshot: 'Snapshot'):
+        """ Save everything listed to snapshot as well. None to stop saving. """
+        self._savesnapshot = snapshot
+
+    def SetCheckpoint(self, checkpoint: Checkpoint):
+        """ Save checkpoints of listings to checkpoint, and resume from the one there if
+            it was made to. None to stop.
+        """
+        self._checkpoint = checkpoint
+
+    def SetKeyRange(self, lowkey: str, highkey: str):
+        """ List only the keys after lowkey, up to and including highkey; None for either
+            leaves that end open. A listing's key ranges, listed on their own, cover it.
+        """
+        if (lowkey is None and highkey is None):
+            self._keyrange = None
+        elif (lowkey is not None and highkey is not None and lowkey >= highkey):
+            raise ValueError("Given key range ({}, {}) for SetKeyRange is invalid.".format(lowkey, highkey))
+        else:
+            self._keyrange = (lowkey, highkey)
+
+    def SetFilter(self, objectfilter: ObjectFilter):
+        """ List only the objects objectfilter keeps: they alone are counted in the
+            totals. None to list everything the match does.
+        """
+        if (objectfilter is not None and objectfilter.Empty()):
+            objectfilter = None
+        self._filter = objectfilter
+
+    def SetParallel(self, workers: int):
+        """ List each bucket with this many concurrent paginators over key ranges. """
+        if (workers < 1):
+            raise ValueError("Given worker count ({}) for SetParallel is invalid.".format(workers))
+        self._parallel = workers
+
+    def SetHistograms(self, histograms: bool):
+        """ Whether to count objects and bytes by size and by age, for each directory and
+            the bucket (see Histogram).
+        """
+        self._histograms = histograms
+
+    def SetStats(self, stats: RunStats):
+        """ Count and time what listings do (pages, keys, requests, stages) in stats.
+            None to stop.
+        """
+        self._stats = stats
+        self._clients.SetStats(stats)
+        if (self._scheduler is not None):
+            self._scheduler.SetStats(stats)
+
+    def SetScheduler(self, scheduler):
+        """ Pace and retry listing requests with scheduler (a RequestScheduler), shared
+            by every listing using these clients. None to leave it to botocore.
+        """
+        self._scheduler = scheduler
+        self._clients.SetScheduler(scheduler)
+        if (scheduler is not None):
+            scheduler.SetStats(self._stats)
+
+    def SetRawList(self, rawlist: bool):
+        """ Whether to fetch list pages as XML and parse only what listings use, instead
+            of through botocore (see RawListClient).
+        """
+        self._clients.SetRawList(rawlist)
+
+    def SetMaxConnections(self, connections: int):
+        """ Connections to keep open per S3 client: enough for every request that can be
+            in flight at once, across all listings sharing the clients.
+        """
+        self._clients.SetMaxConnections(connections)
+
+    def SetPrefetch(self, depth: int):
+        """ Fetch up to `depth` pages ahead of the printer. 0 to fetch each page when needed. """
+        if (depth < 0):
+            raise ValueError("Given prefetch depth ({}) for SetPrefetch is invalid.".format(depth))
+        self._prefetch = depth
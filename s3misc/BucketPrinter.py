@@ -1,65 +1,20 @@
 
 import sys
-import fnmatch
-import boto3
-from typing import List
+import time
 import datetime
-
-from s3misc.auth import AuthInfo
-
-bucket_units = ['B', 'KB', 'MB', 'GB', 'TB', 'PB']
-
-def foursigfloat(num: int, units: List[str]):
-    """ Convert a number to four significant digits, given base-2 set of units.
-        Breaks down at 1PB.
+import itertools
+
+from s3misc.units import foursigfloat, bucket_units
+from s3misc.OutputSinks import OutputSink, TextSink
+from s3misc.BucketLister import BucketLister
+from s3misc.DirectoryStack import DirStats, DirectoryStack
+from s3misc.TopN import TopN
+from s3misc.GlobMatcher import LiteralPrefix
+
+class BucketPrinter(BucketLister):
+    """ A BucketLister that prints its listings, through an OutputSink: every object,
+        directory totals, or rankings of the largest objects and directories.
     """
-    # Presumably three ifs are faster than one logarithm
-    if (num >= (1 << 20)):
-        if (num >= (1 << 30)):
-            if (num >= (1 << 40)):
-                if (num > (1 << 50)):
-                    # PB: TB with no decimal, more than three whole numbers.
-                    return ('{:.0f}'.format(num / (1 << 40)) + " " + units[4])
-                else:
-                    # TB with at least one decimal.
-                    numstring = numstring[0:max(numstring.find('.'),  + 2)]
-                return (('{:.0f}'.format(num / (1 << 40)))[0:5] + " " + units[4])
-            else: # < 1TB
-                return (('{:1.3f}'.format(num / (1 << 30)))[0:5] + " " + units[3])
-        else: # < 1GB
-            return (('{:1.3f}'.format(num / (1 << 20)))[0:5] + " " + units[2])
-    else: # < 1MB
-        if (num >= (1 << 10)):
-            return (('{:1.3f}'.format(num / (1 << 10)))[0:5] + " " + units[1])
-        else:
-            return ((str(num))[0:5] + " " + units[0])
-
-
-
-
-class BucketPrinter:
-    # Authentication for the bucket. Should come from ~/.aws/credentials, or from
-    # command line.
-    _auth = None
-
-    # One client for the bucket printer, configured by __init__.
-    _s3client = None
-
-    # The actual wildcard matching data. The whole path-to-file given by the user.
-    _match = None
-
-    # Match info - a caching mechanism.
-    # Call PrintBucket, calls GetMatchPrefix, which sets _matchinfo. Used by KeyMatch.
-    _matchinfo = None
-
-    # Only for listing directories
-    _recursive = True
-
-    # If supplied via command line
-    _auth = None
-
-    # Path delimiter, if any
-    _delim = None
 
     # User-specified block size
     _blocksize = -1
@@ -67,349 +22,274 @@ class BucketPrinter:
     # Totals for each directory? or only the whole listing?
     _dirtotals = False
 
-    def __init__(self, authinfo: AuthInfo):
-        """ Authinfo may be none. If it is, we'll try parsing it from ~/.aws/credentials. """
-        if (authinfo is not None):
-            self._auth = authinfo
+    # Summaries: print only totals, for directories at most this deep (the bucket is
+    # depth 0). -1 prints everything.
+    _printdepth = -1
 
-        self.InitClient()
+    # Where the listing goes. Text on stdout unless SetSink is called.
+    _sink = None
 
+    # Rank only the largest objects, and the heaviest directories (by total size), this
+    # many of each, instead of printing objects. 0 for no ranking.
+    _topobjects = 0
+    _topdirs = 0
 
-    def InitClient(self):
-        params = dict()
-        if (self._auth is not None):
-            params['aws_access_key_id'] = self._auth.access_key
-            params['aws_secret_access_key'] = self._auth.secret_key
+    # This listing's rankings (TopN), when ranking.
+    _objectranks = None
+    _dirranks = None
 
-        print("Setting self._s3client")
-        self._s3client = boto3.client('s3', **params)
+    # Estimate each listing's totals from at most this many list requests, instead of
+    # listing it. 0 lists everything.
+    _estimate = 0
 
-    def SetAuthInfo(self, authinfo: AuthInfo):
-        # Allows you to change auth info later.
-        self._auth = authinfo
-        self.InitClient()
+    # Standard deviations each side of an estimate: a 95% confidence interval.
+    _estimatez = 1.96
 
-    def PrintBucket(self, bucket: str, delim: str, match: str, recursive = True):
+    def Clone(self) -> 'BucketPrinter':
+        """ Another printer with the same settings and the same S3 client, for listing
+            on another thread. It has no sink until SetSink is called.
+        """
+        clone = super().Clone()
+        clone._sink = None
+        return clone
+
+    def PrintBucket(self, bucket: str, delim: str, match: str, recursive = True) -> DirStats:
         """
         Parse and print a bucket. See ParseBucket.
+        Returns the totals for the whole listing (the bucket's DirStats).
         """
 
-        self._delim = delim
-        self._match = match
-        self._bucket = bucket
+        if (self._estimate > 0):
+            return self.PrintEstimate(bucket, delim, match)
+
+        self.SetListing(bucket, delim, match, recursive)
+
+        if (self._sink is None):
+            self._sink = TextSink(sys.stdout.buffer)
+        self._sink.Begin(bucket, delim, match, self._blocksize,
+                         self._dirtotals or self._printdepth > 0)
 
-        print("Printing bucket: {}, delim: {}, match: {}".format(bucket, delim, match))
+        if (self._stats is not None):
+            began = time.perf_counter()
+            before = dict(self._stats.ThreadTimes())
 
-        # reset this every listing
-        if (recursive):
-            self._recursive = True
-        else:
-            self._recursive = False
+        self._objectranks = TopN(self._topobjects) if (self._topobjects > 0) else None
+        self._dirranks = TopN(self._topdirs) if (self._topdirs > 0) else None
+        self._resume = None
+        if (self._checkpoint is not None):
+            self._resume = self.LoadCheckpoint()
 
         # Statistics: items in this dir (directly), size of this dir (directly),
         #    items in this dir and subdirs, size in this dir and subdirs
-        self.PrintItems(self.ParseBucket(bucket))
+        totals = self.PrintItems(self.ParseBucket(bucket))
+
+        if (self._objectranks is not None):
+            self._sink.TopObjects(self._objectranks.Ranked())
+        if (self._dirranks is not None):
+            self._sink.TopDirectories(self._dirranks.Ranked())
+        self._sink.End()
+
+        if (self._checkpoint is not None):
+            self._checkpoint.Remove()
+            self._resume = None
+
+        if (self._stats is not None):
+            self._stats.Listing(time.perf_counter() - began, before)
+        return totals
 
         # Done. Summarize total.
         #print("{} directory objects; {} directory size\n".format(dir_items, foursigfloat(dir_size)))
         #print("{} total objects; {} total size\n".format(dir_items, foursigfloat(dir_size)))
 
-    def PrintItems(self, items):
-        dirstats = dict()
-
-        prevdir = ''
-        prevlen = -1
+    def PrintPartials(self, partials: list) -> DirStats:
+        """ Print the totals of a listing from Partials that cover it, as PrintBucket
+            would have printed them without the objects. Returns the totals.
+        """
+        from s3misc.Partial import OrderPartials, MergeRanks
+
+        partials = OrderPartials(partials)
+        (bucket, delim, match, recursive, depth, filtersettings) = partials[0].listing
+        self.SetListing(bucket, delim, match, recursive)
+
+        if (self._sink is None):
+            self._sink = TextSink(sys.stdout.buffer)
+        self._sink.Begin(bucket, delim, match, self._blocksize,
+                         self._dirtotals or self._printdepth > 0)
+
+        self._objectranks = MergeRanks(partials, self._topobjects) if (self._topobjects > 0) else None
+        self._dirranks = TopN(self._topdirs) if (self._topdirs > 0) else None
+        self._resume = None
+        fragments = itertools.chain.from_iterable(partial.fragments for partial in partials)
+        totals = self.AccountFragments(fragments, self.WrapUpDirectory)
+
+        if (self._objectranks is not None):
+            self._sink.TopObjects(self._objectranks.Ranked())
+        if (self._dirranks is not None):
+            self._sink.TopDirectories(self._dirranks.Ranked())
+        self._sink.End()
+        return totals
+
+    def PrintEstimate(self, bucket: str, delim: str, match: str) -> DirStats:
+        """ Print estimated totals for each top-level directory under the prefix match,
+            from at most SetEstimate's budget of requests (see KeyRangeEstimator).
+            Returns the estimated totals, rounded, in the subdirectory fields.
+        """
+        from s3misc.Estimator import KeyRangeEstimator
+
+        prefix = match or ''
+        if (LiteralPrefix(prefix) != prefix):
+            raise ValueError("Estimates are of a prefix, not of a pattern: {}".format(match))
+        if (self._filter is not None):
+            raise ValueError("Estimates are of everything under a prefix, not of filtered objects")
+
+        if (self._sink is None):
+            self._sink = TextSink(sys.stdout.buffer)
+        self._sink.Begin(bucket, delim, match, self._blocksize, False)
+        estimator = KeyRangeEstimator(self.Client(bucket), bucket, prefix, delim, self._estimate)
+        (rows, total) = estimator.Run()
+        self._sink.EstimatedTotals(rows, total, self._estimatez, estimator.requests, self._estimate)
+        self._sink.End()
+
+        totals = DirStats('')
+        totals.subobjects = round(total.objects)
+        totals.subsize = round(total.size)
+        totals.latest = total.latest
+        return totals
+
+    def PrintItems(self, items) -> DirStats:
+        sink = self._sink
+
+        # Summaries (and rankings) skip everything per-object but the accounting.
+        objectranks = self._objectranks
+        printobjects = (self._printdepth < 0 and objectranks is None and self._dirranks is None)
+
+        if (not printobjects and objectranks is None):
+            # Nothing to do per object but count it.
+            return self.Account(items, self.WrapUpDirectory)
+
+        # Stats for the directories on the current path. Each one is wrapped up as the
+        # listing leaves it.
+        dirstack = self.StartAccounting(self.WrapUpDirectory)
+
+        # Ages are as of the start of the listing.
+        histograms = self._histograms
+        now = self._now
+
+        prevdir = None
+        prevlen = 0
         nextlen = 0
         nextdir = None
-        stats = [0, 0, 0, 0, None]
+        stats = dirstack.Top()
+        if (self._resume is not None):
+            # Carrying on in the directory the checkpoint was in: its header is out.
+            prevdir = stats.path
+            prevlen = len(prevdir)
 
         for item in items:
-            boolnew = False
-            nextlen = item['Key'].rfind(self._delim) + 1
+            subdir = ('CommonPrefix' in item)
+            if (subdir):
+                # A subdirectory entry belongs to its parent directory.
+                nextlen = item['Key'].rfind(self._delim, 0, len(item['Key']) - len(self._delim)) + 1
+            else:
+                nextlen = item['Key'].rfind(self._delim) + 1
             nextdir = item['Key'][0:nextlen]
 
-            if (nextdir[0:prevlen] != prevdir):
-                # Then we have just exited a directory.
-
-                # Subtotals now include the just-completed directory
-                self.DirectoryAccounting(dirstats, prevdir, stats)
-
-                # Print out subtotals.
-                if (self._dirtotals):
-                    self.WrapUpDirectory(dirstats, prevdir, nextdir)
+            if (nextdir != prevdir):
+                # A new directory, a new subdirectory, or back in a parent directory
+                # whose stats we're still collecting. Directories we've left are done.
+                stats = dirstack.Enter(nextdir)
 
-                # this is a new directory. Create fresh stats.
-                dirstats[nextdir] = [0, 0, 0, 0, None]
-                stats = dirstats[nextdir]
-
-                boolnew = True
-            elif (nextlen > prevlen):
-                # Then we have a new subdirectory.
-                dirstats[nextdir] = [0, 0, 0, 0, None]
-                stats = dirstats[nextdir]
-                boolnew = True
-
-            if (boolnew == True):
-                boolnew = False
                 prevdir = nextdir
                 prevlen = nextlen
                 # Header for the new directory
-                print()
-                print(item['Key'][0:nextlen] + ":")
-
-            # this array was simpler when I started, but I didn't want to change it to dict:
-            # 0: number of files in current directory
-            # 1: size of current directory
-            # 2: number of files in subdirectories
-            # 3: size of files in subdirs
-            # 4: greatest date in this directory (or subdirs)
-            stats[0] = stats[0] + 1
-            stats[1] = stats[1] + item['Size']
-            stats[4] = max(stats[4], item['LastModified']) if (stats[4]) else item['LastModified']
-
-            keyname = item['Key'][prevlen:]
-            if (len(keyname) == 0):
-                keyname = "<directory object>"
-            # size.1 GB 2020-05-22: MyEntry.txt
-            lastmod = item['LastModified'].strftime('%Y-%m-%d %H:%M:%S')
-            if (self._blocksize == -1):
-                itemsize = foursigfloat(item['Size'], bucket_units)
-            else:
-                itemsize = '{:0.0f} blocks'.format(item['Size'] / self._blocksize)
-            print("{} {}: {}".format(itemsize, lastmod, keyname))
-
-        # We've exhausted all directories.
-
-        # Finish accounting for all of the last directories
-        finaldir = prevdir
-        while (prevdir != ''):
-            self.DirectoryAccounting(dirstats, prevdir, stats)
-            idx = prevdir.rfind(self._delim, 0, -1) + 1
-            prevdir = prevdir[0:idx]
-
-        self.WrapUpDirectory(dirstats, finaldir, '')
-        
-    def ParseBucket(self, bucket: str):
-        """ Get and process a list of objects from a bucket.
-
-        `match` may be None. If specified, any portion before the first wildcard is the prefix,
-        and wildcards will not match delimiters.
-
-        e.g.:
-            match: my/files/myf*
-            matches:
-            - my/files/myfiles
-            - my/files/myfamily
-            no match:
-            - my/files/myfamily/tree
-            - my/files/myfunny/stuff
-
-            match: 
+                if (printobjects):
+                    sink.Directory(nextdir)
+
+            if (subdir):
+                # Not an object: nothing to count.
+                if (printobjects):
+                    sink.Subdirectory(item, item['Key'][prevlen:])
+                continue
+
+            stats.objects = stats.objects + 1
+            stats.size = stats.size + item['Size']
+            lastmod = item['LastModified']
+            if (stats.latest is None or lastmod > stats.latest):
+                stats.latest = lastmod
+            if (histograms):
+                stats.histogram.Add(item['Size'], (now - lastmod.timestamp()) / 86400)
+
+            if (printobjects):
+                sink.Object(item, item['Key'][prevlen:])
+            elif (objectranks is not None):
+                objectranks.Add(item['Size'], item)
+
+        # We've exhausted all directories. Finish the last ones, and the bucket.
+        return dirstack.Finish()
+
+    def WrapUpDirectory(self, stats: DirStats):
+        """ A directory is finished: the listing has moved past it, and its subdirectory
+            totals are complete. Report it, if it isn't too deep, and rank it.
         """
+        if (self._dirranks is not None and stats.path != ''):
+            self._dirranks.Add(stats.size + stats.subsize, stats)
+
+        if (self._printdepth < 0 or stats.path.count(self._delim) <= self._printdepth):
+            # The sink decides what of this to show.
+            self._sink.DirectoryTotals(stats)
+
+    def ListingSettings(self) -> tuple:
+        return super().ListingSettings() + (self._printdepth, self._topobjects, self._topdirs)
+
+    def CheckpointState(self, lastkey: str, token: str) -> dict:
+        state = super().CheckpointState(lastkey, token)
+        # Everything up to lastkey is in the output: where it ends is where a resumed
+        # listing's output carries on from.
+        state['output'] = self._sink.Offset()
+        state['objectranks'] = self._objectranks
+        state['dirranks'] = self._dirranks
+        return state
+
+    def LoadCheckpoint(self):
+        state = super().LoadCheckpoint()
+        if (state is not None):
+            self._objectranks = state['objectranks']
+            self._dirranks = state['dirranks']
+        return state
 
-        params = {
-                'Bucket': bucket,
-                'MaxKeys': 1000 # server-side limit: 1000
-        }
-
+    def SetDirectoryTotals(self, totals: bool):
+        """ Whether to show totals at the end of each directory or only at the end of the listing """
+        self._dirtotals = totals
 
-        # Prefix is the non-wild patch of the matching clause
-        prefix = self.BucketMatch(self._match)
-        if (prefix is not None):
-            params['Prefix'] = prefix
-            
-        # For hints, we're going to use pagination.
-        paginator = self._s3client.get_paginator('list_objects_v2')
-        paginator = paginator.paginate(**params)
-
-        for page in paginator:
-            for item in page['Contents']:
-                if (not self.KeyMatch(item['Key'])):
-                    # Don't return non-matching objects
-                    continue
-
-                yield item
-
-    def BucketMatch(self, match):
-        """ 
-            Configure the bucket matching parameter.
-            Will return the prefix portion of the match (the part before any wildcards),
-            and store various match info for the KeyMatch method.
+    def SetPrintDepth(self, depth: int):
+        """ Print only directory totals, for directories down to the given depth. The bucket
+            is depth 0, `dir/` is depth 1, and so on. -1 to print every object again.
         """
-
-        if (match is None):
-            self._matchinfo = None
-            return None
-
-        # Some processing required. Cache it.
-        matchprefixlen = -1
-        matchprefix = None
-        matchwild = None
-        if (match):
-            for wildmatcher in ('*', '?', '['):
-                idx = match.find(wildmatcher)
-                if (idx > -1 and (matchprefixlen < 0 or idx < matchprefixlen)):
-                    matchprefix = match[0:idx]
-                    matchwild = match[idx:]
-
-        if (matchprefix is None):
-            # No wild characters, then the whole thing will be a prefix.
-            matchprefix = match
-            matchwild = ''
-
-        self._matchinfo = [ len(matchprefix), matchwild ]
-
-        return matchprefix
-
-
-    def KeyMatch(self, key:str):
-        """ Given a key, does it match the given match?
-
-            e.g.:
-            /buc/ket/stuff, /buc/ket/stuff* -> matches
-            /buc/ket/stuff/1, /buc/ket/stuff* -> does not match
-            /buc/ket/stuffy, /buc/ket/stuff* -> matches
-            /buc/ket/stuft, /buc/ket/stuf? -> matches
-            /buc/ket/stuff/, /buc/ket/stuff -> matches (if recursive)
-            /buc/ket/stuff/subfile, /buc/ket/stuff -> matches (if recursive)
-            /buc/ket/stuff/subfile, /buc/ket/stuff/ -> matches (if recursive)
+        if (depth < -1):
+            raise ValueError("Given depth ({}) for SetPrintDepth is invalid.".format(depth))
+        self._printdepth = depth
+
+    def SetTop(self, objects: int, dirs: int):
+        """ Instead of printing objects, print the `objects` largest objects and the `dirs`
+            directories with the most bytes under them, after each listing's totals.
+            0 leaves out that ranking; 0 for both goes back to printing objects.
         """
-
-        # If not using a match condition, then everything matches.
-        if (self._matchinfo is None):
-            return True
-
-        # matchinfo[prefix-length, wild-part]
-        matchinfo = self._matchinfo
-
-        # Does the prefix match? Yes, of course it does, by definition...
-        matchmaybe = key[matchinfo[0]:]
-
-        if (len(matchinfo[1]) == 0):
-            # No wilds, this is a prefix match.
-            # Is it a directory?
-            if (key[matchinfo[0] - 1] == self._delim):
-                # Delimiter included in prefix
-                return (self._recursive or (matchmaybe.find(self._delim) < 0))
-
-            if (matchmaybe[0] == self._delim):
-                # Given on the command line was a directory without the delimiter;
-                matchmaybe = matchmaybe[1:]
-
-            if (len(matchmaybe) == 0 or self._recursive or matchmaybe.find(self._delim) < 0):
-                # We're a directory, we're recursing, or we don't have another delimiter
-                return True
-
-            # Else, there's no wild portion, matchmaybe doesn't start with a delimiter,
-            # (or we aren't recursing and there's another one).
-            # Then either we have a delimiter where we shouldn't or we have text instead of a
-            # delimiter. Stop.
-            return False
-
-        # Else, we have a wild match portion.
-
-        # We're not matching through delimiters, so false if there is one.
-        if (matchmaybe.find(self._delim) >= 0):
-            return False
-
-        # Lastly, does this object actually match the wild portion?
-        return fnmatch.fnmatch(matchmaybe, matchinfo[1])
-
-    def DirectoryAccounting(self, dirstats: dict, curdir: str, stats: List[int]):
-        """ Subtotal accounting: for each item in the path, add this directory's stats to
-        its parent.
+        if (objects < 0 or dirs < 0):
+            raise ValueError("Given counts ({}, {}) for SetTop are invalid.".format(objects, dirs))
+        self._topobjects = objects
+        self._topdirs = dirs
+
+    def SetEstimate(self, budget: int):
+        """ Instead of listing, estimate totals per top-level directory from at most
+            budget list requests (more requests, narrower intervals). 0 to list again.
         """
-                    
-        if (curdir not in dirstats):
-            # First time seeing this directory
-            dirstats[curdir] = stats
-
-        parentstats = None
-        while (curdir != '' and curdir is not None):
-            parentidx = curdir.rfind(self._delim, 0, len(curdir) - 1) + 1
-            curdir = curdir[0:parentidx]
-
-            if (curdir not in dirstats):
-                # If parent dir contained no other files/directories (or they occur after curdir)
-                dirstats[curdir] = [0,0,0,0,None]
-            parentstats = dirstats[curdir]
-
-            # Add the objects and size to each parent directory
-            parentstats[2] = parentstats[2] + stats[0]
-            parentstats[3] = parentstats[3] + stats[1]
-
-            # Last modified
-            parentstats[4] = max(parentstats[4], stats[4]) if (parentstats[4]) else stats[4]
-
-    def WrapUpDirectory(self, dirstats: dict, prevdir: str, nextdir: str):
-        """ When you've encountered an item that is no longer within the current directory,
-            we need to wrap up the current directory, print its subtotals, and check to
-            see if we need to do likewise with the previous directory's parent, and parent's
-            parent as well.
-
-            prevdir: the previous directory that you were working with.
-            nextdir: the next directory that you will work with (not file).
-            lastitem: if there is no "next item" and this is the end of the bucket.
-            """
-
-        # Because we're working with directories and not files, we can't prune the file from the directory
-        # first. We need a "do while".
-        bucketsummary = False
-        if (nextdir == ''):
-            bucketsummary = True
-
-        # Is this a subdir of the previous directory? or should we subtotals the directory?
-        while (prevdir != nextdir[0:len(prevdir)] or bucketsummary):
-            prevdirstats = dirstats[prevdir]
-
-            if (prevdir == ''):
-                # We're in the last stage! Do-while, last loop through.
-                bucketsummary = False
-
-            # end-of-bucket impacts us here, too. If not printing out directory totals,
-            # only print out subdirectory stats.
-            if (prevdir != '' and self._dirtotals):
-                if (self._blocksize == -1):
-                    blocks = foursigfloat(prevdirstats[1], bucket_units)
-                else:
-                    blocks = "{} blocks".format(prevdirstats[1] / self._blocksize)
-
-                print(prevdir + " totals:")
-                print("{} directory objects; {} directory size".format(prevdirstats[0], blocks))
-
-            # If there were sub directories, print out subtotals
-            if (prevdirstats[2] > 0):
-                if (self._blocksize == -1):
-                    blocks = foursigfloat(prevdirstats[3], bucket_units)
-                else:
-                    blocks = "{} blocks".format(prevdirstats[3] / self._blocksize)
-
-                if (prevdir == ''):
-                    print()
-                dirorbucket = 'subdirectory' if (prevdir != '') else 'bucket'
-                print("    {} total {} objects; {} total subdirectory size".format(
-                                    prevdirstats[2], dirorbucket, blocks))
-
-            if (self._dirtotals or prevdir == ''):
-                print("    Latest modification: {}".format(prevdirstats[4]))
-
-            # keep our active directory count down.
-            if (prevdir != ''):
-                del dirstats[prevdir]
-            else:
-                break
-
-            # Next-previous, if the next->item is not within the previous dir's parent.
-            idx = prevdir.rfind(self._delim, 0, len(prevdir) - 1)
-            if (idx >= 0):
-                prevdir = prevdir[0:idx + 1]
-            else:
-                prevdir = ''
-            
+        if (budget < 0):
+            raise ValueError("Given budget ({}) for SetEstimate is invalid.".format(budget))
+        self._estimate = budget
 
-    def SetDirectoryTotals(self, totals: bool):
-        """ Whether to show totals at the end of each directory or only at the end of the listing """
-        self._dirtotals = totals
+    def SetSink(self, sink: OutputSink):
+        """ Send listings to the given sink (see OutputSinks) instead of text on stdout. """
+        self._sink = sink
 
     def SetBlockSize(self, size: int):
         if (size <= 0 and size != -1):
@@ -424,61 +304,51 @@ class BucketPrinter:
 
         self._delim = '/'
 
-        dirstats = dict( {
-                '/test/ing/123/': [0,0,0,0, datetime.datetime.min],
-                '/test/ing/456/': [0,0,0,0, datetime.datetime.min],
-                '/test/ing/': [0,0,0,0, datetime.datetime.min],
-                '/test/': [0,0,0,0, datetime.datetime.min],
-                '/': [0,0,0,0, datetime.datetime.min]
-            })
-        stats = dirstats['/test/ing/123/']
-        stats[0] = stats[0] + 1
-        stats[1] = stats[1] + 1
-        self.DirectoryAccounting(dirstats, '/test/ing/123/', stats)
-        stats = dirstats['/test/ing/456/']
-        stats[0] = stats[0] + 2
-        stats[1] = stats[1] + 3
-        self.DirectoryAccounting(dirstats, '/test/ing/456/', stats)
-        stats = dirstats['/test/ing/']
-        stats[0] = stats[0] + 1
-        stats[1] = stats[1] + 3
-        self.DirectoryAccounting(dirstats, '/test/ing/', stats)
-        stats = dirstats['/test/']
-        stats[0] = stats[0] + 1
-        stats[1] = stats[1] + 1
-        self.DirectoryAccounting(dirstats, '/test/', stats)
-        stats = dirstats['/']
-        stats[0] = stats[0] + 1
-        stats[1] = stats[1] + 1
-        self.DirectoryAccounting(dirstats, '/', stats)
-        assert(list(dirstats['/test/ing/'][0:4]) == list((1,3,3,4)))
-        assert(list(dirstats['/'][0:4]) == list((1,1,5,8)))
-        dirstats = dict({
-                 'test/ing/123/': [0,0,0,0, datetime.datetime.min],
-                 'test/ing/456/': [0,0,0,0, datetime.datetime.min],
-                 'test/ing/': [0,0,0,0, datetime.datetime.min],
-                 'test/': [0,0,0,0, datetime.datetime.min]
-            })
-        stats = dirstats['test/ing/123/']
-        stats[0] = stats[0] + 1
-        stats[1] = stats[1] + 1
-        self.DirectoryAccounting(dirstats, 'test/ing/123/', stats)
-        stats = dirstats['test/ing/456/']
-        stats[0] = stats[0] + 2
-        stats[1] = stats[1] + 3
-        self.DirectoryAccounting(dirstats, 'test/ing/456/', stats)
-        stats = dirstats['test/ing/']
-        stats[0] = stats[0] + 1
-        stats[1] = stats[1] + 3
-        self.DirectoryAccounting(dirstats, 'test/ing/', stats)
-        stats = dirstats['test/']
-        stats[0] = stats[0] + 1
-        stats[1] = stats[1] + 1
-        self.DirectoryAccounting(dirstats, 'test/', stats)
-        assert(list(dirstats['test/ing/'][0:4]) == list((1,3,3,4)))
-        assert(list(dirstats[''][0:4]) == list((0,0,5,8)))
-        dirstats = dict()
-        self.DirectoryAccounting(dirstats, 'test/', [1,1,0,0,datetime.datetime.min]) 
+        finished = dict()
+        def keep(stats):
+            finished[stats.path] = stats
+
+        dirstack = DirectoryStack(self._delim, keep)
+        stats = dirstack.Enter('/test/ing/123/')
+        stats.objects = stats.objects + 1
+        stats.size = stats.size + 1
+        stats = dirstack.Enter('/test/ing/456/')
+        stats.objects = stats.objects + 2
+        stats.size = stats.size + 3
+        stats = dirstack.Enter('/test/ing/')
+        stats.objects = stats.objects + 1
+        stats.size = stats.size + 3
+        stats = dirstack.Enter('/test/')
+        stats.objects = stats.objects + 1
+        stats.size = stats.size + 1
+        stats = dirstack.Enter('/')
+        stats.objects = stats.objects + 1
+        stats.size = stats.size + 1
+        dirstack.Finish()
+        stats = finished['/test/ing/']
+        assert((stats.objects, stats.size, stats.subobjects, stats.subsize) == (1,3,3,4))
+        stats = finished['/']
+        assert((stats.objects, stats.size, stats.subobjects, stats.subsize) == (1,1,5,8))
+
+        finished = dict()
+        dirstack = DirectoryStack(self._delim, keep)
+        stats = dirstack.Enter('test/ing/123/')
+        stats.objects = stats.objects + 1
+        stats.size = stats.size + 1
+        stats = dirstack.Enter('test/ing/456/')
+        stats.objects = stats.objects + 2
+        stats.size = stats.size + 3
+        stats = dirstack.Enter('test/ing/')
+        stats.objects = stats.objects + 1
+        stats.size = stats.size + 3
+        stats = dirstack.Enter('test/')
+        stats.objects = stats.objects + 1
+        stats.size = stats.size + 1
+        dirstack.Finish()
+        stats = finished['test/ing/']
+        assert((stats.objects, stats.size, stats.subobjects, stats.subsize) == (1,3,3,4))
+        stats = finished['']
+        assert((stats.objects, stats.size, stats.subobjects, stats.subsize) == (0,0,5,8))
 
         assert(self.BucketMatch('/test/ing/123') == '/test/ing/123')
         assert(self.BucketMatch('/test/ing/123?') == '/test/ing/123')
@@ -553,4 +423,3 @@ class BucketPrinter:
         self.PrintItems(genlist())
 
         sys.exit(0)
-
@@ -0,0 +1,120 @@
+
+import os
+import time
+import pickle
+
+# Format version of checkpoint files.
+checkpoint_version = 1
+
+def ResumePages(pages, lastkey: str):
+    """ Pass pages through, leaving out every entry up to and including lastkey. For
+        sources that don't take a StartAfter, and listings (by delimiter) that can hand
+        back a subdirectory that was already listed.
+    """
+    pages = iter(pages)
+    for page in pages:
+        contents = page.get('Contents', ())
+        if (len(contents) == 0 or contents[-1]['Key'] <= lastkey):
+            continue
+        if (contents[0]['Key'] <= lastkey):
+            page = dict(page)
+            page['Contents'] = [item for item in contents if (item['Key'] > lastkey)]
+        yield page
+        break
+    # Past it: the rest goes straight through.
+    yield from pages
+
+def EndPages(pages, highkey: str):
+    """ Pass pages through up to highkey: entries after it are left out, and the listing
+        stops at the first page that has any.
+    """
+    for page in pages:
+        contents = page.get('Contents', ())
+        if (len(contents) == 0 or contents[-1]['Key'] <= highkey):
+            yield page
+            continue
+        page = dict(page)
+        page['Contents'] = [item for item in contents if (item['Key'] <= highkey)]
+        yield page
+        return
+
+
+class Checkpoint:
+    """ Where a listing has got to, saved every so often so that it can be resumed.
+
+        A checkpoint is taken between pages, when every entry up to the last key of a
+        page has been matched, accounted and handed to the sink, and nothing after it
+        has. It holds that key, S3's continuation token for the next page, how far
+        into the output the sink had got, and the state of the accounting: the
+        DirectoryStack (the directories on the current path, with their running
+        totals) and any rankings. Resuming lists from the next page on and carries on
+        accounting from there, so the totals come out as if the listing had never
+        stopped; output written after the checkpoint is cut off and written again.
+
+        The file is written whole and renamed into place, so a crash while saving
+        leaves the previous checkpoint. It is a pickle: only resume from checkpoints
+        you saved yourself.
+    """
+
+    def __init__(self, path: str, interval: float = 60.0, resume: bool = False):
+        """ interval: seconds between checkpoints. resume: carry on from the checkpoint
+            already in path, if there is one; otherwise it is overwritten.
+        """
+        if (interval < 0):
+            raise ValueError("Given interval ({}) for Checkpoint is invalid.".format(interval))
+        self._path = path
+        self._interval = interval
+        self._resume = resume
+        self._saved = time.monotonic()
+
+    def Load(self):
+        """ The saved state, or None if there is no checkpoint (or it isn't wanted). """
+        if (not self._resume):
+            return None
+        try:
+            with open(self._path, 'rb') as checkpointfile:
+                state = pickle.load(checkpointfile)
+        except FileNotFoundError:
+            return None
+        if (not isinstance(state, dict) or state.get('version') != checkpoint_version):
+            raise ValueError("{} is not a checkpoint that can be resumed from".format(self._path))
+        return state
+
+    def Save(self, state: dict):
+        state = dict(state)
+        state['version'] = checkpoint_version
+        temppath = "{}.{}".format(self._path, os.getpid())
+        with open(temppath, 'wb') as checkpointfile:
+            pickle.dump(state, checkpointfile, pickle.HIGHEST_PROTOCOL)
+            checkpointfile.flush()
+            os.fsync(checkpointfile.fileno())
+        os.replace(temppath, self._path)
+        self._saved = time.monotonic()
+
+    def Remove(self):
+        """ The listing is done: nothing to resume. """
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+
+    def TrackPages(self, pages, state):
+        """ Pass pages through, saving a checkpoint every interval. The consumer is done
+            with a page once it asks for the next one; then state(lastkey, token) gives
+            what to save, lastkey being the page's last key and token the continuation
+            token for the page after it (None if there isn't one).
+        """
+        lastkey = None
+        token = None
+        for page in pages:
+            if (lastkey is not None and time.monotonic() - self._saved >= self._interval):
+                self.Save(state(lastkey, token))
+
+            contents = page.get('Contents', ())
+            if (len(contents) > 0):
+                lastkey = contents[-1]['Key']
+                token = page.get('NextContinuationToken')
+            else:
+                # The token doesn't go with lastkey any more.
+                token = None
+            yield page
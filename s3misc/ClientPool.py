@@ -0,0 +1,190 @@
+
+import os
+import json
+import threading
+
+from s3misc.auth import AuthInfo
+from s3misc.RequestScheduler import RequestScheduler, ScheduledClient
+from s3misc.ListParser import RawListClient
+
+def RegionCachePath() -> str:
+    """ Where bucket regions are remembered between runs. """
+    cachedir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cachedir, 'tagtag', 'bucket-regions.json')
+
+class ClientPool:
+    """ S3 clients, one per region, each made the first time it's needed.
+
+        A bucket listed through a client for the wrong region costs a redirect (or a
+        retry) per request. So each bucket's region is looked up once, with a HeadBucket,
+        and remembered on disk; after that the bucket is listed through a client for its
+        own region. Clients are thread safe and are shared by every listing.
+
+        Nothing here imports boto3 until a client is actually wanted, so runs that never
+        talk to S3 (--help, snapshots, inventory reports) don't pay for it.
+    """
+
+    # Connections each client keeps open. boto3's default is 10.
+    _maxconnections = 10
+
+    def __init__(self, authinfo: AuthInfo, cachepath: str = None):
+        """ authinfo may be None, for the usual boto3 credential lookup. cachepath is the
+            region cache file; None for the default (see RegionCachePath), '' for none.
+        """
+        self._auth = authinfo
+        self._cachepath = RegionCachePath() if (cachepath is None) else cachepath
+        self._lock = threading.Lock()
+        self._session = None
+        self._clients = dict()
+        self._regions = None
+        self._stats = None
+        self._scheduler = None
+        self._rawlist = False
+        self._http = None
+
+    def Reset(self):
+        """ Forget the clients made so far, so new ones are made when needed: for a
+            forked process, whose parent's connections aren't its to use.
+        """
+        self._lock = threading.Lock()
+        self._session = None
+        self._clients = dict()
+        self._http = None
+
+    def SetMaxConnections(self, connections: int):
+        """ Connections per client, for clients not made yet: at least as many as there
+            are concurrent requests.
+        """
+        if (connections < 1):
+            raise ValueError("Given connection count ({}) for ClientPool is invalid.".format(connections))
+        self._maxconnections = connections
+
+    def SetScheduler(self, scheduler: RequestScheduler):
+        """ Pace and retry every listing request through scheduler, instead of leaving
+            retries to botocore. For clients not made yet. None to go back.
+        """
+        self._scheduler = scheduler
+
+    def SetRawList(self, rawlist: bool):
+        """ Whether to fetch and parse list pages without botocore (see RawListClient). """
+        self._rawlist = rawlist
+
+    def Http(self):
+        """ The urllib3 pool raw list requests go through, shared by every region. """
+        with self._lock:
+            if (self._http is None):
+                import urllib3
+
+                self._http = urllib3.PoolManager(maxsize=self._maxconnections,
+                                                 timeout=urllib3.Timeout(connect=60, read=60))
+            return self._http
+
+    def SetStats(self, stats):
+        """ Have every client's requests counted and timed by stats (a RunStats). """
+        with self._lock:
+            self._stats = stats
+            if (stats is not None):
+                for client in set(self._clients.values()):
+                    stats.Instrument(client)
+
+    def Session(self):
+        """ The boto3 session clients come from. Call with the lock held. """
+        if (self._session is None):
+            import boto3
+
+            params = dict()
+            if (self._auth is not None):
+                params['aws_access_key_id'] = self._auth.access_key
+                params['aws_secret_access_key'] = self._auth.secret_key
+            self._session = boto3.session.Session(**params)
+        return self._session
+
+    def RegionClient(self, region: str):
+        """ The client for region. None is the configured default region. """
+        with self._lock:
+            client = self._clients.get(region)
+            if (client is None):
+                from botocore.config import Config
+
+                session = self.Session()
+                if (self._scheduler is not None):
+                    # The scheduler retries; botocore retrying as well would hide throttling.
+                    retries = {'total_max_attempts': 1}
+                else:
+                    retries = {'mode': 'standard'}
+                config = Config(max_pool_connections=self._maxconnections, retries=retries)
+                client = session.client('s3', region_name=region, config=config)
+                if (self._stats is not None):
+                    self._stats.Instrument(client)
+                self._clients[region] = client
+                if (region is not None and region == session.region_name):
+                    # Same thing by another name.
+                    self._clients[None] = client
+                elif (region is None and client.meta.region_name is not None):
+                    self._clients[client.meta.region_name] = client
+            return client
+
+    def Client(self, bucket: str):
+        """ The client for bucket's region (raw, and scheduled, if set up so). """
+        client = self.RegionClient(self.BucketRegion(bucket))
+        if (self._rawlist):
+            client = RawListClient(client, self.Http(), self._stats)
+        if (self._scheduler is not None):
+            client = ScheduledClient(client, self._scheduler)
+        return client
+
+    def BucketRegion(self, bucket: str):
+        """ bucket's region, from the cache or from S3. None if it can't be found out;
+            the default client will have to do.
+        """
+        with self._lock:
+            if (self._regions is None):
+                self._regions = self.LoadRegions()
+            region = self._regions.get(bucket)
+        if (region is not None):
+            return region
+
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        # S3 says where a bucket is even when it won't say anything else about it.
+        try:
+            response = self.RegionClient(None).head_bucket(Bucket=bucket)
+        except ClientError as e:
+            response = e.response
+        except BotoCoreError:
+            return None
+        region = response.get('ResponseMetadata', {}).get('HTTPHeaders', {}).get('x-amz-bucket-region')
+        if (region is None):
+            return None
+
+        with self._lock:
+            self._regions[bucket] = region
+            self.SaveRegions()
+        return region
+
+    def LoadRegions(self) -> dict:
+        if (len(self._cachepath) == 0):
+            return dict()
+        try:
+            with open(self._cachepath, 'r') as cachefile:
+                regions = json.load(cachefile)
+        except (OSError, ValueError):
+            return dict()
+        if (not isinstance(regions, dict)):
+            return dict()
+        return regions
+
+    def SaveRegions(self):
+        """ Write the cache out, all at once so a reader never sees half of it. A cache
+            that can't be written is only a cache. Call with the lock held.
+        """
+        if (len(self._cachepath) == 0):
+            return
+        temppath = "{}.{}".format(self._cachepath, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self._cachepath), exist_ok=True)
+            with open(temppath, 'w') as cachefile:
+                json.dump(self._regions, cachefile, sort_keys=True)
+            os.replace(temppath, self._cachepath)
+        except OSError:
+            pass
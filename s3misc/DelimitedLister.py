@@ -0,0 +1,78 @@
+
+import heapq
+import operator
+
+def PrefixItem(prefix: str) -> dict:
+    """ A listing entry for a subdirectory that isn't descended into. Marked with
+        'CommonPrefix' so it isn't mistaken for (or counted as) an object.
+    """
+    return {'Key': prefix, 'Size': 0, 'LastModified': None, 'CommonPrefix': True}
+
+def CollapsePages(pages, prefix: str, delim: str, depth: int):
+    """ Client-side version of DelimitedLister, for sources that can't list by delimiter:
+        keys more than `depth` levels below prefix become one PrefixItem per subdirectory.
+    """
+    lastprefix = None
+    for page in pages:
+        contents = []
+        for item in page.get('Contents', ()):
+            key = item['Key']
+            idx = len(prefix)
+            for level in range(depth):
+                idx = key.find(delim, idx)
+                if (idx < 0):
+                    break
+                idx = idx + len(delim)
+
+            if (idx < 0):
+                contents.append(item)
+            elif (key[0:idx] != lastprefix):
+                # Keys are in order: everything under a subdirectory is together.
+                lastprefix = key[0:idx]
+                contents.append(PrefixItem(lastprefix))
+        yield {'Contents': contents}
+
+
+class DelimitedLister:
+    """ List `depth` levels of a bucket and no further, letting S3 do the work.
+
+        Each level is a list_objects_v2 with a Delimiter, so S3 returns one entry per
+        subdirectory (a CommonPrefix) instead of every key beneath it. Subdirectories
+        above the last level are listed in turn, in place; those at the last level are
+        returned as PrefixItems. Entries come back in lexical key order.
+    """
+
+    def __init__(self, s3client, delim: str, depth: int):
+        if (depth < 1):
+            raise ValueError("Given depth ({}) for DelimitedLister is invalid.".format(depth))
+        self._s3client = s3client
+        self._delim = delim
+        self._depth = depth
+
+    def ListPages(self, params: dict):
+        """ Generator of pages (dicts with 'Contents') for the given list_objects_v2
+            parameters, `depth` levels deep.
+        """
+        yield from self.ListLevel(params, params.get('Prefix', ''), 1)
+
+    def ListLevel(self, params: dict, prefix: str, level: int):
+        listparams = dict(params)
+        listparams['Prefix'] = prefix
+        listparams['Delimiter'] = self._delim
+        paginator = self._s3client.get_paginator('list_objects_v2')
+
+        for page in paginator.paginate(**listparams):
+            # Objects and subdirectories come back separately, each in order.
+            entries = heapq.merge(page.get('Contents', ()),
+                                  [PrefixItem(cp['Prefix']) for cp in page.get('CommonPrefixes', ())],
+                                  key=operator.itemgetter('Key'))
+            contents = []
+            for entry in entries:
+                if ('CommonPrefix' in entry and level < self._depth):
+                    # Everything beneath it goes here, before the next entry.
+                    yield {'Contents': contents}
+                    contents = []
+                    yield from self.ListLevel(params, entry['Key'], level + 1)
+                else:
+                    contents.append(entry)
+            yield {'Contents': contents}
@@ -0,0 +1,104 @@
+
+from s3misc.Histogram import Histogram
+
+class DirStats:
+    """ Totals for one directory: objects directly in it, objects in its subdirectories,
+        and the latest modification of any of them. Optionally, a Histogram of all of
+        them.
+    """
+    __slots__ = ('path', 'objects', 'size', 'subobjects', 'subsize', 'latest', 'histogram')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.objects = 0
+        self.size = 0
+        self.subobjects = 0
+        self.subsize = 0
+        self.latest = None
+        self.histogram = None
+
+    def AddTo(self, parent: 'DirStats'):
+        """ Roll this (finished) directory's totals into its parent's subdirectory totals. """
+        parent.subobjects = parent.subobjects + self.objects + self.subobjects
+        parent.subsize = parent.subsize + self.size + self.subsize
+        if (self.latest is not None and (parent.latest is None or self.latest > parent.latest)):
+            parent.latest = self.latest
+        if (self.histogram is not None and parent.histogram is not None):
+            parent.histogram.Merge(self.histogram)
+
+
+class DirectoryStack:
+    """ Directory accounting for a listing in key order.
+
+        Only the directories on the current path are kept, as a stack of DirStats from
+        the bucket ('') down. A directory can't come back once the listing has moved past
+        it, so it is finished when it is popped: its totals are added to its parent and
+        it is handed to `finished`. Memory is O(depth), and the work per object is O(1)
+        apart from entering and leaving directories.
+    """
+
+    def __init__(self, delim: str, finished, histograms: bool = False):
+        """ finished(stats: DirStats) is called for each directory as it is completed,
+            deepest first, the bucket last. histograms: give every directory's DirStats
+            a Histogram.
+        """
+        self._delim = delim
+        self._finished = finished
+        self._histograms = histograms
+        self._stack = [self.NewStats('')]
+
+    def NewStats(self, path: str) -> DirStats:
+        stats = DirStats(path)
+        if (self._histograms):
+            stats.histogram = Histogram()
+        return stats
+
+    def Top(self) -> DirStats:
+        return self._stack[-1]
+
+    def Stack(self) -> list:
+        """ The DirStats of the directories on the current path, the bucket first: all
+            there is to the state of the accounting, for a Checkpoint.
+        """
+        return self._stack
+
+    def Restore(self, stack: list):
+        """ Carry on from a Stack() saved earlier. """
+        self._stack = stack
+
+    def Enter(self, path: str) -> DirStats:
+        """ Move to directory path (which ends with the delimiter, or is ''). Finishes
+            the directories that path is not in, and starts any between. Returns path's
+            stats.
+        """
+        stack = self._stack
+        top = stack[-1]
+
+        # Leave the directories we're done with.
+        while (not path.startswith(top.path)):
+            stack.pop()
+            parent = stack[-1]
+            top.AddTo(parent)
+            self._finished(top)
+            top = parent
+
+        # Start the new ones, a level at a time.
+        idx = len(top.path)
+        while (idx < len(path)):
+            idx = path.find(self._delim, idx) + len(self._delim)
+            top = self.NewStats(path[0:idx])
+            stack.append(top)
+
+        return top
+
+    def Finish(self) -> DirStats:
+        """ End of the listing: finish every directory left, and the bucket. """
+        stack = self._stack
+        while (len(stack) > 1):
+            top = stack.pop()
+            top.AddTo(stack[-1])
+            self._finished(top)
+
+        root = stack.pop()
+        self._finished(root)
+        return root
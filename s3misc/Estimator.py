@@ -0,0 +1,362 @@
+
+import math
+import random
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Estimate:
+    """ Estimated objects and bytes of part of a listing, with the variance of each
+        estimate (0 when it was all listed), and what was actually seen of it.
+    """
+    __slots__ = ('path', 'objects', 'size', 'objectsvar', 'sizevar', 'seenobjects', 'seensize',
+                 'latest')
+
+    def __init__(self, path: str):
+        """ path: the directory, '' for everything estimated, None for directories that
+            weren't sampled.
+        """
+        self.path = path
+        self.objects = 0.0
+        self.size = 0.0
+        self.objectsvar = 0.0
+        self.sizevar = 0.0
+        self.seenobjects = 0
+        self.seensize = 0
+        self.latest = None
+
+    def Add(self, other: 'Estimate'):
+        """ Add an independent estimate of another part. """
+        self.objects = self.objects + other.objects
+        self.size = self.size + other.size
+        self.objectsvar = self.objectsvar + other.objectsvar
+        self.sizevar = self.sizevar + other.sizevar
+        self.seenobjects = self.seenobjects + other.seenobjects
+        self.seensize = self.seensize + other.seensize
+        if (other.latest is not None and (self.latest is None or other.latest > self.latest)):
+            self.latest = other.latest
+
+    def Exact(self) -> bool:
+        return (self.objectsvar == 0 and self.sizevar == 0)
+
+    def ObjectsInterval(self, z: float) -> tuple:
+        """ (low, high) for objects, z standard deviations each way; never below what
+            was seen.
+        """
+        spread = z * math.sqrt(self.objectsvar)
+        return (max(self.seenobjects, self.objects - spread), self.objects + spread)
+
+    def SizeInterval(self, z: float) -> tuple:
+        spread = z * math.sqrt(self.sizevar)
+        return (max(self.seensize, self.size - spread), self.size + spread)
+
+
+# Sorts after any character a key can have: StartAfter prefix + this skips every key
+# under prefix.
+last_char = '\U0010ffff'
+
+class KeyNode:
+    """ What the pages of a key range showed: the keys starting with prefix after
+        lowkey (None for all of them), taken apart by their next character. Keys
+        seen are counted; each child a page ended in has a part left to estimate, the
+        rest of the child after the last key seen of it.
+    """
+    __slots__ = ('seen', 'parts')
+
+    def __init__(self):
+        self.seen = Estimate(None)
+        # (prefix, lowkey) of each part.
+        self.parts = []
+
+
+class KeyRangeEstimator:
+    """ Estimates a listing's objects and bytes per top-level directory, from a budget
+        of list requests instead of listing everything.
+
+        The top level is listed by delimiter, so its directories (and the objects
+        directly in it) are known exactly. Each directory is then a key range, and
+        its keys a tree by character: a prefix's children are the prefixes one
+        character longer. A page of a prefix's keys ends partway through one of its
+        children; the next page skips the rest of that child (StartAfter), and so on,
+        so a prefix's pages count most of its keys and leave a few parts, one per
+        page, to estimate: what's left of each child a page ended in.
+
+        That's done the way Knuth estimated the size of a search tree: going down at
+        random, a part of each prefix at a time, and multiplying by how many parts
+        there were to choose from. Each path down gives an unbiased estimate of the
+        whole range; they're averaged, and their spread is the variance. Pages are
+        kept for later paths, so those mostly pay for the bottom of the tree, and a
+        range small enough to have been all seen comes out exact.
+
+        Directories get a first page first; what's left of the budget is shared
+        among the ones that need more. If there are more directories than requests,
+        the ones not sampled are estimated together from the ones that were.
+    """
+
+    # Most requests in flight at once.
+    _workers = 8
+
+    # Most paths down a directory's keys.
+    _maxpaths = 1000
+
+    def __init__(self, client, bucket: str, prefix: str, delim: str, budget: int, seed = None):
+        """ client: an S3 client to list with. budget: the most list requests to make. """
+        if (budget < 1):
+            raise ValueError("Given budget ({}) for KeyRangeEstimator is invalid.".format(budget))
+        self._client = client
+        self._bucket = bucket
+        self._prefix = prefix
+        self._delim = delim
+        self._budget = budget
+        self._random = random.Random(seed)
+        self.requests = 0
+
+    def Run(self) -> tuple:
+        """ Returns (rows, total): an Estimate for each top-level directory (and for the
+            objects directly under the prefix, its path being the prefix), and for
+            everything.
+        """
+        total = Estimate('')
+        (topdirs, direct, complete) = self.TopLevel()
+        if (not complete):
+            # Too wide to list the top level: one range it is.
+            (whole, used) = self.EstimateKeys(self._prefix, self._budget - self.requests, None, self._random)
+            self.requests = self.requests + used
+            whole.path = self._prefix
+            total.Add(whole)
+            return ([whole], total)
+
+        rows = []
+        if (direct.seenobjects > 0):
+            rows.append(direct)
+            total.Add(direct)
+
+        # A first page for as many directories as the budget allows.
+        budget = self._budget - self.requests
+        if (len(topdirs) > 0 and budget < 1):
+            raise ValueError("A budget of {} requests isn't enough to estimate {}:{}".format(
+                    self._budget, self._bucket, self._prefix))
+        sampled = list(topdirs)
+        if (len(sampled) > budget):
+            sampled = sorted(self._random.sample(sampled, budget))
+        # Each directory its own random numbers, for the same estimates from a seed.
+        randoms = [random.Random(self._random.random()) for path in sampled]
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            firsts = list(pool.map(lambda path: self.Request(path, None), sampled))
+            budget = budget - len(sampled)
+            self.requests = self.requests + len(sampled)
+
+            # The rest to the directories with more than a page, evenly.
+            dense = [idx for (idx, page) in enumerate(firsts) if (page.get('IsTruncated'))]
+            shares = dict()
+            for (order, idx) in enumerate(dense):
+                shares[idx] = budget // len(dense) + (1 if (order < budget % len(dense)) else 0)
+            results = list(pool.map(
+                    lambda idx: self.EstimateKeys(sampled[idx], shares.get(idx, 0), firsts[idx], randoms[idx]),
+                    range(len(sampled))))
+        estimates = [estimate for (estimate, used) in results]
+        self.requests = self.requests + sum(used for (estimate, used) in results)
+
+        for (path, estimate) in zip(sampled, estimates):
+            estimate.path = path
+            rows.append(estimate)
+            total.Add(estimate)
+        if (len(sampled) < len(topdirs)):
+            others = self.ScaleUp(estimates, len(topdirs))
+            for estimate in estimates:
+                others.objects = others.objects - estimate.objects
+                others.size = others.size - estimate.size
+                others.seenobjects = others.seenobjects - estimate.seenobjects
+                others.seensize = others.seensize - estimate.seensize
+            others.path = None
+            others.latest = None
+            rows.append(others)
+            total.Add(others)
+        return (rows, total)
+
+    def TopLevel(self) -> tuple:
+        """ The top-level directories, and an Estimate (exact) of the objects directly
+            under the prefix, from a delimiter listing. Returns (directories, estimate,
+            complete); not complete if it would take more than a quarter of the budget.
+        """
+        direct = Estimate(self._prefix)
+        topdirs = []
+        params = {'Bucket': self._bucket, 'Prefix': self._prefix, 'Delimiter': self._delim,
+                  'MaxKeys': 1000}
+        while (True):
+            if (self.requests >= max(1, self._budget // 4)):
+                return (topdirs, direct, False)
+            self.requests = self.requests + 1
+            page = self._client.list_objects_v2(**params)
+            topdirs.extend(cp['Prefix'] for cp in page.get('CommonPrefixes', ()))
+            self.Count(direct, page.get('Contents', ()))
+            if (not page.get('IsTruncated')):
+                break
+            params['ContinuationToken'] = page['NextContinuationToken']
+        direct.objects = float(direct.seenobjects)
+        direct.size = float(direct.seensize)
+        return (topdirs, direct, True)
+
+    def Request(self, prefix: str, lowkey: str) -> dict:
+        """ The first page of keys under prefix after lowkey (None for the start). """
+        params = {'Bucket': self._bucket, 'Prefix': prefix, 'MaxKeys': 1000}
+        if (lowkey is not None):
+            params['StartAfter'] = lowkey
+        return self._client.list_objects_v2(**params)
+
+    def Count(self, estimate: Estimate, items):
+        for item in items:
+            estimate.seenobjects = estimate.seenobjects + 1
+            estimate.seensize = estimate.seensize + item['Size']
+            if (estimate.latest is None or item['LastModified'] > estimate.latest):
+                estimate.latest = item['LastModified']
+
+    def EstimateKeys(self, prefix: str, budget: int, page: dict, rand: random.Random) -> tuple:
+        """ Estimate the keys under prefix with at most budget requests, besides page
+            if it's their first page, already fetched. Returns (Estimate, requests
+            used).
+        """
+        nodes = dict()
+        firstpages = {(prefix, None): page} if (page is not None) else dict()
+        root = (prefix, None)
+        used = 0
+        paths = []
+        while (len(paths) < self._maxpaths):
+            (objects, size, cost) = self.Path(nodes, firstpages, root, budget - used, rand)
+            used = used + cost
+            if (objects is None):
+                # Ran out of budget on the way down.
+                break
+            paths.append((objects, size))
+            exact = self.Exact(nodes, root)
+            if (exact is not None):
+                return (exact, used)
+
+        estimate = Estimate(None)
+        for node in nodes.values():
+            estimate.seenobjects = estimate.seenobjects + node.seen.seenobjects
+            estimate.seensize = estimate.seensize + node.seen.seensize
+            if (node.seen.latest is not None and (estimate.latest is None or node.seen.latest > estimate.latest)):
+                estimate.latest = node.seen.latest
+        if (len(paths) == 0):
+            # Not even one path: all there is to go on is what was seen.
+            estimate.objects = float(estimate.seenobjects)
+            estimate.size = float(estimate.seensize)
+            estimate.objectsvar = math.inf
+            estimate.sizevar = math.inf
+            return (estimate, used)
+        objects = [objects for (objects, size) in paths]
+        sizes = [size for (objects, size) in paths]
+        estimate.objects = statistics.fmean(objects)
+        estimate.size = statistics.fmean(sizes)
+        if (len(paths) > 1):
+            # A few paths that happen to agree don't make it exact: at least a spread
+            # of 1/n² of the estimate, for n paths.
+            estimate.objectsvar = max(statistics.variance(objects) / len(paths),
+                                      (estimate.objects / len(paths) ** 2) ** 2)
+            estimate.sizevar = max(statistics.variance(sizes) / len(paths),
+                                   (estimate.size / len(paths) ** 2) ** 2)
+        else:
+            # One path says nothing about the spread: allow for all of it.
+            estimate.objectsvar = estimate.objects ** 2
+            estimate.sizevar = estimate.size ** 2
+        return (estimate, used)
+
+    def Path(self, nodes: dict, firstpages: dict, key: tuple, budget: int, rand: random.Random) -> tuple:
+        """ One path at random down from the KeyNode for key, (prefix, lowkey), taking
+            apart the nodes it gets to that aren't in nodes yet. Returns (objects,
+            bytes, requests used); objects and bytes are None if the budget ran out.
+        """
+        objects = 0
+        size = 0
+        weight = 1
+        used = 0
+        while (True):
+            node = nodes.get(key)
+            if (node is None):
+                (node, cost) = self.TakeApart(key, budget - used, firstpages.pop(key, None))
+                used = used + cost
+                if (node is None):
+                    return (None, None, used)
+                nodes[key] = node
+            objects = objects + weight * node.seen.seenobjects
+            size = size + weight * node.seen.seensize
+            if (len(node.parts) == 0):
+                return (objects, size, used)
+            weight = weight * len(node.parts)
+            key = node.parts[rand.randrange(len(node.parts))]
+
+    def TakeApart(self, key: tuple, budget: int, page: dict = None) -> tuple:
+        """ The KeyNode for key, (prefix, lowkey), from its pages; page is the first if
+            it was already fetched. Returns (node, requests used); node is None if
+            budget ran out first.
+        """
+        (prefix, lowkey) = key
+        node = KeyNode()
+        used = 0
+        if (page is None):
+            if (budget < 1):
+                return (None, 0)
+            page = self.Request(prefix, lowkey)
+            used = 1
+        contents = page.get('Contents', ())
+        self.Count(node.seen, contents)
+        while (page.get('IsTruncated') and len(contents) > 0):
+            lastkey = contents[-1]['Key']
+            child = lastkey[0:len(prefix) + 1]
+            node.parts.append((child, lastkey))
+            if (used >= budget):
+                return (None, used)
+            page = self.Request(prefix, child + last_char)
+            used = used + 1
+            contents = page.get('Contents', ())
+            self.Count(node.seen, contents)
+        return (node, used)
+
+    def Exact(self, nodes: dict, key: tuple):
+        """ An exact Estimate of key's keys if every part under it has been taken apart,
+            or None.
+        """
+        node = nodes.get(key)
+        if (node is None):
+            return None
+        exact = Estimate(None)
+        exact.Add(node.seen)
+        for part in node.parts:
+            subexact = self.Exact(nodes, part)
+            if (subexact is None):
+                return None
+            exact.Add(subexact)
+        exact.objects = float(exact.seenobjects)
+        exact.size = float(exact.seensize)
+        return exact
+
+    def ScaleUp(self, estimates: list, count: int) -> Estimate:
+        """ The total of count parts, from estimates of a random sample of them: the
+            sample's total scaled up, with the variance of a two-stage sample.
+        """
+        total = Estimate(None)
+        sampled = len(estimates)
+        if (sampled == 0):
+            return total
+        scale = count / sampled
+        objects = [estimate.objects for estimate in estimates]
+        sizes = [estimate.size for estimate in estimates]
+        for estimate in estimates:
+            total.Add(estimate)
+        total.objects = total.objects * scale
+        total.size = total.size * scale
+        total.objectsvar = total.objectsvar * scale
+        total.sizevar = total.sizevar * scale
+        if (sampled < count):
+            if (sampled > 1):
+                objectsspread = statistics.variance(objects)
+                sizespread = statistics.variance(sizes)
+            else:
+                # One sample says nothing about the spread: allow for all of it.
+                objectsspread = objects[0] ** 2
+                sizespread = sizes[0] ** 2
+            finite = count * count * (1 - sampled / count) / sampled
+            total.objectsvar = total.objectsvar + finite * objectsspread
+            total.sizevar = total.sizevar + finite * sizespread
+        return total
@@ -0,0 +1,172 @@
+
+import re
+
+# Characters that make a pattern (or a path segment) a wildcard match.
+wild_chars = ('*', '?', '[')
+
+def HasWild(text: str) -> bool:
+    for wildchar in wild_chars:
+        if (text.find(wildchar) >= 0):
+            return True
+    return False
+
+def LiteralPrefix(text: str) -> str:
+    """ The part of text before its first wildcard. """
+    idx = len(text)
+    for wildchar in wild_chars:
+        found = text.find(wildchar)
+        if (found >= 0 and found < idx):
+            idx = found
+    return text[0:idx]
+
+def TranslateSegment(segment: str, delim: str) -> str:
+    """ Regular expression for one path segment of a glob. Like fnmatch.translate, but no
+        wildcard (or [class]) will match the delimiter.
+    """
+    notdelim = '[^' + re.escape(delim) + ']'
+    result = []
+    idx = 0
+    while (idx < len(segment)):
+        char = segment[idx]
+        idx = idx + 1
+        if (char == '*'):
+            # Runs of * are one *.
+            if (len(result) == 0 or result[-1] != notdelim + '*'):
+                result.append(notdelim + '*')
+        elif (char == '?'):
+            result.append(notdelim)
+        elif (char == '['):
+            end = idx
+            if (end < len(segment) and segment[end] == '!'):
+                end = end + 1
+            if (end < len(segment) and segment[end] == ']'):
+                end = end + 1
+            while (end < len(segment) and segment[end] != ']'):
+                end = end + 1
+            if (end >= len(segment)):
+                # No closing bracket: a literal [.
+                result.append('\\[')
+            else:
+                charclass = segment[idx:end].replace('\\', '\\\\')
+                idx = end + 1
+                if (charclass[0] == '!'):
+                    charclass = '^' + charclass[1:]
+                elif (charclass[0] == '^'):
+                    charclass = '\\' + charclass
+                result.append('(?!' + re.escape(delim) + ')[' + charclass + ']')
+        else:
+            result.append(re.escape(char))
+    return ''.join(result)
+
+
+class GlobPattern:
+    """ A whole-key glob, compiled once.
+
+        The pattern is split into segments on the delimiter. Wildcards within a segment
+        (* ? [...]) never match the delimiter. A segment that is exactly ** matches any
+        number of whole segments, including none: logs/**/*.gz matches logs/a.gz and
+        logs/2020/10/a.gz.
+    """
+
+    def __init__(self, pattern: str, delim: str):
+        self.pattern = pattern
+        self.delim = delim
+        self.segments = pattern.split(delim)
+
+        # Everything before the first wildcard: what S3 can filter on by itself.
+        self.prefix = LiteralPrefix(pattern)
+
+        regex = []
+        for (idx, segment) in enumerate(self.segments):
+            last = (idx == len(self.segments) - 1)
+            if (segment == '**'):
+                if (last):
+                    regex.append('.*')
+                else:
+                    regex.append('(?:.*' + re.escape(delim) + ')?')
+            else:
+                regex.append(TranslateSegment(segment, delim))
+                if (not last):
+                    regex.append(re.escape(delim))
+        self._regex = re.compile(''.join(regex), re.DOTALL)
+
+        # Segment patterns, for matching CommonPrefixes one level at a time.
+        self._segmentregex = [re.compile(TranslateSegment(segment, delim), re.DOTALL)
+                              for segment in self.segments]
+
+    def Match(self, key: str) -> bool:
+        return self._regex.fullmatch(key) is not None
+
+    def MatchSegment(self, idx: int, name: str) -> bool:
+        return self._segmentregex[idx].fullmatch(name) is not None
+
+
+class GlobLister:
+    """ List only the parts of a bucket a GlobPattern can match.
+
+        Literal leading segments go straight into the Prefix. Each wildcard segment
+        before the last is expanded with a Delimiter listing: only the CommonPrefixes
+        that match it are descended into. The last segment is listed one level deep
+        (again with Delimiter), and a ** segment lists its whole subtree. Subtrees are
+        walked in order, so keys still come out in lexical order.
+
+        Pages may hold keys the pattern doesn't match; the caller still filters them.
+    """
+
+    def __init__(self, s3client, pattern: GlobPattern):
+        self._s3client = s3client
+        self._pattern = pattern
+
+    def ListPages(self, params: dict):
+        """ Generator of pages (dicts with 'Contents') for the given list_objects_v2
+            parameters, restricted to what the pattern can match.
+        """
+        segments = self._pattern.segments
+        delim = self._pattern.delim
+
+        # Leading literal directories need no listing at all.
+        idx = 0
+        base = ''
+        while (idx < len(segments) - 1 and not HasWild(segments[idx]) and segments[idx] != '**'):
+            base = base + segments[idx] + delim
+            idx = idx + 1
+
+        yield from self.Expand(params, base, idx)
+
+    def Paginate(self, params: dict, prefix: str, delimited: bool):
+        listparams = dict(params)
+        listparams['Prefix'] = prefix
+        if (delimited):
+            listparams['Delimiter'] = self._pattern.delim
+        paginator = self._s3client.get_paginator('list_objects_v2')
+        return paginator.paginate(**listparams)
+
+    def Expand(self, params: dict, base: str, idx: int):
+        """ Pages for the keys under base that can match segments idx and on. """
+        segments = self._pattern.segments
+        delim = self._pattern.delim
+        segment = segments[idx]
+        last = (idx == len(segments) - 1)
+
+        if (segment == '**'):
+            # Anything below here could match.
+            for page in self.Paginate(params, base, False):
+                yield {'Contents': page.get('Contents', [])}
+            return
+
+        if (last):
+            # Only this level, and only names starting with the literal part.
+            for page in self.Paginate(params, base + LiteralPrefix(segment), True):
+                yield {'Contents': page.get('Contents', [])}
+            return
+
+        if (not HasWild(segment)):
+            yield from self.Expand(params, base + segment + delim, idx + 1)
+            return
+
+        # A wildcard directory: descend into the subdirectories that match it.
+        for page in self.Paginate(params, base + LiteralPrefix(segment), True):
+            for commonprefix in page.get('CommonPrefixes', ()):
+                subdir = commonprefix['Prefix']
+                if (self._pattern.MatchSegment(idx, subdir[len(base):-len(delim)])):
+                    yield from self.Expand(params, subdir, idx + 1)
@@ -0,0 +1,96 @@
+
+import bisect
+
+# Size buckets: 0 is empty objects, i holds sizes in [2**(i-1), 2**i). S3 objects are at
+# most 5 TB, under 2**43; the last bucket takes anything bigger anyway.
+size_buckets = 45
+
+# Age buckets, by the upper bound of each in days; the last bucket is everything older.
+# Chosen to line up with the usual lifecycle rule thresholds.
+age_bounds = [1, 7, 30, 90, 180, 365, 730, 1095, 1825]
+age_buckets = len(age_bounds) + 1
+
+size_units = ['B', 'KB', 'MB', 'GB', 'TB', 'PB']
+
+def SizeBucketRange(bucket: int):
+    """ (low, high) bytes of a size bucket; high is exclusive, and None for no limit. """
+    if (bucket == 0):
+        return (0, 1)
+    if (bucket == size_buckets - 1):
+        return (1 << (bucket - 1), None)
+    return (1 << (bucket - 1), 1 << bucket)
+
+def AgeBucketRange(bucket: int):
+    """ (low, high) days of an age bucket; high is exclusive, and None for no limit. """
+    low = age_bounds[bucket - 1] if (bucket > 0) else 0
+    high = age_bounds[bucket] if (bucket < len(age_bounds)) else None
+    return (low, high)
+
+def PowerOfTwoText(power: int) -> str:
+    """ 2**power bytes, as 512 B or 4 MB. """
+    return "{} {}".format(1 << (power % 10), size_units[power // 10])
+
+class Histogram:
+    """ Object counts and bytes by size (log2) and by age, in fixed-size arrays.
+
+        Belongs to a DirStats, and covers the directory and everything under it: each
+        directory's histogram is merged into its parent's when it is finished, the same
+        way its totals are.
+    """
+    __slots__ = ('sizecounts', 'sizebytes', 'agecounts', 'agebytes')
+
+    def __init__(self):
+        self.sizecounts = [0] * size_buckets
+        self.sizebytes = [0] * size_buckets
+        self.agecounts = [0] * age_buckets
+        self.agebytes = [0] * age_buckets
+
+    def Add(self, size: int, agedays: float):
+        bucket = size.bit_length()
+        if (bucket >= size_buckets):
+            bucket = size_buckets - 1
+        self.sizecounts[bucket] = self.sizecounts[bucket] + 1
+        self.sizebytes[bucket] = self.sizebytes[bucket] + size
+
+        bucket = bisect.bisect_right(age_bounds, agedays)
+        self.agecounts[bucket] = self.agecounts[bucket] + 1
+        self.agebytes[bucket] = self.agebytes[bucket] + size
+
+    def Merge(self, other: 'Histogram'):
+        """ Add other's counts into this one. """
+        for idx in range(size_buckets):
+            self.sizecounts[idx] = self.sizecounts[idx] + other.sizecounts[idx]
+            self.sizebytes[idx] = self.sizebytes[idx] + other.sizebytes[idx]
+        for idx in range(age_buckets):
+            self.agecounts[idx] = self.agecounts[idx] + other.agecounts[idx]
+            self.agebytes[idx] = self.agebytes[idx] + other.agebytes[idx]
+
+    def SizeRows(self):
+        """ (label, low bytes, high bytes, objects, bytes) for each size bucket that has
+            any objects.
+        """
+        for bucket in range(size_buckets):
+            if (self.sizecounts[bucket] == 0):
+                continue
+            (low, high) = SizeBucketRange(bucket)
+            if (bucket == 0):
+                label = "empty"
+            elif (high is None):
+                label = ">= " + PowerOfTwoText(bucket - 1)
+            else:
+                label = PowerOfTwoText(bucket - 1) + " - " + PowerOfTwoText(bucket)
+            yield (label, low, high, self.sizecounts[bucket], self.sizebytes[bucket])
+
+    def AgeRows(self):
+        """ (label, low days, high days, objects, bytes) for each age bucket that has any
+            objects.
+        """
+        for bucket in range(age_buckets):
+            if (self.agecounts[bucket] == 0):
+                continue
+            (low, high) = AgeBucketRange(bucket)
+            if (high is None):
+                label = ">= {} days".format(low)
+            else:
+                label = "{} - {} days".format(low, high)
+            yield (label, low, high, self.agecounts[bucket], self.agebytes[bucket])
@@ -0,0 +1,195 @@
+
+import os
+import csv
+import sys
+import gzip
+import json
+import heapq
+import pickle
+import datetime
+import operator
+import tempfile
+from urllib.parse import unquote_plus
+from concurrent.futures import ProcessPoolExecutor
+
+from s3misc.Snapshot import page_size
+
+# Rows per pickle in a sorted run file. Big enough to keep pickle overhead down.
+run_chunk = 10000
+
+def ParseTimestamp(text: str) -> int:
+    """ Inventory LastModifiedDate (2020-10-17T18:58:51.000Z) to seconds since the epoch. """
+    if (text.endswith('Z')):
+        text = text[0:-1] + '+00:00'
+    return int(datetime.datetime.fromisoformat(text).timestamp())
+
+def ReadCSV(path: str, schema: list, prefix: str):
+    """ Rows of a gzipped inventory CSV as (key, size, mtime, storage class, etag).
+        CSV inventories have no header (the manifest's fileSchema names the columns),
+        and URL-encode the keys.
+    """
+    columns = dict((name, idx) for (idx, name) in enumerate(schema))
+    keycol = columns['Key']
+    sizecol = columns.get('Size')
+    mtimecol = columns.get('LastModifiedDate')
+    classcol = columns.get('StorageClass')
+    etagcol = columns.get('ETag')
+    latestcol = columns.get('IsLatest')
+    deletecol = columns.get('IsDeleteMarker')
+
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as datafile:
+        for row in csv.reader(datafile):
+            # Versioned inventories list every version. We want what a listing shows.
+            if (latestcol is not None and row[latestcol] != 'true'):
+                continue
+            if (deletecol is not None and row[deletecol] == 'true'):
+                continue
+
+            key = unquote_plus(row[keycol])
+            if (not key.startswith(prefix)):
+                continue
+            yield (key,
+                   int(row[sizecol]) if (sizecol is not None and row[sizecol]) else 0,
+                   ParseTimestamp(row[mtimecol]) if (mtimecol is not None) else 0,
+                   row[classcol] if (classcol is not None) else None,
+                   row[etagcol] if (etagcol is not None) else None)
+
+def ReadColumnar(path: str, fileformat: str, prefix: str):
+    """ Rows of a Parquet or ORC inventory file. Needs pyarrow. """
+    try:
+        if (fileformat == 'Parquet'):
+            import pyarrow.parquet
+            table = pyarrow.parquet.read_table(path)
+        else:
+            import pyarrow.orc
+            table = pyarrow.orc.ORCFile(path).read()
+    except ImportError:
+        raise RuntimeError("Reading {} inventories needs pyarrow (pip3 install pyarrow)".format(fileformat))
+
+    def column(name):
+        if (name in table.column_names):
+            return table.column(name).to_pylist()
+        return [None] * table.num_rows
+
+    rows = zip(column('key'), column('size'), column('last_modified_date'),
+               column('storage_class'), column('e_tag'),
+               column('is_latest'), column('is_delete_marker'))
+    for (key, size, mtime, storageclass, etag, latest, deletemarker) in rows:
+        if (latest is False or deletemarker is True):
+            continue
+        if (not key.startswith(prefix)):
+            continue
+        yield (key, size or 0, int(mtime.timestamp()) if (mtime) else 0, storageclass, etag)
+
+def SortRun(path: str, fileformat: str, schema: list, prefix: str, rundir: str) -> str:
+    """ Worker process: read one data file, sort it by key, write it to a run file in
+        rundir. Returns the run file's name.
+    """
+    if (fileformat == 'CSV'):
+        rows = list(ReadCSV(path, schema, prefix))
+    else:
+        rows = list(ReadColumnar(path, fileformat, prefix))
+    rows.sort(key=operator.itemgetter(0))
+
+    (fd, runpath) = tempfile.mkstemp(dir=rundir, suffix='.run')
+    with os.fdopen(fd, 'wb') as runfile:
+        for start in range(0, len(rows), run_chunk):
+            pickle.dump(rows[start:start + run_chunk], runfile, pickle.HIGHEST_PROTOCOL)
+    return runpath
+
+def ReadRun(runpath: str):
+    """ Rows back out of a run file, in order. """
+    with open(runpath, 'rb') as runfile:
+        while (True):
+            try:
+                rows = pickle.load(runfile)
+            except EOFError:
+                return
+            yield from rows
+
+
+class InventoryReader:
+    """ Objects from an S3 Inventory report on local disk, instead of from a listing.
+
+        Data files aren't in key order relative to each other, so each one is read,
+        sorted and written to a temporary run file by a pool of worker processes, and
+        the runs are merged. Only one data file per worker is ever held in memory.
+    """
+
+    def __init__(self, manifest: str, workers: int = None):
+        self._manifestpath = manifest
+        with open(manifest, 'r') as manifestfile:
+            self._manifest = json.load(manifestfile)
+
+        self._format = self._manifest.get('fileFormat', 'CSV')
+        if (self._format not in ('CSV', 'Parquet', 'ORC')):
+            raise ValueError("Unknown inventory file format: {}".format(self._format))
+        self._schema = [name.strip() for name in self._manifest.get('fileSchema', '').split(',')]
+        if (self._format == 'CSV' and 'Key' not in self._schema):
+            raise ValueError("Inventory fileSchema has no Key column: {}".format(manifest))
+
+        self._workers = workers
+
+    def DataFiles(self) -> list:
+        """ Local paths of the manifest's data files.
+
+            The manifest names them by their key in the destination bucket
+            (prefix/source-bucket/config/data/file.csv.gz). Wherever the report was
+            copied to, look for the tail of that key next to the manifest or in one of
+            its parent directories.
+        """
+        manifestdir = os.path.dirname(os.path.abspath(self._manifestpath))
+        ancestors = [manifestdir]
+        while (os.path.dirname(ancestors[-1]) != ancestors[-1]):
+            ancestors.append(os.path.dirname(ancestors[-1]))
+
+        paths = []
+        for datafile in self._manifest.get('files', ()):
+            parts = datafile['key'].split('/')
+            found = None
+            for start in range(len(parts) - 1, -1, -1):
+                for ancestor in ancestors:
+                    candidate = os.path.join(ancestor, *parts[start:])
+                    if (os.path.isfile(candidate)):
+                        found = candidate
+                        break
+                if (found is not None):
+                    break
+            if (found is None):
+                raise FileNotFoundError("Inventory data file not found near {}: {}".format(
+                        self._manifestpath, datafile['key']))
+            paths.append(found)
+        return paths
+
+    def ListPages(self, bucket: str, prefix: str):
+        """ Pages of inventory objects under prefix, shaped like list_objects_v2 pages. """
+        sourcebucket = self._manifest.get('sourceBucket')
+        if (sourcebucket is not None and sourcebucket != bucket):
+            print("Inventory is of bucket {}, not {}".format(sourcebucket, bucket), file=sys.stderr)
+
+        datafiles = self.DataFiles()
+        utc = datetime.timezone.utc
+
+        with tempfile.TemporaryDirectory(prefix='inventory') as rundir:
+            with ProcessPoolExecutor(max_workers=self._workers) as pool:
+                runpaths = list(pool.map(SortRun, datafiles,
+                                         [self._format] * len(datafiles),
+                                         [self._schema] * len(datafiles),
+                                         [prefix] * len(datafiles),
+                                         [rundir] * len(datafiles)))
+
+            contents = []
+            for (key, size, mtime, storageclass, etag) in heapq.merge(
+                    *[ReadRun(runpath) for runpath in runpaths], key=operator.itemgetter(0)):
+                contents.append({
+                        'Key': key,
+                        'Size': size,
+                        'LastModified': datetime.datetime.fromtimestamp(mtime, utc),
+                        'StorageClass': storageclass,
+                        'ETag': etag
+                    })
+                if (len(contents) >= page_size):
+                    yield {'Contents': contents}
+                    contents = []
+            if (len(contents) > 0):
+                yield {'Contents': contents}
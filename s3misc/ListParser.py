@@ -0,0 +1,199 @@
+
+import time
+import datetime
+from urllib.parse import unquote_plus
+from xml.etree import ElementTree
+
+utc = datetime.timezone.utc
+
+# Seconds a presigned list request stays valid. It's used at once.
+presign_expiry = 900
+
+# Bytes read from the socket at a time, and fed to the parser.
+read_size = 1 << 16
+
+class ParseCache:
+    """ Conversions that pages repeat, done once each.
+
+        Objects uploaded together share a LastModified, so each distinct timestamp
+        text is turned into a datetime once. URL-encoded keys in a directory share
+        everything up to the last encoded delimiter, so that is decoded once per
+        directory and the rest of the key only if it has anything encoded in it.
+        When a cache fills up it starts over, so memory stays bounded.
+    """
+
+    _cachesize = 1 << 16
+
+    def __init__(self):
+        self._times = dict()
+        self._dirs = dict()
+
+    def Time(self, text: str) -> datetime.datetime:
+        """ S3's LastModified text (2020-10-17T18:58:51.000Z) as a datetime. """
+        when = self._times.get(text)
+        if (when is None):
+            micro = 0
+            if (len(text) > 20 and text[19] == '.'):
+                micro = int((text[20:].rstrip('Z') + '000000')[0:6])
+            when = datetime.datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                                     int(text[11:13]), int(text[14:16]), int(text[17:19]),
+                                     micro, utc)
+            if (len(self._times) >= self._cachesize):
+                self._times.clear()
+            self._times[text] = when
+        return when
+
+    def Key(self, text: str) -> str:
+        """ A key (or prefix) as sent with EncodingType=url, decoded. """
+        idx = text.rfind('%2F') + 3
+        if (idx < 3):
+            return unquote_plus(text) if ('%' in text or '+' in text) else text
+        directory = self._dirs.get(text[0:idx])
+        if (directory is None):
+            directory = unquote_plus(text[0:idx])
+            if (len(self._dirs) >= self._cachesize):
+                self._dirs.clear()
+            self._dirs[text[0:idx]] = directory
+        name = text[idx:]
+        if ('%' in name or '+' in name):
+            name = unquote_plus(name)
+        return directory + name
+
+
+def ListingError(status: int, body: bytes):
+    """ A botocore ClientError for an S3 error response, as the client would raise. """
+    from botocore.exceptions import ClientError
+
+    error = {'Code': str(status), 'Message': ''}
+    try:
+        root = ElementTree.fromstring(body)
+        error['Code'] = root.findtext('Code') or error['Code']
+        error['Message'] = root.findtext('Message') or ''
+    except ElementTree.ParseError:
+        pass
+    return ClientError({'Error': error, 'ResponseMetadata': {'HTTPStatusCode': status}},
+                       'ListObjectsV2')
+
+def ParseListing(chunks, cache: ParseCache, encoded: bool = True) -> dict:
+    """ A ListObjectsV2 response body, in chunks of bytes, as a list_objects_v2 page.
+
+        Only what a listing uses is kept: Key, Size, LastModified, StorageClass and
+        ETag of objects, CommonPrefixes, IsTruncated, NextContinuationToken and
+        KeyCount. Each chunk is parsed as it arrives, by expat into a C tree, and
+        entries are read straight off the tree. encoded: keys are URL-encoded
+        (EncodingType=url).
+    """
+    parser = ElementTree.XMLParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    root = parser.close()
+
+    tag = root.tag
+    ns = tag[0:tag.find('}') + 1] if (tag.startswith('{')) else ''
+    if (tag != ns + 'ListBucketResult'):
+        raise ValueError("Not a ListObjectsV2 response: {}".format(tag))
+    contentstag = ns + 'Contents'
+    prefixestag = ns + 'CommonPrefixes'
+    keytag = ns + 'Key'
+    sizetag = ns + 'Size'
+    mtimetag = ns + 'LastModified'
+    classtag = ns + 'StorageClass'
+    etagtag = ns + 'ETag'
+    prefixtag = ns + 'Prefix'
+
+    contents = []
+    commonprefixes = []
+    gettime = cache.Time
+    getkey = cache.Key if (encoded) else str
+    for elem in root.iterfind(contentstag):
+        contents.append({
+                'Key': getkey(elem.findtext(keytag)),
+                'Size': int(elem.findtext(sizetag)),
+                'LastModified': gettime(elem.findtext(mtimetag)),
+                'StorageClass': elem.findtext(classtag),
+                'ETag': elem.findtext(etagtag)
+            })
+    for elem in root.iterfind(prefixestag):
+        commonprefixes.append({'Prefix': getkey(elem.findtext(prefixtag))})
+
+    page = {'IsTruncated': (root.findtext(ns + 'IsTruncated') == 'true')}
+    token = root.findtext(ns + 'NextContinuationToken')
+    if (token is not None):
+        page['NextContinuationToken'] = token
+    keycount = root.findtext(ns + 'KeyCount')
+    if (keycount is not None):
+        page['KeyCount'] = int(keycount)
+    if (len(contents) > 0):
+        page['Contents'] = contents
+    if (len(commonprefixes) > 0):
+        page['CommonPrefixes'] = commonprefixes
+    return page
+
+
+class RawListClient:
+    """ An S3 client whose list_objects_v2 skips botocore's response parsing.
+
+        botocore turns every entry of every page into a dict of everything S3 said
+        about it (Owner, ChecksumAlgorithm, ...), with dateutil parsing each timestamp.
+        Instead, the request is presigned by the client (so it is signed the same
+        way, with the same credentials and endpoint), sent over a urllib3 pool, and
+        the XML is read by ParseListing as it comes in. Pages have only what
+        listings use, with repeated conversions cached (see ParseCache).
+
+        Errors are raised as botocore's ClientError, so retries treat them the same.
+        Everything else goes to the client.
+    """
+
+    def __init__(self, client, http, stats = None):
+        """ http: a urllib3 PoolManager. stats: a RunStats to count requests in. """
+        self._client = client
+        self._http = http
+        self._stats = stats
+        self._cache = ParseCache()
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+    def list_objects_v2(self, **params) -> dict:
+        params = dict(params)
+        params['EncodingType'] = 'url'
+        url = self._client.generate_presigned_url('list_objects_v2', Params=params,
+                                                  ExpiresIn=presign_expiry)
+
+        stats = self._stats
+        if (stats is not None):
+            stats.Sent()
+        began = time.perf_counter()
+        failed = True
+        response = self._http.request('GET', url, preload_content=False, retries=False)
+        try:
+            if (response.status != 200):
+                raise ListingError(response.status, response.read())
+            page = ParseListing(response.stream(read_size), self._cache)
+            failed = False
+        finally:
+            response.release_conn()
+            if (stats is not None):
+                stats.Request(time.perf_counter() - began, failed)
+        return page
+
+    def get_paginator(self, operation: str):
+        if (operation != 'list_objects_v2'):
+            return self._client.get_paginator(operation)
+        return RawListPaginator(self)
+
+
+class RawListPaginator:
+    """ list_objects_v2 pages, a request at a time, through RawListClient. """
+
+    def __init__(self, client: RawListClient):
+        self._client = client
+
+    def paginate(self, **params):
+        params = dict(params)
+        while (True):
+            response = self._client.list_objects_v2(**params)
+            yield response
+            if (not response.get('IsTruncated')):
+                return
+            params['ContinuationToken'] = response['NextContinuationToken']
@@ -0,0 +1,167 @@
+
+from s3misc.GlobMatcher import LiteralPrefix
+from s3misc.PagePrefetcher import PagePrefetcher
+from s3misc.DirectoryStack import DirStats, DirectoryStack
+
+# What can differ between two copies of an object.
+diff_fields = ['size', 'mtime', 'etag']
+
+# Objects handed from a listing's thread to the merge at a time.
+_batchsize = 1000
+
+def Batches(items, size: int):
+    """ items, in lists of up to size. """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if (len(batch) >= size):
+            yield batch
+            batch = []
+    if (len(batch) > 0):
+        yield batch
+
+class DiffTotals:
+    """ Counts and bytes of what changed between two listings. """
+    __slots__ = ('added', 'addedsize', 'removed', 'removedsize', 'changed', 'changedsize',
+                 'unchanged')
+
+    def __init__(self):
+        self.added = 0
+        self.addedsize = 0
+        self.removed = 0
+        self.removedsize = 0
+        # Objects in both, but different. changedsize is their net change in bytes.
+        self.changed = 0
+        self.changedsize = 0
+        self.unchanged = 0
+
+
+class ListingDiff:
+    """ Compare two listings (bucket:prefix against bucket:prefix, or against a snapshot)
+        in one pass, in O(1) memory.
+
+        Both listings come out of ParseBucket in key order, so they can be merge-joined:
+        whichever side has the smaller key is behind, and that key is missing from the
+        other side. Keys are compared relative to each side's prefix (the part of its
+        match before any wildcard), so a prefix can be compared with a copy of it
+        elsewhere. Each side is listed on its own thread, so both are fetched at once.
+
+        Differences are accounted per directory on a DirectoryStack: a directory's
+        DirStats holds its net change in objects and in bytes, rolled up into its
+        parent's subdirectory totals like a listing's totals.
+    """
+
+    def __init__(self, oldprinter, newprinter, sink, fields: list = None):
+        """ oldprinter and newprinter: BucketPrinters (clones) that list each side, from
+            wherever they're set to list from. fields: what to compare of objects in
+            both, from diff_fields (default: all of them).
+        """
+        self._printers = (oldprinter, newprinter)
+        self._sink = sink
+        self._fields = set(diff_fields if (fields is None) else fields)
+        self._delim = None
+        self._dirtotals = False
+
+    def Side(self, printer, target: tuple):
+        """ (relative key, item) for every object a side's listing matches, in order. """
+        (bucket, delim, match) = target
+        printer.SetListing(bucket, delim, match)
+        prefixlen = len(LiteralPrefix(match or ''))
+
+        # The listing runs on its own thread, a batch at a time.
+        for batch in PagePrefetcher(Batches(printer.ParseBucket(bucket), _batchsize), 2):
+            for item in batch:
+                if ('CommonPrefix' in item):
+                    continue
+                yield (item['Key'][prefixlen:], item)
+
+    def Changes(self, old: dict, new: dict) -> list:
+        """ Which of the compared fields differ between two copies of an object. """
+        changes = []
+        if ('size' in self._fields and old['Size'] != new['Size']):
+            changes.append('size')
+        if ('mtime' in self._fields and old['LastModified'] != new['LastModified']):
+            changes.append('mtime')
+        if ('etag' in self._fields and old.get('ETag') is not None and new.get('ETag') is not None
+                and old['ETag'] != new['ETag']):
+            changes.append('etag')
+        return changes
+
+    def Run(self, old: tuple, new: tuple, dirtotals: bool, blocksize: int = -1) -> DiffTotals:
+        """ old and new: (bucket, delim, match) of each side. Reports every difference
+            to the sink, and each directory's net change (all of them with dirtotals,
+            otherwise the whole listing's). Returns the totals.
+        """
+        self._delim = new[1]
+        self._dirtotals = dirtotals
+        sink = self._sink
+        sink.BeginDiff(old, new, blocksize, dirtotals)
+
+        totals = DiffTotals()
+        dirstack = DirectoryStack(self._delim, self.WrapUpDirectory)
+        prevdir = None
+        stats = dirstack.Top()
+
+        oldside = self.Side(self._printers[0], old)
+        newside = self.Side(self._printers[1], new)
+        oldentry = next(oldside, None)
+        newentry = next(newside, None)
+        while (oldentry is not None or newentry is not None):
+            if (newentry is None or (oldentry is not None and oldentry[0] < newentry[0])):
+                (key, olditem) = oldentry
+                newitem = None
+                oldentry = next(oldside, None)
+            elif (oldentry is None or newentry[0] < oldentry[0]):
+                (key, newitem) = newentry
+                olditem = None
+                newentry = next(newside, None)
+            else:
+                (key, olditem) = oldentry
+                newitem = newentry[1]
+                oldentry = next(oldside, None)
+                newentry = next(newside, None)
+
+            if (olditem is not None and newitem is not None):
+                changes = self.Changes(olditem, newitem)
+                if (len(changes) == 0):
+                    totals.unchanged = totals.unchanged + 1
+                    continue
+
+            nextdir = key[0:key.rfind(self._delim) + 1]
+            if (nextdir != prevdir):
+                stats = dirstack.Enter(nextdir)
+                prevdir = nextdir
+
+            if (olditem is None):
+                totals.added = totals.added + 1
+                totals.addedsize = totals.addedsize + newitem['Size']
+                stats.objects = stats.objects + 1
+                stats.size = stats.size + newitem['Size']
+                sink.DiffObject('added', key, None, newitem, None)
+            elif (newitem is None):
+                totals.removed = totals.removed + 1
+                totals.removedsize = totals.removedsize + olditem['Size']
+                stats.objects = stats.objects - 1
+                stats.size = stats.size - olditem['Size']
+                sink.DiffObject('removed', key, olditem, None, None)
+            else:
+                delta = newitem['Size'] - olditem['Size']
+                totals.changed = totals.changed + 1
+                totals.changedsize = totals.changedsize + delta
+                stats.size = stats.size + delta
+                sink.DiffObject('changed', key, olditem, newitem, changes)
+
+        dirstack.Finish()
+        sink.DiffTotals(totals)
+        sink.End()
+        return totals
+
+    def WrapUpDirectory(self, stats: DirStats):
+        """ A directory's differences are all in. Report its net change, if anything in
+            it changed.
+        """
+        if (stats.path != '' and not self._dirtotals):
+            return
+        if (stats.path == '' or stats.objects != 0 or stats.size != 0 or
+                stats.subobjects != 0 or stats.subsize != 0):
+            self._sink.DiffDirectory(stats)
@@ -0,0 +1,104 @@
+
+from s3misc.OutputSinks import TextSink
+from s3misc.DirectoryStack import DirStats
+
+class MultiBucketPrinter:
+    """ List several targets (buckets, or bucket:prefix) with up to `jobs` at once.
+
+        Each target gets its own clone of the BucketPrinter, and its own sink writing to
+        a spool file: in memory while it is small, on disk once it isn't. Spools are
+        copied to the real output in argument order, each one as soon as it and every
+        target before it are done, so the output reads exactly as if the targets had
+        been listed one after another.
+
+        Every listing's bucket totals are also added up into account totals.
+    """
+
+    # Bytes of a target's output to keep in memory before spooling it to disk.
+    _spoolsize = 8 << 20
+
+    def __init__(self, bucketprinter, jobs: int, makesink):
+        """ makesink(stream, header: bool) gives an OutputSink writing to the binary
+            stream (see MakeSink).
+        """
+        if (jobs < 1):
+            raise ValueError("Given job count ({}) for MultiBucketPrinter is invalid.".format(jobs))
+        self._bucketprinter = bucketprinter
+        self._jobs = jobs
+        self._makesink = makesink
+
+    def PrintTargets(self, targets: list, stream, header: bool = True) -> DirStats:
+        """ targets: (bucket, delim, match, params) for each listing, params being
+            keyword arguments for PrintBucket. header: False when carrying on output
+            that already has one. Returns the account totals, in the subdirectory
+            fields of a DirStats.
+        """
+        account = DirStats('')
+
+        if (self._jobs == 1 or len(targets) < 2):
+            # Nothing to overlap: straight to the output.
+            sink = self._makesink(stream, header)
+            self._bucketprinter.SetSink(sink)
+            for target in targets:
+                self.PrintTarget(self._bucketprinter, sink, target).AddTo(account)
+        else:
+            import shutil
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=self._jobs) as pool:
+                futures = [pool.submit(self.SpoolTarget, target, header and idx == 0)
+                           for (idx, target) in enumerate(targets)]
+                try:
+                    for future in futures:
+                        (spool, totals) = future.result()
+                        with spool:
+                            spool.seek(0)
+                            shutil.copyfileobj(spool, stream)
+                        totals.AddTo(account)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+            # The rest follows the spooled output; it already has any header.
+            sink = self._makesink(stream, False)
+
+        if (len(targets) > 1):
+            sink.AccountTotals(account, len(targets))
+        sink.Close()
+        return account
+
+    def PrintTarget(self, bucketprinter, sink, target: tuple) -> DirStats:
+        (bucket, delim, match, params) = target
+        if (isinstance(sink, TextSink)):
+            sink.Heading("Printing bucket: " + bucket + "\n")
+        return bucketprinter.PrintBucket(bucket, delim, match, **params)
+
+    def PrintPartials(self, partials: list, stream) -> DirStats:
+        """ Print the totals merged from Partials of one listing (see
+            BucketPrinter.PrintPartials), as PrintTargets would print the listing.
+        """
+        sink = self._makesink(stream, True)
+        self._bucketprinter.SetSink(sink)
+        if (isinstance(sink, TextSink)):
+            sink.Write("Printing bucket: " + partials[0].listing[0] + "\n")
+        totals = self._bucketprinter.PrintPartials(partials)
+        sink.Close()
+        return totals
+
+    def SpoolTarget(self, target: tuple, header: bool):
+        """ Worker thread: list one target into a spool file. Returns the spool and the
+            listing's totals.
+        """
+        import tempfile
+
+        spool = tempfile.SpooledTemporaryFile(max_size=self._spoolsize)
+        try:
+            sink = self._makesink(spool, header)
+            bucketprinter = self._bucketprinter.Clone()
+            bucketprinter.SetSink(sink)
+            totals = self.PrintTarget(bucketprinter, sink, target)
+            sink.Flush()
+        except BaseException:
+            spool.close()
+            raise
+        return (spool, totals)
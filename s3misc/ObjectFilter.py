@@ -0,0 +1,79 @@
+
+import re
+from datetime import datetime, timedelta, timezone
+
+class ObjectFilter:
+    """ Conditions on objects other than their keys' match: size, age, storage class
+        and a regular expression on the key. Only objects meeting all of them are
+        listed, counted and printed.
+
+        The conditions are compiled into one predicate, a single lambda testing just
+        the ones that were given, so a listing pays for one call per object however
+        many there are. Given values are bound in as constants, never put in the source.
+    """
+
+    def __init__(self, minsize: int = None, maxsize: int = None, olderthan = None, newerthan = None,
+                 storageclasses: list = None, regex: str = None):
+        """ minsize, maxsize: bytes, inclusive. olderthan, newerthan: a timedelta (an age,
+            as of the start of the listing) or an aware datetime. storageclasses: the
+            classes to keep (objects without one are STANDARD). regex: searched for in
+            each key.
+        """
+        if (minsize is not None and maxsize is not None and minsize > maxsize):
+            raise ValueError("Given size range ({}, {}) for ObjectFilter is invalid.".format(minsize, maxsize))
+        self._minsize = minsize
+        self._maxsize = maxsize
+        self._olderthan = olderthan
+        self._newerthan = newerthan
+        self._storageclasses = None
+        if (storageclasses is not None):
+            self._storageclasses = frozenset(storageclass.upper() for storageclass in storageclasses)
+        self._regex = regex
+        # Compiled here, so a bad expression is an error before any listing.
+        self._search = re.compile(regex).search if (regex is not None) else None
+
+    def Empty(self) -> bool:
+        """ No conditions: everything passes. """
+        return (self.Settings() == (None,) * 6)
+
+    def Settings(self) -> tuple:
+        """ The conditions as given, for ListingSettings. """
+        storageclasses = tuple(sorted(self._storageclasses)) if (self._storageclasses is not None) else None
+        return (self._minsize, self._maxsize, self._olderthan, self._newerthan, storageclasses, self._regex)
+
+    def Predicate(self, now: float):
+        """ The compiled test: a function of a listing item, true for the ones to keep.
+            now: the time (time.time()) ages are counted from.
+        """
+        conditions = []
+        # The lambda's globals: the constants it tests against, and nothing else.
+        constants = {'__builtins__': {}}
+        if (self._minsize is not None):
+            conditions.append("item['Size'] >= minsize")
+            constants['minsize'] = self._minsize
+        if (self._maxsize is not None):
+            conditions.append("item['Size'] <= maxsize")
+            constants['maxsize'] = self._maxsize
+        if (self._olderthan is not None):
+            conditions.append("item['LastModified'] < olderthan")
+            constants['olderthan'] = Cutoff(self._olderthan, now)
+        if (self._newerthan is not None):
+            conditions.append("item['LastModified'] > newerthan")
+            constants['newerthan'] = Cutoff(self._newerthan, now)
+        if (self._storageclasses is not None):
+            # The raw parser leaves out a class S3 didn't give: that's STANDARD.
+            conditions.append("(item.get('StorageClass') or 'STANDARD') in storageclasses")
+            constants['storageclasses'] = self._storageclasses
+        if (self._search is not None):
+            conditions.append("search(item['Key']) is not None")
+            constants['search'] = self._search
+        if (len(conditions) == 0):
+            return lambda item: True
+        return eval("lambda item: " + " and ".join(conditions), constants)
+
+
+def Cutoff(when, now: float) -> datetime:
+    """ The aware datetime for when: a timedelta before now, or a datetime itself. """
+    if (isinstance(when, timedelta)):
+        return datetime.fromtimestamp(now, timezone.utc) - when
+    return when
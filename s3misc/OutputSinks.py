@@ -0,0 +1,535 @@
+
+import sys
+import io
+import math
+import csv
+import json
+
+from s3misc.units import foursigfloat, bucket_units
+from s3misc.DirectoryStack import DirStats
+from s3misc.PageRenderer import PageRenderer
+
+# Formats understood by MakeSink, for the command line.
+sink_formats = ['text', 'ndjson', 'csv', 'tsv']
+
+# Columns for the delimited formats. Objects and directory totals share one header;
+# fields that don't apply to a record are left empty.
+record_fields = ['type', 'bucket', 'key', 'size', 'last_modified', 'storage_class',
+                 'objects', 'subdir_objects', 'subdir_size', 'low', 'high',
+                 'etag', 'old_size', 'old_last_modified', 'old_etag', 'changes']
+
+class OutputSink:
+    """ Where a listing goes. BucketPrinter decides what to report, a sink decides how
+        it looks.
+
+        Output is collected as text and written to a binary stream in large chunks,
+        rather than one print() per object.
+    """
+
+    # Bytes (well, characters) to collect before writing to the stream.
+    _bufsize = 1 << 16
+
+    def __init__(self, stream):
+        """ stream is a binary file, such as sys.stdout.buffer. """
+        self._stream = stream
+        self._buffer = []
+        self._buffered = 0
+
+        # Per-listing settings, from Begin.
+        self._bucket = None
+        self._oldbucket = None
+        self._blocksize = -1
+        self._dirtotals = False
+
+    def Write(self, text: str):
+        self._buffer.append(text)
+        self._buffered = self._buffered + len(text)
+        if (self._buffered >= self._bufsize):
+            self.Flush()
+
+    def Flush(self):
+        if (len(self._buffer) > 0):
+            self._stream.write(''.join(self._buffer).encode('utf-8'))
+            self._buffer = []
+            self._buffered = 0
+        self._stream.flush()
+
+    def Offset(self):
+        """ Flush, and return how far into the stream the output has got: None if the
+            stream can't tell (a pipe, say).
+        """
+        self.Flush()
+        try:
+            return self._stream.tell()
+        except (OSError, AttributeError):
+            return None
+
+    def Begin(self, bucket: str, delim: str, match: str, blocksize: int, dirtotals: bool):
+        """ Start of a bucket listing. """
+        # Anything print()ed before us sits in sys.stdout's own buffer. Get it out first.
+        sys.stdout.flush()
+
+        self._bucket = bucket
+        self._blocksize = blocksize
+        self._dirtotals = dirtotals
+
+    def BeginDiff(self, old: tuple, new: tuple, blocksize: int, dirtotals: bool):
+        """ Start of a comparison of two listings, each (bucket, delim, match). """
+        sys.stdout.flush()
+
+        self._bucket = new[0]
+        self._oldbucket = old[0]
+        self._blocksize = blocksize
+        self._dirtotals = dirtotals
+
+    def Directory(self, dirname: str):
+        """ The listing has entered a directory. """
+        pass
+
+    def Object(self, item: dict, keyname: str):
+        """ An object. keyname is the key relative to its directory. """
+        raise NotImplementedError()
+
+    def Subdirectory(self, item: dict, keyname: str):
+        """ A subdirectory the listing doesn't descend into. keyname is relative to its
+            parent directory.
+        """
+        raise NotImplementedError()
+
+    def DirectoryTotals(self, stats: DirStats):
+        """ A directory is finished. stats.path is '' for the bucket itself. """
+        raise NotImplementedError()
+
+    def TopObjects(self, ranked: list):
+        """ The largest objects of the listing: (size, item) pairs, largest first. """
+        raise NotImplementedError()
+
+    def TopDirectories(self, ranked: list):
+        """ The heaviest directories of the listing: (total size, DirStats) pairs,
+            heaviest first.
+        """
+        raise NotImplementedError()
+
+    def DiffObject(self, kind: str, key: str, old: dict, new: dict, changes: list):
+        """ An object that differs: kind is 'added' (only new), 'removed' (only old) or
+            'changed' (in both; changes says which of diff_fields differ). key is
+            relative to each side's prefix.
+        """
+        raise NotImplementedError()
+
+    def DiffDirectory(self, stats: DirStats):
+        """ Net change of a directory, '' for everything compared: objects and size are
+            the change in objects and bytes directly in it, subobjects and subsize in
+            its subdirectories.
+        """
+        raise NotImplementedError()
+
+    def DiffTotals(self, totals):
+        """ End of a comparison: a DiffTotals. """
+        raise NotImplementedError()
+
+    def AccountTotals(self, stats: DirStats, listings: int):
+        """ Grand total over several listings: their bucket totals, rolled into the
+            subdirectory totals of stats.
+        """
+        raise NotImplementedError()
+
+    def EstimatedTotals(self, rows: list, total, z: float, requests: int, budget: int):
+        """ Instead of a listing, estimates of it: an Estimate (see Estimator) for each
+            top-level directory, for the objects directly under the prefix, and for the
+            directories not sampled (path None); and total, of everything. Intervals
+            are z standard deviations each way. requests: how many of the budget were
+            used.
+        """
+        raise NotImplementedError()
+
+    def End(self):
+        """ End of a bucket listing. """
+        self.Flush()
+
+    def Close(self):
+        """ No more listings. """
+        self.Flush()
+
+
+class TextSink(OutputSink):
+    """ The human readable listing. Object lines are collected and rendered a page at
+        a time (see PageRenderer), before anything else is written.
+    """
+
+    # Objects to collect before rendering them.
+    _pagesize = 1000
+
+    def __init__(self, stream, header: bool = True):
+        """ header: False when continuing output that already has the first listing's
+            opening lines.
+        """
+        super().__init__(stream)
+        self._renderer = PageRenderer(-1)
+        self._pending = []
+        self._header = header
+
+    def Heading(self, text: str):
+        """ Write one of a listing's opening lines, unless they're already there. """
+        if (self._header):
+            self.Write(text)
+
+    def Write(self, text: str):
+        if (len(self._pending) > 0):
+            self.RenderPending()
+        super().Write(text)
+
+    def RenderPending(self):
+        pending = self._pending
+        self._pending = []
+        super().Write(self._renderer.Render(pending))
+
+    def Flush(self):
+        if (len(self._pending) > 0):
+            self.RenderPending()
+        super().Flush()
+
+    def FormatSize(self, size: int) -> str:
+        if (self._blocksize == -1):
+            return foursigfloat(size, bucket_units)
+        return "{} blocks".format(size / self._blocksize)
+
+    def Begin(self, bucket: str, delim: str, match: str, blocksize: int, dirtotals: bool):
+        super().Begin(bucket, delim, match, blocksize, dirtotals)
+        self._renderer = PageRenderer(blocksize)
+        self.Heading("Printing bucket: {}, delim: {}, match: {}\n".format(bucket, delim, match))
+        # Any listings after this one are new.
+        self._header = True
+
+    def BeginDiff(self, old: tuple, new: tuple, blocksize: int, dirtotals: bool):
+        super().BeginDiff(old, new, blocksize, dirtotals)
+        self._renderer = PageRenderer(blocksize)
+        self.Write("Comparing {}:{} with {}:{}, delim: {}\n".format(
+                            old[0], old[2] or '', new[0], new[2] or '', new[1]))
+
+    def Directory(self, dirname: str):
+        self.Write("\n" + dirname + ":\n")
+
+    def Object(self, item: dict, keyname: str):
+        self._pending.append((item, keyname))
+        if (len(self._pending) >= self._pagesize):
+            self.RenderPending()
+
+    def Subdirectory(self, item: dict, keyname: str):
+        self.Write("<subdirectory>: {}\n".format(keyname))
+
+    def DirectoryTotals(self, stats: DirStats):
+        # If not printing out directory totals, only the bucket gets a summary.
+        if (stats.path != '' and not self._dirtotals):
+            return
+
+        if (stats.path == ''):
+            self.Write("\nBucket totals:\n")
+        else:
+            self.Write(stats.path + " totals:\n")
+        self.Write("{} directory objects; {} directory size\n".format(
+                            stats.objects, self.FormatSize(stats.size)))
+
+        # If there were sub directories, print out subtotals
+        if (stats.subobjects > 0):
+            self.Write("    {} total subdirectory objects; {} total subdirectory size\n".format(
+                                stats.subobjects, self.FormatSize(stats.subsize)))
+
+        self.Write("    Latest modification: {}\n".format(stats.latest))
+
+        if (stats.histogram is not None):
+            self.Write("    By size, including subdirectories:\n")
+            for (label, low, high, objects, size) in stats.histogram.SizeRows():
+                self.Write("        {:>17}: {} objects; {}\n".format(label, objects, self.FormatSize(size)))
+            self.Write("    By age, including subdirectories:\n")
+            for (label, low, high, objects, size) in stats.histogram.AgeRows():
+                self.Write("        {:>17}: {} objects; {}\n".format(label, objects, self.FormatSize(size)))
+
+    def FormatDelta(self, size: int) -> str:
+        if (size < 0):
+            return "-" + self.FormatSize(-size)
+        return "+" + self.FormatSize(size)
+
+    def DiffObject(self, kind: str, key: str, old: dict, new: dict, changes: list):
+        renderer = self._renderer
+        if (kind == 'added'):
+            self.Write("+ " + renderer.Render([(new, key)]))
+        elif (kind == 'removed'):
+            self.Write("- " + renderer.Render([(old, key)]))
+        else:
+            described = []
+            for change in changes:
+                if (change == 'size'):
+                    described.append("size {} -> {}".format(
+                            renderer.FormatSize(old['Size']), renderer.FormatSize(new['Size'])))
+                elif (change == 'mtime'):
+                    described.append("modified {} -> {}".format(
+                            renderer.FormatTime(old['LastModified']),
+                            renderer.FormatTime(new['LastModified'])))
+                else:
+                    described.append("etag {} -> {}".format(old.get('ETag'), new.get('ETag')))
+            self.Write("~ {}: {}\n".format(key, "; ".join(described)))
+
+    def DiffDirectory(self, stats: DirStats):
+        if (stats.path == ''):
+            self.Write("\nNet change:\n")
+        else:
+            self.Write(stats.path + " net change:\n")
+        self.Write("{:+d} directory objects; {} directory size\n".format(
+                            stats.objects, self.FormatDelta(stats.size)))
+        if (stats.subobjects != 0 or stats.subsize != 0):
+            self.Write("    {:+d} total subdirectory objects; {} total subdirectory size\n".format(
+                                stats.subobjects, self.FormatDelta(stats.subsize)))
+
+    def DiffTotals(self, totals):
+        self.Write("{} added ({}); {} removed ({}); {} changed ({}); {} unchanged\n".format(
+                            totals.added, self.FormatSize(totals.addedsize),
+                            totals.removed, self.FormatSize(totals.removedsize),
+                            totals.changed, self.FormatDelta(totals.changedsize),
+                            totals.unchanged))
+
+    def TopObjects(self, ranked: list):
+        self.Write("\nLargest {} objects:\n".format(len(ranked)))
+        self.Write(self._renderer.Render([(item, item['Key']) for (size, item) in ranked]))
+
+    def TopDirectories(self, ranked: list):
+        self.Write("\nLargest {} directories:\n".format(len(ranked)))
+        for (size, stats) in ranked:
+            self.Write("{} in {} objects: {}\n".format(
+                            self.FormatSize(size), stats.objects + stats.subobjects, stats.path))
+
+    def FormatEstimate(self, estimate, z: float) -> str:
+        if (estimate.Exact()):
+            return "{} objects; {} (exact)".format(estimate.seenobjects, self.FormatSize(estimate.seensize))
+        (lowobjects, highobjects) = estimate.ObjectsInterval(z)
+        (lowsize, highsize) = estimate.SizeInterval(z)
+        if (math.isinf(highobjects)):
+            # Not enough budget to say more.
+            return "at least {} objects; at least {}".format(estimate.seenobjects,
+                                                             self.FormatSize(estimate.seensize))
+        return "~{:.0f} objects ({:.0f} to {:.0f}); ~{} ({} to {})".format(
+                    estimate.objects, lowobjects, highobjects, self.FormatSize(round(estimate.size)),
+                    self.FormatSize(round(lowsize)), self.FormatSize(round(highsize)))
+
+    def EstimatedTotals(self, rows: list, total, z: float, requests: int, budget: int):
+        self.Write("Estimated from {} of {} requests; {:.0f}% intervals:\n".format(
+                            requests, budget, 100 * math.erf(z / math.sqrt(2))))
+        for estimate in rows:
+            if (estimate.path is None):
+                name = "(directories not sampled)"
+            else:
+                name = estimate.path or "(bucket)"
+            self.Write("{}: {}\n".format(name, self.FormatEstimate(estimate, z)))
+        self.Write("\nEstimated totals:\n{}\n".format(self.FormatEstimate(total, z)))
+        self.Write("    Latest modification seen: {}\n".format(total.latest))
+
+    def AccountTotals(self, stats: DirStats, listings: int):
+        self.Write("\nAccount totals ({} listings):\n".format(listings))
+        self.Write("{} total objects; {} total size\n".format(
+                            stats.subobjects, self.FormatSize(stats.subsize)))
+        self.Write("    Latest modification: {}\n".format(stats.latest))
+
+
+class RecordSink(OutputSink):
+    """ Machine readable listings: one record per object, per subdirectory not listed
+        (type 'prefix') and per directory total.
+        Directory records are only written for directories BucketPrinter reports on
+        (all of them with directory totals, otherwise just the bucket, key '').
+    """
+
+    def Object(self, item: dict, keyname: str):
+        self.Record({
+                'type': 'object',
+                'bucket': self._bucket,
+                'key': item['Key'],
+                'size': item['Size'],
+                'last_modified': item['LastModified'].isoformat(),
+                'storage_class': item.get('StorageClass')
+            })
+
+    def Subdirectory(self, item: dict, keyname: str):
+        self.Record({
+                'type': 'prefix',
+                'bucket': self._bucket,
+                'key': item['Key']
+            })
+
+    def DirectoryTotals(self, stats: DirStats):
+        if (not self._dirtotals and stats.path != ''):
+            return
+        self.Record({
+                'type': 'directory',
+                'bucket': self._bucket,
+                'key': stats.path,
+                'size': stats.size,
+                'last_modified': stats.latest.isoformat() if (stats.latest) else None,
+                'objects': stats.objects,
+                'subdir_objects': stats.subobjects,
+                'subdir_size': stats.subsize
+            })
+
+        if (stats.histogram is not None):
+            # One record per bucket: size in bytes, or age in days, from low up to high.
+            for (kind, rows) in (('size_bucket', stats.histogram.SizeRows()),
+                                 ('age_bucket', stats.histogram.AgeRows())):
+                for (label, low, high, objects, size) in rows:
+                    self.Record({
+                            'type': kind,
+                            'bucket': self._bucket,
+                            'key': stats.path,
+                            'size': size,
+                            'objects': objects,
+                            'low': low,
+                            'high': high
+                        })
+
+    def DiffObject(self, kind: str, key: str, old: dict, new: dict, changes: list):
+        record = {'type': kind}
+        if (new is not None):
+            record.update({
+                    'bucket': self._bucket,
+                    'key': new['Key'],
+                    'size': new['Size'],
+                    'last_modified': new['LastModified'].isoformat(),
+                    'storage_class': new.get('StorageClass'),
+                    'etag': new.get('ETag')
+                })
+        else:
+            record.update({'bucket': self._oldbucket, 'key': old['Key']})
+        if (old is not None):
+            record.update({
+                    'old_size': old['Size'],
+                    'old_last_modified': old['LastModified'].isoformat(),
+                    'old_etag': old.get('ETag')
+                })
+        if (changes is not None):
+            record['changes'] = ','.join(changes)
+        self.Record(record)
+
+    def DiffDirectory(self, stats: DirStats):
+        self.Record({
+                'type': 'directory_change',
+                'bucket': self._bucket,
+                'key': stats.path,
+                'size': stats.size,
+                'objects': stats.objects,
+                'subdir_objects': stats.subobjects,
+                'subdir_size': stats.subsize
+            })
+
+    def DiffTotals(self, totals):
+        for (kind, objects, size) in (('added', totals.added, totals.addedsize),
+                                      ('removed', totals.removed, totals.removedsize),
+                                      ('changed', totals.changed, totals.changedsize),
+                                      ('unchanged', totals.unchanged, None)):
+            self.Record({'type': kind + '_total', 'bucket': self._bucket,
+                         'objects': objects, 'size': size})
+
+    def TopObjects(self, ranked: list):
+        for (size, item) in ranked:
+            self.Record({
+                    'type': 'top_object',
+                    'bucket': self._bucket,
+                    'key': item['Key'],
+                    'size': item['Size'],
+                    'last_modified': item['LastModified'].isoformat(),
+                    'storage_class': item.get('StorageClass')
+                })
+
+    def TopDirectories(self, ranked: list):
+        for (size, stats) in ranked:
+            self.Record({
+                    'type': 'top_directory',
+                    'bucket': self._bucket,
+                    'key': stats.path,
+                    'size': stats.size,
+                    'last_modified': stats.latest.isoformat() if (stats.latest) else None,
+                    'objects': stats.objects,
+                    'subdir_objects': stats.subobjects,
+                    'subdir_size': stats.subsize
+                })
+
+    def EstimatedTotals(self, rows: list, total, z: float, requests: int, budget: int):
+        # Two records per estimate, objects and bytes, each with its interval.
+        for (estimate, prefix) in [(estimate, 'estimated_') for estimate in rows] + [(total, 'estimated_total_')]:
+            (lowobjects, highobjects) = estimate.ObjectsInterval(z)
+            (lowsize, highsize) = estimate.SizeInterval(z)
+            self.Record({
+                    'type': prefix + 'objects',
+                    'bucket': self._bucket,
+                    'key': estimate.path,
+                    'last_modified': estimate.latest.isoformat() if (estimate.latest) else None,
+                    'objects': round(estimate.objects),
+                    'low': round(lowobjects),
+                    'high': round(highobjects) if (math.isfinite(highobjects)) else None
+                })
+            self.Record({
+                    'type': prefix + 'size',
+                    'bucket': self._bucket,
+                    'key': estimate.path,
+                    'size': round(estimate.size),
+                    'low': round(lowsize),
+                    'high': round(highsize) if (math.isfinite(highsize)) else None
+                })
+
+    def AccountTotals(self, stats: DirStats, listings: int):
+        self.Record({
+                'type': 'account',
+                'size': stats.subsize,
+                'last_modified': stats.latest.isoformat() if (stats.latest) else None,
+                'objects': stats.subobjects
+            })
+
+    def Record(self, record: dict):
+        raise NotImplementedError()
+
+
+class NDJSONSink(RecordSink):
+    """ One JSON object per line. """
+
+    def Record(self, record: dict):
+        self.Write(json.dumps(record, separators=(',', ':')) + "\n")
+
+
+class DelimitedSink(RecordSink):
+    """ CSV or TSV, with a header line before the first record. """
+
+    def __init__(self, stream, delimiter: str, header: bool = True):
+        """ header: False when continuing output that already has one. """
+        super().__init__(stream)
+        self._text = io.StringIO()
+        self._writer = csv.DictWriter(self._text, record_fields, delimiter=delimiter,
+                                      lineterminator="\n")
+        if (header):
+            self._writer.writeheader()
+
+    def Record(self, record: dict):
+        self._writer.writerow(record)
+        if (self._text.tell() >= self._bufsize):
+            self.Write(self.TakeText())
+
+    def TakeText(self) -> str:
+        text = self._text.getvalue()
+        self._text.seek(0)
+        self._text.truncate()
+        return text
+
+    def Flush(self):
+        self._buffer.append(self.TakeText())
+        super().Flush()
+
+
+def MakeSink(format: str, stream, header: bool = True) -> OutputSink:
+    """ Sink for one of sink_formats, writing to the binary stream. header: whether
+        formats that start with a header line should write one (text: the opening
+        lines of the first listing).
+    """
+    if (format == 'text'):
+        return TextSink(stream, header)
+    if (format == 'ndjson'):
+        return NDJSONSink(stream)
+    if (format == 'csv'):
+        return DelimitedSink(stream, ',', header)
+    if (format == 'tsv'):
+        return DelimitedSink(stream, '\t', header)
+    raise ValueError("Unknown output format: {}".format(format))
@@ -0,0 +1,65 @@
+
+import queue
+import threading
+
+# End of pages marker, so that a page can never be mistaken for it.
+_done = object()
+
+class PagePrefetcher:
+    """ Iterate pages from a paginator on a background thread.
+
+        While the consumer is matching, accounting and printing page N, the thread is
+        already fetching page N+1. At most `depth` pages wait in the queue, so memory
+        stays bounded no matter how far ahead the network could get.
+
+        An exception raised by the paginator is re-raised in the consumer, at the point
+        in the stream where it happened.
+    """
+
+    def __init__(self, pages, depth: int):
+        if (depth < 1):
+            raise ValueError("Given queue depth ({}) for PagePrefetcher is invalid.".format(depth))
+        self._pages = pages
+        self._queue = queue.Queue(depth)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __iter__(self):
+        self._thread = threading.Thread(target=self.Fetch, daemon=True)
+        self._thread.start()
+        try:
+            while (True):
+                page = self._queue.get()
+                if (page is _done):
+                    break
+                if (isinstance(page, BaseException)):
+                    raise page
+                yield page
+        finally:
+            # Normal end, consumer error, or consumer stopped early: let the thread go.
+            self._stop.set()
+            self._thread.join()
+
+    def Fetch(self):
+        """ Background thread: move pages from the paginator into the queue. """
+        try:
+            for page in self._pages:
+                if (not self.Put(page)):
+                    return
+            self.Put(_done)
+        except BaseException as e:
+            self.Put(e)
+        finally:
+            close = getattr(self._pages, 'close', None)
+            if (close is not None):
+                close()
+
+    def Put(self, value) -> bool:
+        """ Blocking put that gives up once the consumer has gone away. """
+        while (not self._stop.is_set()):
+            try:
+                self._queue.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
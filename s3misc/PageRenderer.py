@@ -0,0 +1,114 @@
+from s3misc.units import foursigfloat, bucket_units
+
+class PageRenderer:
+    """ Text lines for objects, a page at a time.
+
+        Most of the cost of a text listing was strftime, foursigfloat and str.format for
+        every object. Buckets repeat themselves: objects uploaded together share a
+        timestamp, and lots of objects share a size. So formatted times are cached per
+        distinct modification time and formatted sizes per distinct byte count, and a
+        whole page of lines is built and joined in one go.
+
+        Some buckets don't repeat themselves, and a cache that misses costs more than
+        it saves. One that misses on most objects is left alone for a while, and
+        those objects formatted directly.
+    """
+
+    # Entries per cache. When one fills up it starts over, so memory stays bounded.
+    _cachesize = 1 << 16
+
+    # How many objects to judge the caches by: one that missed on more than half of
+    # them isn't used for the next _retrywindows as many.
+    _window = 4096
+    _retrywindows = 8
+
+    def __init__(self, blocksize: int):
+        """ blocksize: -1 for human readable sizes, otherwise sizes in blocks. """
+        self._blocksize = blocksize
+        self._sizes = dict()
+        self._times = dict()
+
+        # Objects rendered in this window, and the caches' misses on them; how many
+        # more windows each cache is left alone for.
+        self._counted = 0
+        self._sizemisses = 0
+        self._timemisses = 0
+        self._sizesoff = 0
+        self._timesoff = 0
+
+    def SizeText(self, size: int) -> str:
+        """ size formatted, without the cache. """
+        if (self._blocksize == -1):
+            return foursigfloat(size, bucket_units)
+        return '{:0.0f} blocks'.format(size / self._blocksize)
+
+    def TimeText(self, lastmod) -> str:
+        """ lastmod formatted, without the cache: what strftime('%Y-%m-%d %H:%M:%S')
+            gives, in half the time.
+        """
+        return '%04d-%02d-%02d %02d:%02d:%02d' % (lastmod.year, lastmod.month, lastmod.day,
+                                                  lastmod.hour, lastmod.minute, lastmod.second)
+
+    def FormatSize(self, size: int) -> str:
+        itemsize = self._sizes.get(size)
+        if (itemsize is None):
+            itemsize = self.SizeText(size)
+            if (len(self._sizes) >= self._cachesize):
+                self._sizes.clear()
+            self._sizes[size] = itemsize
+        return itemsize
+
+    def FormatTime(self, lastmod) -> str:
+        text = self._times.get(lastmod)
+        if (text is None):
+            text = self.TimeText(lastmod)
+            if (len(self._times) >= self._cachesize):
+                self._times.clear()
+            self._times[lastmod] = text
+        return text
+
+    def Render(self, objects: list) -> str:
+        """ objects: (item, keyname) pairs, keyname relative to the item's directory.
+            Returns their lines, joined.
+        """
+        # A cache left alone is an empty one that's never filled.
+        (sizes, formatsize) = (self._sizes, self.FormatSize) if (self._sizesoff == 0) else ({}, self.SizeText)
+        (times, formattime) = (self._times, self.FormatTime) if (self._timesoff == 0) else ({}, self.TimeText)
+        sizemisses = 0
+        timemisses = 0
+        lines = []
+        for (item, keyname) in objects:
+            # size.1 GB 2020-05-22: MyEntry.txt
+            itemsize = sizes.get(item['Size'])
+            if (itemsize is None):
+                itemsize = formatsize(item['Size'])
+                sizemisses = sizemisses + 1
+            lastmod = times.get(item['LastModified'])
+            if (lastmod is None):
+                lastmod = formattime(item['LastModified'])
+                timemisses = timemisses + 1
+            if (len(keyname) == 0):
+                keyname = "<directory object>"
+            lines.append(itemsize + " " + lastmod + ": " + keyname + "\n")
+        self.CountMisses(len(objects), sizemisses, timemisses)
+        return ''.join(lines)
+
+    def CountMisses(self, objects: int, sizemisses: int, timemisses: int):
+        """ At the end of each window, leave alone the caches that missed on most of it,
+            and try again with the ones that have been left alone long enough.
+        """
+        self._counted = self._counted + objects
+        self._sizemisses = self._sizemisses + sizemisses
+        self._timemisses = self._timemisses + timemisses
+        if (self._counted < self._window):
+            return
+        self._sizesoff = self.WindowsOff(self._sizesoff, self._sizemisses)
+        self._timesoff = self.WindowsOff(self._timesoff, self._timemisses)
+        self._counted = 0
+        self._sizemisses = 0
+        self._timemisses = 0
+
+    def WindowsOff(self, off: int, misses: int) -> int:
+        if (off > 0):
+            return off - 1
+        return self._retrywindows if (misses * 2 > self._counted) else 0
@@ -0,0 +1,446 @@
+import bisect
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Characters used to split a wide, flat "directory" into StartAfter ranges when the
+# delimiter doesn't give us enough shards. Keys outside of this set still land in
+# the first or last range, they just aren't split any further.
+split_chars = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+# Sorts after any character a key can have: prefix + this is past every key under prefix.
+last_char = '\U0010ffff'
+
+def CommonPrefix(first: str, second: str) -> str:
+    """ The longest prefix first and second share. Every key between them has it too. """
+    length = min(len(first), len(second))
+    idx = 0
+    while (idx < length and first[idx] == second[idx]):
+        idx = idx + 1
+    return first[0:idx]
+
+def CharKind(char: str) -> int:
+    """ 0 for digits, 1 for upper case letters, 2 for lower case, 3 for anything else. """
+    if (char.isdigit()):
+        return 0
+    if (char.isupper()):
+        return 1
+    if (char.islower()):
+        return 2
+    return 3
+
+
+class KeySegment:
+    """ A stretch of the keyspace being cut into shards: the keys after lowkey (None
+        for the start) up to the next segment's lowkey, and about what share of the
+        listing they are.
+
+        A segment that is a directory not looked into yet can be taken apart into
+        smaller segments (see ParallelLister.TakeApart). One with more in it than a
+        page holds is split like a flat directory: sample holds its first page's
+        names, objects and subdirectories. One split off by character has the stem
+        all its keys start with, and the alphabet the rest of them are taken to be
+        spread over evenly.
+    """
+    __slots__ = ('lowkey', 'weight', 'directory', 'sample', 'stem', 'alphabet')
+
+    def __init__(self, lowkey: str, weight: float, directory: str = None, sample: list = None,
+                 stem: str = None, alphabet: list = None):
+        self.lowkey = lowkey
+        self.weight = weight
+        # The prefix to look into, None once there's nothing more to learn.
+        self.directory = directory
+        self.sample = sample
+        self.stem = stem
+        self.alphabet = alphabet
+
+    def Before(self, key: str) -> float:
+        """ About what share of the segment's keys come before key, one inside it. """
+        if (self.stem is None or not key.startswith(self.stem)):
+            return 0.5
+        # Read the rest of the key as a fraction, in digits of the alphabet.
+        before = 0.0
+        scale = 1.0
+        for char in key[len(self.stem):len(self.stem) + 8]:
+            scale = scale / len(self.alphabet)
+            before = before + bisect.bisect_left(self.alphabet, char) * scale
+        return before
+
+
+class ParallelLister:
+    """ List one prefix of a bucket with several concurrent list_objects_v2 paginators.
+
+        The keyspace under the prefix is cut into shards by a sorted list of boundary
+        keys. Shard i holds the keys in (boundary[i-1], boundary[i]]: it is listed with
+        StartAfter=boundary[i-1] and stops once it passes boundary[i]. Any set of
+        boundaries is a correct partition, so discovery only has to find useful ones:
+        about as many as there are workers to keep busy, cutting the listing into
+        shards of about the same number of keys (see DiscoverBoundaries).
+
+        Pages are handed back shard by shard, in boundary order, so the consumer still
+        sees keys in lexical order.
+    """
+
+    # Pages buffered per shard before its worker waits for the consumer to catch up.
+    _queuedepth = 4
+
+    # Don't spend more than this many rounds of requests looking for shards, or more
+    # requests than this.
+    _maxrounds = 12
+    _maxprobes = 64
+
+    # Characters probed at once, splitting a flat directory, and at most how many
+    # pieces to split it into.
+    _probewidth = 8
+    _maxstems = 1 << 14
+
+    def __init__(self, s3client, workers: int, delim: str):
+        if (workers < 1):
+            raise ValueError("Given worker count ({}) for ParallelLister is invalid.".format(workers))
+        self._s3client = s3client
+        self._workers = workers
+        self._delim = delim
+
+        # Enough shards that one large shard doesn't leave the other workers idle, if
+        # there's no telling how big the listing is. If there is, shards are as many
+        # pages as their queues hold: a worker can get all of its shard ahead of the
+        # consumer, without waiting for it, and no more requests are spent on shards
+        # than that takes.
+        self._targetshards = workers * 4
+
+    def ListPages(self, params: dict):
+        """ Generator of pages (dicts with 'Contents') for the given list_objects_v2
+            parameters, in the same key order a single paginator would give.
+        """
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            (boundaries, firstpage) = self.DiscoverBoundaries(pool, params, self._targetshards,
+                                                              self._queuedepth)
+
+            shards = []
+            lowkey = None
+            for highkey in boundaries:
+                shards.append((lowkey, highkey))
+                lowkey = highkey
+            shards.append((lowkey, None))
+
+            stop = threading.Event()
+            pending = []
+            nextshard = 0
+            try:
+                while (nextshard < len(shards) or pending):
+                    # Keep a window of `workers` shards in flight ahead of the consumer.
+                    while (nextshard < len(shards) and len(pending) < self._workers):
+                        shardqueue = queue.Queue(self._queuedepth)
+                        # The first shard starts with the page discovery already has.
+                        pool.submit(self.ListShard, params, shards[nextshard], shardqueue, stop,
+                                    firstpage if (nextshard == 0) else None)
+                        pending.append(shardqueue)
+                        nextshard = nextshard + 1
+
+                    shardqueue = pending.pop(0)
+                    while (True):
+                        page = shardqueue.get()
+                        if (page is None):
+                            break
+                        if (isinstance(page, BaseException)):
+                            raise page
+                        yield page
+            finally:
+                # Consumer is done (or failed). Release any workers blocked on a full queue.
+                stop.set()
+
+    def DiscoverBoundaries(self, pool, params: dict, count: int, pagespershard: int = 0) -> tuple:
+        """ Boundaries for count shards of the listing params asks for, with about as
+            many keys in each; or, given pagespershard, for as many shards as it takes
+            to make them that many pages (count if that can't be told). Returns
+            (boundaries, first page of the listing).
+
+            The first page comes first: a listing that fits in it needs no shards. Then
+            the prefix is taken apart by delimiter, a level at a time, only going down
+            into the directories that still hold more than a shard's share; each of a
+            directory's subdirectories is taken to hold an even share of it. Too many
+            of those for a page, or a flat directory, are split by character instead.
+            The pieces are then put back together, in order, into shards of about equal
+            shares. How much of it all the first page covered says how many pages the
+            listing is, so the piece it ended in is taken apart further too.
+        """
+        # Probes ask for what the listing does, but of other prefixes and starts.
+        self._probeparams = dict((key, value) for (key, value) in params.items()
+                                 if (key not in ('Prefix', 'StartAfter', 'Delimiter', 'MaxKeys')))
+        firstpage = self._s3client.list_objects_v2(**params)
+        if (count < 2 or not firstpage.get('IsTruncated')):
+            return ([], firstpage)
+        prefix = params.get('Prefix', '')
+        startafter = params.get('StartAfter')
+        contents = firstpage.get('Contents', ())
+        lastkey = contents[-1]['Key'] if (len(contents) > 0) else None
+
+        if (self._delim):
+            segments = [KeySegment(None, 1.0, prefix)]
+        else:
+            # No directories at all: the whole prefix is flat.
+            segments = [KeySegment(None, 1.0, prefix, [item['Key'] for item in contents])]
+        probes = 0
+        for rounds in range(self._maxrounds):
+            self.SkipStart(segments, startafter)
+            shards = self.ShardCount(segments, lastkey, count, pagespershard)
+            # Pieces no bigger than count shards would be either way: they're put back
+            # together if there turn out to be fewer.
+            share = sum(segment.weight for segment in segments) / max(shards, count)
+            heavy = [idx for (idx, segment) in enumerate(segments)
+                     if ((segment.directory is not None or segment.stem is not None) and
+                         segment.weight > share)]
+            # The piece the first page ended in, while it's bigger than what the page
+            # covered: the smaller it is, the better the count of pages.
+            (covered, partial) = self.Coverage(segments, lastkey)
+            if (partial is not None and segments[partial].directory is not None and
+                    segments[partial].weight > covered and partial not in heavy):
+                heavy = sorted(heavy + [partial])
+            # A big listing can spend more on finding its shards; the heaviest first.
+            budget = max(self._maxprobes, shards // 2) - probes
+            if (len(heavy) == 0 or budget <= 0):
+                break
+            if (len(heavy) > budget):
+                heavy = sorted(sorted(heavy, key=lambda idx: -segments[idx].weight)[0:budget])
+            results = list(pool.map(lambda idx: self.TakeApart(segments[idx], share), heavy))
+            for (idx, (parts, used)) in reversed(list(zip(heavy, results))):
+                segments[idx:idx + 1] = parts
+                probes = probes + used
+        self.SkipStart(segments, startafter)
+        shards = self.ShardCount(segments, lastkey, count, pagespershard)
+
+        total = sum(segment.weight for segment in segments)
+        boundaries = []
+        accumulated = 0.0
+        for segment in segments:
+            if (accumulated >= total * (len(boundaries) + 1) / shards and segment.lowkey is not None and
+                    (startafter is None or segment.lowkey > startafter) and
+                    (len(boundaries) == 0 or segment.lowkey > boundaries[-1])):
+                boundaries.append(segment.lowkey)
+                if (len(boundaries) == shards - 1):
+                    break
+            accumulated = accumulated + segment.weight
+        return (boundaries, firstpage)
+
+    def ShardCount(self, segments: list, lastkey: str, count: int, pagespershard: int) -> int:
+        """ How many shards to cut segments into (see DiscoverBoundaries). The share of
+            them the first page covered, up to lastkey, says how many pages they are:
+            a shard for each pagespershard of them, but no fewer than one a worker, as
+            long as there are pages for them.
+        """
+        if (pagespershard < 1 or lastkey is None):
+            return count
+        (covered, partial) = self.Coverage(segments, lastkey)
+        if (partial is not None):
+            covered = covered + segments[partial].weight * segments[partial].Before(lastkey)
+        if (covered <= 0):
+            return count
+        pages = sum(segment.weight for segment in segments) / covered
+        return max(1, int(pages / pagespershard), min(self._workers, int(pages)))
+
+    def Coverage(self, segments: list, lastkey: str) -> tuple:
+        """ The weight of the segments that end at or before lastkey, and the index of
+            the one it's inside of (None if it's past them all).
+        """
+        covered = 0.0
+        for (idx, segment) in enumerate(segments):
+            if (lastkey is None or (segment.lowkey is not None and segment.lowkey >= lastkey)):
+                break
+            if (idx + 1 < len(segments) and segments[idx + 1].lowkey <= lastkey):
+                covered = covered + segment.weight
+            else:
+                return (covered, idx)
+        return (covered, None)
+
+    def SkipStart(self, segments: list, startafter: str):
+        """ Segments that end before the listing starts have nothing in it. """
+        if (startafter is None):
+            return
+        for idx in range(len(segments) - 1):
+            if (segments[idx + 1].lowkey > startafter):
+                break
+            segments[idx].weight = 0.0
+            segments[idx].directory = None
+
+    def TakeApart(self, segment: KeySegment, share: float) -> tuple:
+        """ The segments a segment is made of, in key order, with its weight shared
+            out among them. Returns (segments, requests used).
+        """
+        if (segment.sample is not None):
+            return self.SplitFlat(segment, share)
+        if (segment.directory is None):
+            # Split by character already: a character further, at no cost.
+            parts = []
+            for (idx, char) in enumerate(segment.alphabet):
+                lowkey = segment.stem + char if (idx > 0) else segment.lowkey
+                parts.append(KeySegment(lowkey, segment.weight / len(segment.alphabet),
+                                        stem=segment.stem + char, alphabet=segment.alphabet))
+            return (parts, 0)
+
+        response = self.Request(segment.directory, None, self._delim, 1000)
+        directories = [cp['Prefix'] for cp in response.get('CommonPrefixes', ())]
+        if (response.get('IsTruncated')):
+            # Too many to read: split it by the names of what's in it, like a flat one.
+            entries = sorted(directories + [item['Key'] for item in response.get('Contents', ())])
+            return ([KeySegment(segment.lowkey, segment.weight, segment.directory, entries)], 1)
+        if (len(directories) == 0):
+            return ([KeySegment(segment.lowkey, segment.weight)], 1)
+
+        # Objects directly in the directory are few next to its subdirectories: the
+        # weight goes to those.
+        parts = [KeySegment(segment.lowkey, 0.0)]
+        for directory in directories:
+            parts.append(KeySegment(directory, segment.weight / len(directories), directory))
+        return (parts, 1)
+
+    def SplitFlat(self, segment: KeySegment, share: float) -> tuple:
+        """ Split a flat segment by character: at the first character its keys don't
+            share, found with a probe past each longer prefix they might share, then
+            at characters of the kinds its keys are made of. Returns (segments,
+            requests used).
+        """
+        sample = segment.sample
+        common = CommonPrefix(sample[0], sample[-1])
+        base = len(segment.directory)
+        positions = list(range(max(base, len(common) - 2 * self._probewidth), len(common)))
+        # The first key past everything starting with common[0:pos + 1], if any.
+        nexts = list(zip(positions, self.ProbeAfter(
+                [common[0:pos + 1] + last_char for pos in positions], segment.directory)))
+        used = len(positions)
+
+        # The keys to split all start with common[0:split]; the next character varies.
+        split = len(common)
+        for (pos, nextkey) in nexts:
+            if (nextkey is not None):
+                split = pos
+                break
+        stem = common[0:split]
+        # Keys are made of the kinds of characters (digits, upper or lower case) seen
+        # varying in the sample.
+        kinds = set()
+        for pos in range(len(common), max(len(key) for key in sample)):
+            column = set(key[pos] for key in sample if (len(key) > pos))
+            if (len(column) > 1):
+                kinds.update(CharKind(char) for char in column)
+        alphabet = [char for char in split_chars if (CharKind(char) in kinds)]
+        if (len(alphabet) == 0):
+            alphabet = list(split_chars)
+
+        known = set(key[split] for key in sample if (len(key) > split))
+        for (pos, nextkey) in nexts:
+            if (pos == split and nextkey is not None):
+                known.add(nextkey[split])
+        first = min(known)
+        # Which characters after the ones known to be there have keys: each probe
+        # past one finds the next that does.
+        candidates = [char for char in alphabet if (char > max(known))]
+        if (len(candidates) > self._probewidth):
+            candidates = [candidates[(idx + 1) * len(candidates) // self._probewidth - 1]
+                          for idx in range(self._probewidth)]
+        found = self.ProbeAfter([stem + char + last_char for char in candidates], segment.directory)
+        used = used + len(candidates)
+        # Between a probed character and the next one found, there are none.
+        gaps = []
+        for (char, nextkey) in zip(candidates, found):
+            if (nextkey is None or not nextkey.startswith(stem) or len(nextkey) <= split):
+                gaps.append((char, last_char))
+            else:
+                known.add(nextkey[split])
+                gaps.append((char, nextkey[split]))
+        chars = [char for char in sorted(known.union(alphabet)) if (char >= first and
+                 (char in known or not any(low < char < high for (low, high) in gaps)))]
+
+        # Shared out evenly; a level further down by the alphabet, if that's not enough.
+        stems = [stem + char for char in chars]
+        while (segment.weight / len(stems) > share and len(stems) * len(alphabet) <= self._maxstems):
+            stems = [stem + char for stem in stems for char in alphabet]
+        parts = []
+        for (idx, stem) in enumerate(stems):
+            lowkey = stem if (idx > 0) else segment.lowkey
+            parts.append(KeySegment(lowkey, segment.weight / len(stems), stem=stem, alphabet=alphabet))
+        return (parts, used)
+
+    def ProbeAfter(self, startafters: list, prefix: str) -> list:
+        """ The first entry under prefix after each of startafters, or None; asked all
+            at once.
+        """
+        if (len(startafters) == 0):
+            return []
+        # A pool of their own: these are asked from the discovery pool's threads.
+        with ThreadPoolExecutor(max_workers=len(startafters)) as pool:
+            return list(pool.map(lambda startafter: self.ProbeOne(prefix, startafter), startafters))
+
+    def ProbeOne(self, prefix: str, startafter: str):
+        response = self.Request(prefix, startafter, self._delim, 1)
+        entries = [item['Key'] for item in response.get('Contents', ())]
+        entries.extend(cp['Prefix'] for cp in response.get('CommonPrefixes', ()))
+        return min(entries) if (len(entries) > 0) else None
+
+    def Request(self, prefix: str, startafter: str, delim: str, maxkeys: int) -> dict:
+        """ One list_objects_v2 request for probing the keyspace. """
+        params = dict(self._probeparams)
+        params['Prefix'] = prefix
+        params['MaxKeys'] = maxkeys
+        if (delim):
+            params['Delimiter'] = delim
+        if (startafter is not None):
+            params['StartAfter'] = startafter
+        return self._s3client.list_objects_v2(**params)
+
+    def ListShard(self, params: dict, shard, shardqueue: queue.Queue, stop: threading.Event,
+                  firstpage: dict = None):
+        """ Worker: list the keys in (lowkey, highkey] into shardqueue, then None.
+            firstpage is the shard's first page, if it was already fetched.
+            Exceptions are handed to the consumer through the queue.
+        """
+        (lowkey, highkey) = shard
+        try:
+            for page in self.ShardPages(params, shard, firstpage):
+                contents = page.get('Contents', [])
+                done = False
+                if (highkey is not None and len(contents) > 0 and contents[-1]['Key'] > highkey):
+                    # Passed the end of the shard. Trim the page and stop listing.
+                    contents = [item for item in contents if item['Key'] <= highkey]
+                    done = True
+
+                if (not self.Put(shardqueue, {'Contents': contents}, stop)):
+                    return
+                if (done):
+                    break
+            self.Put(shardqueue, None, stop)
+        except BaseException as e:
+            self.Put(shardqueue, e, stop)
+
+    def ShardPages(self, params: dict, shard, firstpage: dict = None):
+        """ Pages of the shard's keys, and maybe some after it, starting with firstpage
+            if there is one.
+        """
+        (lowkey, highkey) = shard
+        shardparams = dict(params)
+        paginator = self._s3client.get_paginator('list_objects_v2')
+        if (firstpage is not None):
+            yield firstpage
+            if (not firstpage.get('IsTruncated')):
+                return
+            yield from paginator.paginate(ContinuationToken=firstpage['NextContinuationToken'], **shardparams)
+            return
+
+        if (lowkey is not None and lowkey > shardparams.get('StartAfter', '')):
+            shardparams['StartAfter'] = lowkey
+        if (lowkey is not None and highkey is not None):
+            # Every key in between starts with what the two have in common: S3 stops
+            # at the end of that, rather than carrying on to the end of the prefix.
+            common = CommonPrefix(lowkey, highkey)
+            if (len(common) > len(shardparams.get('Prefix', ''))):
+                shardparams['Prefix'] = common
+        yield from paginator.paginate(**shardparams)
+
+    def Put(self, shardqueue: queue.Queue, value, stop: threading.Event) -> bool:
+        """ Blocking put that gives up once the consumer has gone away. """
+        while (not stop.is_set()):
+            try:
+                shardqueue.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
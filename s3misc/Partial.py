@@ -0,0 +1,128 @@
+
+import os
+import time
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from s3misc.TopN import TopN
+
+# Format version of partial results.
+partial_version = 2
+
+class Partial:
+    """ The totals of one key range of a listing, to be merged with the other ranges'.
+
+        A listing's totals come from its objects added up by directory, in key order,
+        by a DirectoryStack. Everything that needs is in how much each stretch of the
+        listing put into the directory it was in (see BucketLister.Fragments): so a key
+        range's fragments are its part of the totals. Fragments of ranges that follow
+        on from one another, put one after the other, are the fragments of the whole
+        listing, directories cut in two by a range boundary included. Accounting them
+        (BucketLister.AccountFragments) gives exactly the totals of one listing.
+
+        The largest objects are ranked in each range, and those rankings merged.
+
+        Saved as a pickle: only merge partials you made yourself.
+    """
+
+    def __init__(self, listing: tuple, keyrange: tuple, fragments: list, objectranks: TopN = None,
+                 topobjects: int = 0):
+        """ listing: (bucket, delim, match, recursive, depth, filter settings), what was
+            listed (see ObjectFilter.Settings; None for no filter). keyrange:
+            (lowkey, highkey), the keys in (lowkey, highkey]; None for an open end.
+            objectranks: the range's topobjects largest objects, if they were ranked.
+        """
+        self.listing = listing
+        self.keyrange = keyrange
+        self.fragments = fragments
+        self.objectranks = objectranks
+        self.topobjects = topobjects
+
+    def Save(self, path: str):
+        temppath = "{}.{}".format(path, os.getpid())
+        with open(temppath, 'wb') as partialfile:
+            pickle.dump((partial_version, self.__dict__), partialfile, pickle.HIGHEST_PROTOCOL)
+        os.replace(temppath, path)
+
+    @staticmethod
+    def Load(path: str) -> 'Partial':
+        with open(path, 'rb') as partialfile:
+            saved = pickle.load(partialfile)
+        if (not isinstance(saved, tuple) or len(saved) != 2 or saved[0] != partial_version):
+            raise ValueError("{} is not a partial listing that can be merged".format(path))
+        partial = Partial(None, None, None)
+        partial.__dict__.update(saved[1])
+        return partial
+
+
+def KeyRangeOrder(keyrange: tuple):
+    """ Sort key for key ranges: the one with an open start first. """
+    return (keyrange[0] is not None, keyrange[0] or '')
+
+def OrderPartials(partials: list) -> list:
+    """ partials in key order, checked to be of the same listing and to cover it: each
+        range starting where the one before ended, from an open start to an open end.
+    """
+    if (len(partials) == 0):
+        raise ValueError("No partial listings to merge")
+    partials = sorted(partials, key=lambda partial: KeyRangeOrder(partial.keyrange))
+    listing = partials[0].listing
+    highkey = None
+    for (idx, partial) in enumerate(partials):
+        if (tuple(partial.listing) != tuple(listing)):
+            raise ValueError("Partial listings are of different listings ({}:{} and {}:{}) or settings".format(
+                    listing[0], listing[2], partial.listing[0], partial.listing[2]))
+        if (partial.keyrange[0] != highkey or (idx > 0 and highkey is None)):
+            raise ValueError("Partial listings don't cover the listing: none of them starts {}".format(
+                    "after " + highkey if (highkey is not None) else "at the start"))
+        highkey = partial.keyrange[1]
+    if (highkey is not None):
+        raise ValueError("Partial listings don't cover the listing: nothing after {}".format(highkey))
+    return partials
+
+def MergeRanks(partials: list, count: int) -> TopN:
+    """ The count largest objects of ordered partials, ranked as one listing would have. """
+    ranks = TopN(count)
+    for partial in partials:
+        if (partial.objectranks is None or partial.topobjects < count):
+            raise ValueError("Partial listings kept only the {} largest objects".format(partial.topobjects))
+        # Each range's objects in the order it saw them, so ties go the same way.
+        for (weight, value) in partial.objectranks.InOrder():
+            ranks.Add(weight, value)
+    return ranks
+
+
+# The lister of a ListPartials worker process.
+worker_lister = None
+
+def StartWorker(lister):
+    global worker_lister
+    worker_lister = lister
+    lister.AfterFork()
+
+def ListRange(bucket: str, delim: str, match: str, recursive: bool, keyrange: tuple,
+              topobjects: int, now: float) -> Partial:
+    return worker_lister.ListPartial(bucket, match, delim, recursive, keyrange, topobjects, now)
+
+def ListPartials(lister, bucket: str, delim: str, match: str, recursive: bool, keyranges: list,
+                 processes: int, topobjects: int = 0) -> list:
+    """ lister's ListPartial for each of keyranges, listed by up to `processes` processes at
+        once, so matching and accounting use as many cores. The processes are forked,
+        with the lister as it is set up here (each making its own S3 clients). Ages are
+        counted from the same time in every range.
+    """
+    if (processes < 1):
+        raise ValueError("Given process count ({}) for ListPartials is invalid.".format(processes))
+    now = time.time()
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=StartWorker, initargs=(lister,)) as pool:
+        futures = [pool.submit(ListRange, bucket, delim, match, recursive, keyrange, topobjects, now)
+                   for keyrange in keyranges]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
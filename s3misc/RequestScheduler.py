@@ -0,0 +1,186 @@
+
+import sys
+import time
+import random
+import threading
+
+# Error codes S3 uses to say "slow down".
+throttle_codes = ('SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+                  'TooManyRequestsException', 'ServiceUnavailable', '503')
+
+# Error codes for failures that may well not happen again. Not RequestTimeTooSkewed:
+# the local clock is wrong, and it will still be wrong on the next try.
+transient_codes = ('InternalError', 'RequestTimeout', '500')
+
+def ErrorKind(error: BaseException):
+    """ 'throttle' if error is S3 asking us to slow down, 'transient' if it is worth
+        trying again, None if it isn't.
+    """
+    response = getattr(error, 'response', None)
+    if (isinstance(response, dict)):
+        code = response.get('Error', {}).get('Code')
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if (code in throttle_codes or status == 503):
+            return 'throttle'
+        if (code in transient_codes or (status is not None and status >= 500)):
+            return 'transient'
+        return None
+
+    # Connection trouble. If botocore (or urllib3, for RawListClient) isn't loaded, it
+    # can't be theirs.
+    exceptions = sys.modules.get('botocore.exceptions')
+    if (exceptions is not None and isinstance(error, exceptions.HTTPClientError)):
+        return 'transient'
+    exceptions = sys.modules.get('urllib3.exceptions')
+    if (exceptions is not None and isinstance(error, exceptions.HTTPError)):
+        return 'transient'
+    return None
+
+
+class RequestScheduler:
+    """ Paces and retries list_objects_v2 requests, for every listing sharing it.
+
+        Requests are let through by a token bucket refilled at the current rate, with
+        room for a second's worth of burst. The rate adapts the way TCP's window does
+        (AIMD): when S3 throttles a request (SlowDown, 503) it is cut by `_decrease`,
+        at most once per `_cooldown` seconds since one overload throttles every request
+        in flight; while requests succeed it climbs back by `_increase` of the maximum
+        per second. So a run settles just under what S3 will take, and backs off as
+        soon as other traffic on the bucket needs the room.
+
+        Throttled and transient failures (5xx, dropped connections) are retried after
+        a jittered exponential backoff: a random wait of up to `_backoffbase` * 2**n
+        seconds before retry n, capped at `_backoffcap`.
+    """
+
+    # Fraction of the rate left after a throttle.
+    _decrease = 0.5
+
+    # Fraction of the maximum rate regained per second without throttling.
+    _increase = 0.05
+
+    # Seconds after cutting the rate before it can be cut again.
+    _cooldown = 1.0
+
+    # The rate never drops below this, in requests per second.
+    _minrate = 1.0
+
+    # Backoff before the first retry, and the most to wait before any retry, in seconds.
+    _backoffbase = 0.1
+    _backoffcap = 20.0
+
+    def __init__(self, maxrate: float, retries: int = 10):
+        """ maxrate: requests per second to start at, and never go above. retries: times
+            to retry a request before giving up and raising its error.
+        """
+        if (maxrate <= 0):
+            raise ValueError("Given rate ({}) for RequestScheduler is invalid.".format(maxrate))
+        if (retries < 0):
+            raise ValueError("Given retry count ({}) for RequestScheduler is invalid.".format(retries))
+        self._maxrate = float(maxrate)
+        self._retries = retries
+        self._lock = threading.Lock()
+        self._rate = self._maxrate
+        self._tokens = self._maxrate
+        self._refilled = time.monotonic()
+        self._cut = 0.0
+        self._stats = None
+
+    def SetStats(self, stats):
+        """ Count retries and throttles in stats (a RunStats). None to stop. """
+        self._stats = stats
+        if (stats is not None):
+            stats.Scheduled(self)
+
+    def Rate(self) -> float:
+        """ Requests per second currently allowed. """
+        return self._rate
+
+    def Acquire(self):
+        """ Wait for this request's turn. """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._rate, self._tokens + (now - self._refilled) * self._rate)
+            self._refilled = now
+            # Take the token now, even if it isn't there yet: requests queue up in order.
+            self._tokens = self._tokens - 1
+            wait = -self._tokens / self._rate if (self._tokens < 0) else 0.0
+        if (wait > 0):
+            time.sleep(wait)
+
+    def Succeeded(self):
+        with self._lock:
+            if (self._rate < self._maxrate):
+                # Successes come `rate` a second, so this adds `_increase` of the
+                # maximum per second.
+                self._rate = min(self._maxrate, self._rate + self._increase * self._maxrate / self._rate)
+
+    def Throttled(self):
+        with self._lock:
+            now = time.monotonic()
+            if (now - self._cut >= self._cooldown):
+                self._rate = max(self._minrate, self._rate * self._decrease)
+                self._tokens = min(self._tokens, 0.0)
+                self._cut = now
+
+    def Backoff(self, retry: int) -> float:
+        """ Seconds to wait before retry number `retry` (from 0). """
+        return random.uniform(0, min(self._backoffcap, self._backoffbase * (1 << min(retry, 30))))
+
+    def Call(self, request, params: dict):
+        """ request(**params), paced, and retried if it fails in a way worth retrying. """
+        retry = 0
+        while (True):
+            self.Acquire()
+            try:
+                response = request(**params)
+            except Exception as e:
+                kind = ErrorKind(e)
+                if (kind is None or retry >= self._retries):
+                    raise
+                if (kind == 'throttle'):
+                    self.Throttled()
+                if (self._stats is not None):
+                    self._stats.Retried(kind == 'throttle')
+                time.sleep(self.Backoff(retry))
+                retry = retry + 1
+                continue
+            self.Succeeded()
+            return response
+
+
+class ScheduledClient:
+    """ An S3 client whose list_objects_v2 requests, including the ones its paginator
+        makes, go through a RequestScheduler. Everything else goes to the client.
+    """
+
+    def __init__(self, client, scheduler: RequestScheduler):
+        self._client = client
+        self._scheduler = scheduler
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+    def list_objects_v2(self, **params) -> dict:
+        return self._scheduler.Call(self._client.list_objects_v2, params)
+
+    def get_paginator(self, operation: str):
+        if (operation != 'list_objects_v2'):
+            return self._client.get_paginator(operation)
+        return ScheduledPaginator(self)
+
+
+class ScheduledPaginator:
+    """ list_objects_v2 pages, a request at a time, each one scheduled. """
+
+    def __init__(self, client: ScheduledClient):
+        self._client = client
+
+    def paginate(self, **params):
+        params = dict(params)
+        while (True):
+            response = self._client.list_objects_v2(**params)
+            yield response
+            if (not response.get('IsTruncated')):
+                return
+            params['ContinuationToken'] = response['NextContinuationToken']
@@ -0,0 +1,252 @@
+
+import sys
+import json
+import time
+import threading
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows.
+    resource = None
+
+# Request latency histogram buckets: bucket i counts requests that took less than
+# 2**i milliseconds (and at least 2**(i-1)); the last one counts everything slower.
+latency_buckets = 18
+
+# Where the time goes, in the order it's reported.
+stage_names = {
+    'list': 'waiting for S3',
+    'match': 'matching keys',
+    'print': 'accounting and formatting',
+    'output': 'writing output'
+}
+
+def PeakRSS():
+    """ Peak resident memory of this process so far, in bytes, or None if unknown. """
+    if (resource is None):
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if (sys.platform == 'darwin'):
+        return peak
+    # Everyone else reports kilobytes.
+    return peak * 1024
+
+class RunStats:
+    """ Counters and timers for a run, for --stats.
+
+        Listings on several threads (--jobs) share one RunStats; updates take a lock,
+        and happen once per page or per request, never per object. Stage times are
+        summed over threads, so with --jobs they can add up to more than the wall time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started = time.perf_counter()
+
+        self.listings = 0
+        self.pages = 0
+        self.keys_listed = 0
+        self.keys_matched = 0
+        self.requests = 0
+        self.attempts = 0
+        self.errors = 0
+        # Retries made by a RequestScheduler (botocore's are counted by attempts), and
+        # how many of them were for throttling.
+        self.retried = 0
+        self.throttles = 0
+        self.scheduler = None
+        self.latency = [0] * latency_buckets
+        self.stages = dict((stage, 0.0) for stage in stage_names)
+
+    def AddTime(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages[stage] + seconds
+        times = self.ThreadTimes()
+        times[stage] = times.get(stage, 0.0) + seconds
+
+    def ThreadTimes(self) -> dict:
+        """ Stage times added on this thread so far. """
+        times = getattr(self._local, 'times', None)
+        if (times is None):
+            times = dict()
+            self._local.times = times
+        return times
+
+    def TimePages(self, pages):
+        """ Pass pages through, counting them and timing the wait for each. """
+        pages = iter(pages)
+        while (True):
+            began = time.perf_counter()
+            page = next(pages, None)
+            waited = time.perf_counter() - began
+            self.AddTime('list', waited)
+            if (page is None):
+                return
+            with self._lock:
+                self.pages = self.pages + 1
+                self.keys_listed = self.keys_listed + len(page.get('Contents', ()))
+            yield page
+
+    def Matched(self, count: int, seconds: float):
+        """ count keys from a page matched, which took seconds. """
+        with self._lock:
+            self.keys_matched = self.keys_matched + count
+        self.AddTime('match', seconds)
+
+    def Listing(self, seconds: float, before: dict):
+        """ A listing on this thread is done after seconds. before is ThreadTimes() from
+            when it started: whatever time it spent outside of the other stages was
+            spent printing.
+        """
+        with self._lock:
+            self.listings = self.listings + 1
+        after = self.ThreadTimes()
+        accounted = 0.0
+        for stage in ('list', 'match', 'output'):
+            accounted = accounted + after.get(stage, 0.0) - before.get(stage, 0.0)
+        self.AddTime('print', max(0.0, seconds - accounted))
+
+    def Sent(self):
+        """ A request went out (a first attempt or a retry). """
+        with self._lock:
+            self.attempts = self.attempts + 1
+
+    def Request(self, seconds: float, failed: bool):
+        bucket = min(int(seconds * 1000).bit_length(), latency_buckets - 1)
+        with self._lock:
+            self.requests = self.requests + 1
+            self.latency[bucket] = self.latency[bucket] + 1
+            if (failed):
+                self.errors = self.errors + 1
+
+    def Scheduled(self, scheduler):
+        """ Requests go through scheduler (a RequestScheduler): report its rate. """
+        self.scheduler = scheduler
+
+    def Retried(self, throttled: bool):
+        """ A RequestScheduler is retrying a request that failed (or was throttled). """
+        with self._lock:
+            self.retried = self.retried + 1
+            if (throttled):
+                self.throttles = self.throttles + 1
+
+    def Instrument(self, client):
+        """ Time every ListObjectsV2 request client makes, and count its retries, through
+            botocore's event hooks.
+        """
+        def BeforeCall(context, **kwargs):
+            context['tagtag-started'] = time.perf_counter()
+
+        def BeforeSend(**kwargs):
+            self.Sent()
+
+        def AfterCall(context, **kwargs):
+            self.Request(time.perf_counter() - context['tagtag-started'], False)
+
+        def AfterCallError(context, **kwargs):
+            self.Request(time.perf_counter() - context['tagtag-started'], True)
+
+        events = client.meta.events
+        events.register('before-call.s3.ListObjectsV2', BeforeCall)
+        events.register('before-send.s3.ListObjectsV2', BeforeSend)
+        events.register('after-call.s3.ListObjectsV2', AfterCall)
+        events.register('after-call-error.s3.ListObjectsV2', AfterCallError)
+
+    def TimeStream(self, stream) -> 'TimedStream':
+        return TimedStream(stream, self)
+
+    def ToDict(self) -> dict:
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            return {
+                    'elapsed': elapsed,
+                    'listings': self.listings,
+                    'pages': self.pages,
+                    'keys_listed': self.keys_listed,
+                    'keys_matched': self.keys_matched,
+                    'keys_per_second': self.keys_listed / elapsed if (elapsed > 0) else None,
+                    'requests': max(0, self.requests - self.retried),
+                    'retries': max(0, self.attempts - self.requests) + self.retried,
+                    'throttles': self.throttles,
+                    'request_errors': self.errors,
+                    'request_rate': self.scheduler.Rate() if (self.scheduler is not None) else None,
+                    'latency_ms_histogram': dict(("<{}".format(1 << bucket), count)
+                                                 for (bucket, count) in enumerate(self.latency[:-1])
+                                                 if (count > 0)),
+                    'latency_ms_slower': self.latency[-1],
+                    'stage_seconds': dict(self.stages),
+                    'peak_rss': PeakRSS()
+                }
+
+    def Report(self, format: str, stream):
+        """ Write the statistics to a text stream, as 'text' or 'json'. """
+        stats = self.ToDict()
+        if (format == 'json'):
+            stream.write(json.dumps(stats) + "\n")
+            return
+
+        lines = ["Listings: {listings}; pages: {pages}; keys listed: {keys_listed}; "
+                 "keys matched: {keys_matched}".format(**stats)]
+        lines.append("Requests: {requests}; retries: {retries}; throttled: {throttles}; "
+                     "errors: {request_errors}".format(**stats))
+        if (stats['request_rate'] is not None):
+            lines.append("Request rate allowed at the end: {:.0f}/sec".format(stats['request_rate']))
+        if (stats['requests'] > 0):
+            lines.append("Request latency:")
+            for (bucket, count) in enumerate(self.latency):
+                if (count == 0):
+                    continue
+                if (bucket == latency_buckets - 1):
+                    label = ">= {} ms".format(1 << (bucket - 1))
+                else:
+                    label = "< {} ms".format(1 << bucket)
+                lines.append("    {:>10}: {}".format(label, count))
+        lines.append("Time ({:.3f}s elapsed):".format(stats['elapsed']))
+        for (stage, name) in stage_names.items():
+            lines.append("    {:>26}: {:.3f}s".format(name, stats['stage_seconds'][stage]))
+        if (stats['keys_per_second'] is not None):
+            lines.append("Throughput: {:.0f} keys/sec".format(stats['keys_per_second']))
+        if (stats['peak_rss'] is not None):
+            lines.append("Peak RSS: {:.1f} MB".format(stats['peak_rss'] / (1 << 20)))
+        stream.write("\n".join(lines) + "\n")
+
+
+class TimedStream:
+    """ A binary stream that counts the time spent writing to it as the 'output' stage. """
+
+    def __init__(self, stream, stats: RunStats):
+        self._stream = stream
+        self._stats = stats
+
+    def write(self, data):
+        began = time.perf_counter()
+        written = self._stream.write(data)
+        self._stats.AddTime('output', time.perf_counter() - began)
+        return written
+
+    def flush(self):
+        began = time.perf_counter()
+        self._stream.flush()
+        self._stats.AddTime('output', time.perf_counter() - began)
+
+    def tell(self) -> int:
+        return self._stream.tell()
+
+
+def WriteProfile(profiler, path: str):
+    """ Save what a cProfile.Profile collected: raw, for pstats or a viewer, if path
+        ends in .prof or .pstats; otherwise as a text report of the most expensive
+        functions.
+    """
+    if (path.endswith('.prof') or path.endswith('.pstats')):
+        profiler.dump_stats(path)
+        return
+
+    import pstats
+
+    with open(path, 'w') as report:
+        profile = pstats.Stats(profiler, stream=report)
+        profile.sort_stats('cumulative').print_stats(60)
+        profile.sort_stats('tottime').print_stats(30)
@@ -0,0 +1,129 @@
+
+import sys
+import time
+import sqlite3
+import threading
+import datetime
+
+# Rows to hand back per page when listing from a snapshot, like list_objects_v2.
+page_size = 1000
+
+def PrefixEnd(prefix: str):
+    """ The smallest string greater than every string starting with prefix, or None if
+        there isn't one (prefix is '').
+    """
+    prefix = prefix.rstrip('\U0010ffff')
+    if (len(prefix) == 0):
+        return None
+    return prefix[0:-1] + chr(ord(prefix[-1]) + 1)
+
+class Snapshot:
+    """ A local copy of bucket listings, in SQLite.
+
+        Objects are kept ordered by (bucket, key), so a prefix is one range scan.
+        SQLite compares text as UTF-8 bytes, which is the order S3 lists keys in.
+        Modification times are stored as whole seconds since the epoch; S3 doesn't
+        list anything finer.
+
+        Several listings can use one snapshot at once, from different threads: they
+        share the connection, one statement at a time.
+    """
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS objects (
+                bucket TEXT NOT NULL,
+                key TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                storage_class TEXT,
+                etag TEXT,
+                PRIMARY KEY (bucket, key)
+            ) WITHOUT ROWID""")
+        # Which prefixes were captured, and when.
+        self._db.execute("""CREATE TABLE IF NOT EXISTS listings (
+                bucket TEXT NOT NULL,
+                prefix TEXT NOT NULL,
+                listed_at INTEGER NOT NULL,
+                PRIMARY KEY (bucket, prefix)
+            )""")
+        self._db.commit()
+
+    def RangeClause(self, prefix: str):
+        """ SQL condition and parameters for the keys under prefix. """
+        end = PrefixEnd(prefix)
+        if (end is None):
+            return ("bucket = ?", [])
+        return ("bucket = ? AND key >= ? AND key < ?", [prefix, end])
+
+    def SavePages(self, bucket: str, prefix: str, pages):
+        """ Pass list_objects_v2 pages through, saving their objects on the way. Replaces
+            whatever the snapshot had under prefix. The listing is only recorded as
+            complete once the last page has gone by.
+        """
+        (where, params) = self.RangeClause(prefix)
+        with self._lock:
+            self._db.execute("DELETE FROM objects WHERE " + where, [bucket] + params)
+
+        pagecount = 0
+        for page in pages:
+            rows = [(bucket, item['Key'], item['Size'], int(item['LastModified'].timestamp()),
+                     item.get('StorageClass'), item.get('ETag'))
+                    for item in page.get('Contents', ())]
+            with self._lock:
+                self._db.executemany(
+                        "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+                # Don't let the transaction grow without bound.
+                pagecount = pagecount + 1
+                if (pagecount % 100 == 0):
+                    self._db.commit()
+
+            yield page
+
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?)",
+                             (bucket, prefix, int(time.time())))
+            self._db.commit()
+
+    def Covers(self, bucket: str, prefix: str) -> bool:
+        """ Was a listing of bucket saved that includes everything under prefix? """
+        with self._lock:
+            saved = self._db.execute(
+                    "SELECT prefix FROM listings WHERE bucket = ?", (bucket,)).fetchall()
+        for (savedprefix,) in saved:
+            if (prefix.startswith(savedprefix)):
+                return True
+        return False
+
+    def ListPages(self, bucket: str, prefix: str):
+        """ Pages of objects under prefix, shaped like list_objects_v2 pages. """
+        if (not self.Covers(bucket, prefix)):
+            print("Snapshot has no complete listing of {}:{}".format(bucket, prefix), file=sys.stderr)
+
+        (where, params) = self.RangeClause(prefix)
+        with self._lock:
+            cursor = self._db.execute(
+                    "SELECT key, size, mtime, storage_class, etag FROM objects WHERE " + where +
+                    " ORDER BY key", [bucket] + params)
+
+        utc = datetime.timezone.utc
+        while (True):
+            with self._lock:
+                rows = cursor.fetchmany(page_size)
+            if (len(rows) == 0):
+                break
+            yield {'Contents': [
+                    {
+                        'Key': key,
+                        'Size': size,
+                        'LastModified': datetime.datetime.fromtimestamp(mtime, utc),
+                        'StorageClass': storageclass,
+                        'ETag': etag
+                    } for (key, size, mtime, storageclass, etag) in rows]}
+
+    def Close(self):
+        self._db.close()
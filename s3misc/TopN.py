@@ -0,0 +1,36 @@
+
+import heapq
+
+class TopN:
+    """ The `count` heaviest values seen so far, in O(count) memory.
+
+        A min-heap of (weight, -sequence, value): its root is the lightest value kept,
+        so a new value only has to beat that one to get in, and then replaces it.
+        Among equal weights the first seen wins, and is ranked first.
+    """
+
+    def __init__(self, count: int):
+        if (count < 1):
+            raise ValueError("Given count ({}) for TopN is invalid.".format(count))
+        self._count = count
+        self._heap = []
+        self._sequence = 0
+
+    def Add(self, weight: int, value):
+        heap = self._heap
+        if (len(heap) < self._count):
+            self._sequence = self._sequence + 1
+            heapq.heappush(heap, (weight, -self._sequence, value))
+        elif (weight > heap[0][0]):
+            self._sequence = self._sequence + 1
+            heapq.heapreplace(heap, (weight, -self._sequence, value))
+
+    def InOrder(self) -> list:
+        """ (weight, value) pairs, in the order they were added: to Add to another TopN
+            as if it had seen them itself.
+        """
+        return [(weight, value) for (weight, sequence, value) in sorted(self._heap, key=lambda entry: -entry[1])]
+
+    def Ranked(self) -> list:
+        """ (weight, value) pairs, heaviest first. """
+        return [(weight, value) for (weight, sequence, value) in sorted(self._heap, reverse=True)]
@@ -0,0 +1,502 @@
+
+import os
+import sys
+import json
+import stat
+import time
+import datetime
+import threading
+import socketserver
+from urllib.parse import urlsplit, parse_qs, unquote_plus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from s3misc.UsageTree import UsageNode
+from s3misc.GlobMatcher import LiteralPrefix
+
+class UsageIndex:
+    """ A bucket's usage tree (see BucketLister.Usage), kept in memory to answer
+        questions about it, and kept up to date a directory at a time.
+
+        When an object changes (Changed), the directory it is in is marked, and the
+        next Refresh lists just that: its own objects, and which subdirectories it
+        has, with one delimited listing. A subdirectory that is new is listed whole,
+        as is a directory at maxdepth, whose totals include everything under it.
+        Each refreshed directory's change in totals is rolled up its ancestors the
+        way DirectoryStack would have. RefreshAll marks everything, so the whole tree
+        is listed again a top-level directory at a time rather than all at once.
+
+        Latest modification times roll up as the maximum, so after deletions an
+        ancestor's can be later than what is left, until it is refreshed itself.
+
+        One thread refreshes (the lister is its own); any number can query.
+    """
+
+    def __init__(self, lister, bucket: str, prefix: str = '', delim: str = '/', maxdepth: int = -1):
+        """ lister: a BucketLister for the listings. Everything under prefix (which
+            has no wildcards) is indexed. maxdepth: keep directories at most this
+            deep (the bucket is 0), -1 for all of them.
+        """
+        if (LiteralPrefix(prefix) != prefix):
+            raise ValueError("Given prefix ({}) for UsageIndex is invalid.".format(prefix))
+        self._lister = lister
+        self._bucket = bucket
+        self._prefix = prefix
+        self._delim = delim
+        self._maxdepth = maxdepth
+        self._lock = threading.Lock()
+        self._root = None
+        self._built = None
+        self._refreshed = None
+
+        # Directories to list again: path -> 'directory' (its own objects) or 'subtree'
+        # (everything under it). And whether to list everything again.
+        self._dirty = dict()
+        self._rebuild = False
+
+    def Build(self):
+        """ List everything, and swap the new tree in. """
+        with self._lock:
+            # Changes from here on are listed again after, in case the listing missed them.
+            self._dirty = dict()
+            self._rebuild = False
+        began = time.time()
+        root = self._lister.Usage(self._bucket, self._prefix, self._delim, self._maxdepth)
+        with self._lock:
+            self._root = root
+            self._built = began
+            self._refreshed = began
+
+    def Built(self) -> float:
+        """ When the last whole listing started (time.time()), or None. """
+        return self._built
+
+    def Query(self, path: str, depth: int = 0) -> dict:
+        """ Totals for directory path (with or without the delimiter at the end; '' for
+            the bucket) as UsageNode.ToDict gives them, with depth levels of children,
+            or None if there is no such directory.
+        """
+        if (len(path) > 0 and not path.endswith(self._delim)):
+            path = path + self._delim
+        with self._lock:
+            if (self._root is None):
+                return None
+            node = self._root.Find(path)
+            if (node is None):
+                return None
+            result = node.ToDict(depth)
+            result['total_objects'] = node.TotalObjects()
+            result['total_size'] = node.TotalSize()
+        return result
+
+    def Status(self) -> dict:
+        with self._lock:
+            return {
+                    'bucket': self._bucket,
+                    'prefix': self._prefix,
+                    'built': TimeText(self._built),
+                    'refreshed': TimeText(self._refreshed),
+                    'pending': len(self._dirty) + (1 if (self._rebuild) else 0)
+                }
+
+    def Changed(self, key: str):
+        """ Object key was added, changed or removed: mark where it is to be listed again. """
+        if (not key.startswith(self._prefix)):
+            return
+        delim = self._delim
+        directory = key[0:key.rfind(delim) + 1]
+        with self._lock:
+            if (self._root is None):
+                return
+            node = self.Trail(directory)[-1]
+            if (self._maxdepth >= 0 and node.path.count(delim) >= self._maxdepth):
+                self.Mark(node.path, 'subtree')
+            elif (node.path == directory):
+                self.Mark(directory, 'directory')
+            else:
+                # A directory that's new: from the first level that isn't there.
+                idx = directory.find(delim, len(node.path)) + len(delim)
+                self.Mark(directory[0:idx], 'subtree')
+
+    def RefreshAll(self):
+        """ Mark everything, to be listed again by Refresh a top-level directory at a
+            time.
+        """
+        with self._lock:
+            if (self._root is None):
+                self._rebuild = True
+                return
+            node = self.Trail(self._prefix)[-1]
+            self.Mark(node.path, 'directory')
+            for child in node.children:
+                self.Mark(child.path, 'subtree')
+
+    def Mark(self, path: str, kind: str):
+        """ With the lock held. Directories outside the prefix hold other objects too:
+            those take listing everything again.
+        """
+        if (not path.startswith(self._prefix)):
+            self._rebuild = True
+        elif (kind == 'subtree' or path not in self._dirty):
+            self._dirty[path] = kind
+
+    def Refresh(self):
+        """ List what has been marked since the last refresh again. """
+        with self._lock:
+            dirty = self._dirty
+            rebuild = self._rebuild
+            self._dirty = dict()
+        if (rebuild):
+            self.Build()
+            return
+
+        # Nothing inside a subtree being listed needs listing itself.
+        work = []
+        subtree = None
+        for path in sorted(dirty):
+            if (subtree is not None and path.startswith(subtree)):
+                continue
+            if (dirty[path] == 'subtree'):
+                subtree = path
+            work.append((path, dirty[path]))
+
+        # Deepest first, so a directory's latest is worked out from refreshed children.
+        work.reverse()
+        done = 0
+        try:
+            for (path, kind) in work:
+                if (kind == 'subtree'):
+                    self.RefreshSubtree(path)
+                else:
+                    self.RefreshDirectory(path)
+                done = done + 1
+        except BaseException:
+            # Try the rest again next time.
+            with self._lock:
+                for (path, kind) in work[done:]:
+                    self.Mark(path, kind)
+            raise
+
+        with self._lock:
+            self._refreshed = time.time()
+
+    def RefreshSubtree(self, path: str):
+        """ List everything under directory path, and put it in the tree. """
+        root = self._lister.Usage(self._bucket, path, self._delim, self._maxdepth)
+        node = root.Find(path)
+        with self._lock:
+            self.Replace(path, node)
+
+    def RefreshDirectory(self, path: str):
+        """ List the objects directly in directory path, and which subdirectories it has.
+            Subdirectories that are gone are removed; new ones are listed whole.
+        """
+        lister = self._lister
+        objects = 0
+        size = 0
+        latest = None
+        subdirs = set()
+        lister.SetListing(self._bucket, self._delim, path)
+        lister.SetDepth(1)
+        try:
+            for item in lister.ParseBucket(self._bucket):
+                if ('CommonPrefix' in item):
+                    subdirs.add(item['Key'])
+                    continue
+                objects = objects + 1
+                size = size + item['Size']
+                if (latest is None or item['LastModified'] > latest):
+                    latest = item['LastModified']
+        finally:
+            lister.SetDepth(-1)
+
+        with self._lock:
+            trail = self.Trail(path)
+            node = trail[-1]
+            if (node.path != path):
+                # Gone since it was marked.
+                self.Mark(path, 'subtree')
+                return
+            for child in node.children:
+                if (child.path not in subdirs):
+                    self.Replace(child.path, None)
+            added = subdirs.difference(child.path for child in node.children)
+
+            dobjects = objects - node.objects
+            dsize = size - node.size
+            node.objects = objects
+            node.size = size
+            for child in node.children:
+                if (child.latest is not None and (latest is None or child.latest > latest)):
+                    latest = child.latest
+            node.latest = latest
+            for parent in trail[0:-1]:
+                parent.subobjects = parent.subobjects + dobjects
+                parent.subsize = parent.subsize + dsize
+                if (latest is not None and (parent.latest is None or latest > parent.latest)):
+                    parent.latest = latest
+            self.Prune(trail)
+
+        for subdir in sorted(added):
+            self.RefreshSubtree(subdir)
+
+    def Trail(self, path: str) -> list:
+        """ With the lock held. The nodes from the root down to path, as far as there are
+            any.
+        """
+        node = self._root
+        trail = [node]
+        while (node.path != path):
+            node = node.Child(path)
+            if (node is None):
+                break
+            trail.append(node)
+        return trail
+
+    def Replace(self, path: str, node: UsageNode):
+        """ With the lock held. Put node in the tree as directory path, in place of what
+            was there (None to remove it), and roll the difference up its ancestors.
+        """
+        delim = self._delim
+        trail = self.Trail(path)
+        if (trail[-1].path == path):
+            trail.pop()
+        parent = trail[-1]
+        if (node is None and parent.Child(path) is None):
+            return
+
+        # Directories between that aren't in the tree yet.
+        idx = len(parent.path)
+        while (True):
+            idx = path.find(delim, idx) + len(delim)
+            if (idx >= len(path)):
+                break
+            between = UsageNode(path[0:idx])
+            parent.ReplaceChild(between.path, between)
+            parent = between
+            trail.append(between)
+
+        old = parent.ReplaceChild(path, node)
+        dobjects = 0
+        dsize = 0
+        latest = None
+        if (node is not None):
+            dobjects = node.TotalObjects()
+            dsize = node.TotalSize()
+            latest = node.latest
+        if (old is not None):
+            dobjects = dobjects - old.TotalObjects()
+            dsize = dsize - old.TotalSize()
+        for parent in trail:
+            parent.subobjects = parent.subobjects + dobjects
+            parent.subsize = parent.subsize + dsize
+            if (latest is not None and (parent.latest is None or latest > parent.latest)):
+                parent.latest = latest
+        self.Prune(trail)
+
+    def Prune(self, trail: list):
+        """ With the lock held. Remove the directories at the end of trail (from Trail)
+            that nothing is left in: S3 has no directories, only keys with delimiters.
+        """
+        idx = len(trail) - 1
+        while (idx > 0 and trail[idx].TotalObjects() == 0):
+            trail[idx - 1].ReplaceChild(trail[idx].path, None)
+            idx = idx - 1
+
+    def RunRefresh(self, interval: float, refreshall: float, stop: threading.Event):
+        """ Refresh every interval seconds, and refresh everything every refreshall
+            seconds (0 for never), until stop is set. Failures are reported on stderr,
+            and tried again.
+        """
+        lastall = time.monotonic()
+        while (not stop.wait(interval)):
+            try:
+                if (refreshall > 0 and time.monotonic() - lastall >= refreshall):
+                    self.RefreshAll()
+                    lastall = time.monotonic()
+                self.Refresh()
+            except Exception as e:
+                print("Refreshing {} failed: {}".format(self._bucket, e), file=sys.stderr)
+
+
+def TimeText(when: float) -> str:
+    if (when is None):
+        return None
+    return datetime.datetime.fromtimestamp(when, datetime.timezone.utc).isoformat()
+
+def EventKeys(line: str, bucket: str) -> list:
+    """ The keys an object-change event is about. An event is a line that is either a
+        key, or JSON: an S3 event notification (for bucket), or an object with a "key".
+    """
+    line = line.rstrip('\r\n')
+    if (not line.lstrip().startswith('{')):
+        return [line] if (len(line) > 0) else []
+
+    event = json.loads(line)
+    if ('Records' in event):
+        keys = []
+        for record in event['Records']:
+            s3 = record.get('s3', {})
+            if (s3.get('bucket', {}).get('name') == bucket):
+                # Keys in notifications are URL-encoded.
+                keys.append(unquote_plus(s3['object']['key']))
+        return keys
+    key = event.get('key', event.get('Key'))
+    return [key] if (key is not None) else []
+
+
+class EventFeed:
+    """ Object-change events (see EventKeys), a line each, read as they are written to
+        a file, or to a named pipe, and handed to a UsageIndex.
+    """
+
+    # Seconds to wait at the end of the file before looking for more.
+    _poll = 1.0
+
+    def __init__(self, path: str, index: UsageIndex, bucket: str):
+        self._path = path
+        self._index = index
+        self._bucket = bucket
+        self._file = None
+        if (os.path.isfile(path)):
+            # Only what happens from now on: the listing will see what came before.
+            self._file = open(path, 'r', encoding='utf-8')
+            self._file.seek(0, os.SEEK_END)
+
+    def Run(self, stop: threading.Event):
+        if (self._file is None):
+            # A pipe: opening it waits for a writer.
+            self._file = open(self._path, 'r', encoding='utf-8')
+        partial = ''
+        with self._file:
+            while (not stop.is_set()):
+                line = self._file.readline()
+                if (len(line) == 0):
+                    stop.wait(self._poll)
+                    continue
+                partial = partial + line
+                if (not partial.endswith('\n')):
+                    # The rest of it hasn't been written yet.
+                    continue
+                self.Feed(partial)
+                partial = ''
+
+    def Feed(self, line: str) -> int:
+        """ Hand the keys in an event to the index. Returns how many there were. """
+        try:
+            keys = EventKeys(line, self._bucket)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            print("Ignoring event that can't be read: {}".format(line.strip()), file=sys.stderr)
+            return 0
+        for key in keys:
+            self._index.Changed(key)
+        return len(keys)
+
+
+class UsageRequestHandler(BaseHTTPRequestHandler):
+    """ The usage server's HTTP interface, all JSON:
+
+        GET /usage?path=P&depth=N   totals for directory P ('' or none for the bucket),
+                                    with N levels of subdirectories (default 0)
+        GET /status                 when the tree was listed and refreshed
+        POST /changed               object-change events (see EventKeys), a line each
+    """
+
+    server_version = 'tagtag-usage'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        index = self.server.index
+        if (url.path == '/status'):
+            self.Reply(200, index.Status())
+        elif (url.path == '/usage'):
+            try:
+                depth = int(query.get('depth', ['0'])[0])
+            except ValueError:
+                self.Reply(400, {'error': 'depth is not a number'})
+                return
+            path = query.get('path', [''])[0]
+            result = index.Query(path, depth)
+            if (result is None):
+                self.Reply(404, {'error': 'no such directory', 'path': path})
+            else:
+                self.Reply(200, result)
+        else:
+            self.Reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if (urlsplit(self.path).path != '/changed'):
+            self.Reply(404, {'error': 'not found'})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        feed = self.server.feed
+        changed = 0
+        for line in body.splitlines():
+            changed = changed + feed.Feed(line)
+        self.Reply(202, {'changed': changed})
+
+    def Reply(self, status: int, body: dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Queries come often; nobody wants a line for each.
+        pass
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def MakeServer(address: str, index: UsageIndex, feed: EventFeed):
+    """ An HTTP server for index on address: a Unix socket if it has a '/' in it,
+        otherwise [HOST]:PORT (HOST defaults to 127.0.0.1).
+    """
+    if ('/' in address):
+        if (os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode)):
+            # Left by a server that's gone.
+            os.remove(address)
+        server = UnixHTTPServer(address, UsageRequestHandler)
+    else:
+        (host, sep, port) = address.rpartition(':')
+        if (not port.isdigit()):
+            raise ValueError("Given address ({}) for MakeServer is invalid.".format(address))
+        server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), UsageRequestHandler)
+    server.index = index
+    server.feed = feed
+    return server
+
+def Serve(lister, bucket: str, prefix: str, delim: str, address: str, interval: float = 10.0,
+          refreshall: float = 0.0, events: str = None, maxdepth: int = -1):
+    """ List bucket (under prefix) into a UsageIndex, and answer queries about it on
+        address (see MakeServer) until interrupted. Marked directories are refreshed
+        every interval seconds, and everything every refreshall seconds (0 for never).
+        events: a file or named pipe to read object-change events from.
+    """
+    index = UsageIndex(lister, bucket, prefix, delim, maxdepth)
+    feed = EventFeed(events, index, bucket) if (events) else EventFeed(os.devnull, index, bucket)
+    server = MakeServer(address, index, feed)
+
+    print("Listing {}...".format(bucket), file=sys.stderr)
+    index.Build()
+
+    stop = threading.Event()
+    threading.Thread(target=index.RunRefresh, args=(interval, refreshall, stop), daemon=True).start()
+    if (events):
+        threading.Thread(target=feed.Run, args=(stop,), daemon=True).start()
+
+    print("Serving usage of {} on {}".format(bucket, address), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        if ('/' in address):
+            os.remove(address)
@@ -0,0 +1,143 @@
+
+from s3misc.DirectoryStack import DirStats
+
+class UsageNode(DirStats):
+    """ A directory's totals (see DirStats), with its subdirectories' nodes, in key
+        order. The root is the bucket (path '').
+    """
+    __slots__ = ('children',)
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        # Most directories have no subdirectories: they share the empty tuple.
+        self.children = ()
+
+    @staticmethod
+    def FromStats(stats: DirStats) -> 'UsageNode':
+        node = UsageNode(stats.path)
+        node.objects = stats.objects
+        node.size = stats.size
+        node.subobjects = stats.subobjects
+        node.subsize = stats.subsize
+        node.latest = stats.latest
+        node.histogram = stats.histogram
+        return node
+
+    def TotalObjects(self) -> int:
+        """ Objects in this directory and everything under it. """
+        return self.objects + self.subobjects
+
+    def TotalSize(self) -> int:
+        """ Bytes in this directory and everything under it. """
+        return self.size + self.subsize
+
+    def Find(self, path: str):
+        """ The node for directory path (ending with the delimiter) under this one, or
+            None if it isn't in the tree.
+        """
+        node = self
+        while (node.path != path):
+            node = node.Child(path)
+            if (node is None):
+                return None
+        return node
+
+    def Child(self, path: str):
+        """ The child that path is in (or is), or None. """
+        idx = self.ChildIndex(path)
+        if (idx > 0 and path.startswith(self.children[idx - 1].path)):
+            return self.children[idx - 1]
+        return None
+
+    def ChildIndex(self, path: str) -> int:
+        """ Where path goes among the children: after every child not after it.
+            Children are in key order, and anything under a child sorts after it and
+            before its next sibling, so the child path is in (if any) is just before.
+        """
+        children = self.children
+        low = 0
+        high = len(children)
+        while (low < high):
+            mid = (low + high) // 2
+            if (children[mid].path <= path):
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def ReplaceChild(self, path: str, node: 'UsageNode') -> 'UsageNode':
+        """ Make node the child for directory path, in place of the one there (if any);
+            None just removes it. Returns the old one. Totals are left alone.
+        """
+        children = list(self.children)
+        idx = self.ChildIndex(path)
+        old = None
+        if (idx > 0 and children[idx - 1].path == path):
+            old = children[idx - 1]
+            del children[idx - 1]
+            idx = idx - 1
+        if (node is not None):
+            children.insert(idx, node)
+        self.children = children if (len(children) > 0) else ()
+        return old
+
+    def Walk(self):
+        """ This node and every node under it, parents before their children. """
+        yield self
+        for child in self.children:
+            yield from child.Walk()
+
+    def ToDict(self, depth: int = -1) -> dict:
+        """ The tree as plain dicts and lists, say for json.dumps. depth: levels of
+            children to include, -1 for all of them.
+        """
+        result = {
+                'path': self.path,
+                'objects': self.objects,
+                'size': self.size,
+                'subdir_objects': self.subobjects,
+                'subdir_size': self.subsize,
+                'last_modified': self.latest.isoformat() if (self.latest) else None
+            }
+        if (depth != 0):
+            result['children'] = [child.ToDict(depth - 1) for child in self.children]
+        return result
+
+
+class UsageTreeBuilder:
+    """ Builds a tree of UsageNodes out of the directories a DirectoryStack finishes.
+
+        Directories are finished deepest first, each right after everything under it,
+        so a directory's children are the nodes most recently finished that are under
+        it. Those are waiting at the end of a list, which never holds more than the
+        children of the directories on the current path.
+    """
+
+    def __init__(self, delim: str, maxdepth: int = -1):
+        """ maxdepth: keep nodes for directories at most this deep (the bucket is 0),
+            -1 for all of them. Deeper directories still count in their parents' totals.
+        """
+        self._delim = delim
+        self._maxdepth = maxdepth
+        self._pending = []
+        self.root = None
+
+    def Finished(self, stats: DirStats):
+        """ For DirectoryStack: stats' directory is done. """
+        path = stats.path
+        pending = self._pending
+        first = len(pending)
+        while (first > 0 and pending[first - 1].path.startswith(path) and
+               pending[first - 1].path != path):
+            first = first - 1
+
+        if (self._maxdepth >= 0 and path.count(self._delim) > self._maxdepth):
+            return
+        node = UsageNode.FromStats(stats)
+        if (first < len(pending)):
+            node.children = pending[first:]
+            del pending[first:]
+        if (path == ''):
+            self.root = node
+        else:
+            pending.append(node)
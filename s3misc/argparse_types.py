@@ -1,3 +1,5 @@
+import re
+from datetime import datetime, timedelta, timezone
 from argparse import ArgumentTypeError
 
 # Custom type for argparse. I want just a single character.
@@ -5,3 +7,30 @@ def ArgParseChar(value):
     if (len(value) != 1):
         raise ArgumentTypeError("The given value is not exactly one character")
     return value
+
+# Size units, base 2 like bucket_units. A trailing B is allowed, and means nothing.
+size_units = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40, 'P': 1 << 50}
+
+# Custom type for argparse: bytes, or a number with a unit (10M, 1.5GB).
+def ArgParseSize(value):
+    parsed = re.fullmatch(r'([0-9]+(?:\.[0-9]*)?)\s*([KMGTP]?)B?', value.strip(), re.IGNORECASE)
+    if (parsed is None):
+        raise ArgumentTypeError("The given value is not a size, such as 1024, 10M or 1.5GB")
+    return int(float(parsed.group(1)) * size_units[parsed.group(2).upper()])
+
+# Age units: seconds, minutes, hours, days, weeks.
+age_units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+# Custom type for argparse: an age (30d, 12h) as a timedelta, or a date or time
+# (2024-01-31, 2024-01-31T12:00) as an aware datetime, UTC unless it says otherwise.
+def ArgParseAge(value):
+    parsed = re.fullmatch(r'([0-9]+(?:\.[0-9]*)?)([smhdw])', value.strip())
+    if (parsed is not None):
+        return timedelta(seconds=float(parsed.group(1)) * age_units[parsed.group(2)])
+    try:
+        when = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ArgumentTypeError("The given value is not an age (such as 30d or 12h) or a date (such as 2024-01-31)")
+    if (when.tzinfo is None):
+        when = when.replace(tzinfo=timezone.utc)
+    return when
@@ -0,0 +1,28 @@
+
+from typing import List
+
+bucket_units = ['B', 'KB', 'MB', 'GB', 'TB', 'PB']
+
+def foursigfloat(num: int, units: List[str]):
+    """ Convert a number to four significant digits, given base-2 set of units.
+        Past 1000 of the last unit (PB), more digits are shown instead.
+    """
+    # Presumably three ifs are faster than one logarithm
+    if (num >= (1 << 20)):
+        if (num >= (1 << 30)):
+            if (num >= (1 << 40)):
+                if (num >= (1 << 50)):
+                    # PB, and nothing bigger: keep the whole number, however long.
+                    numstring = '{:1.3f}'.format(num / (1 << 50))
+                    return (numstring[0:max(numstring.find('.'), 5)] + " " + units[5])
+                else:
+                    return (('{:1.3f}'.format(num / (1 << 40)))[0:5] + " " + units[4])
+            else: # < 1TB
+                return (('{:1.3f}'.format(num / (1 << 30)))[0:5] + " " + units[3])
+        else: # < 1GB
+            return (('{:1.3f}'.format(num / (1 << 20)))[0:5] + " " + units[2])
+    else: # < 1MB
+        if (num >= (1 << 10)):
+            return (('{:1.3f}'.format(num / (1 << 10)))[0:5] + " " + units[1])
+        else:
+            return ((str(num))[0:5] + " " + units[0])